@@ -1,11 +1,9 @@
 import click
-import ee
 import geopandas as gpd
 import pandas as pd
 import os
-from google.cloud import storage
 
-from config import EE_SERVICE_ACCOUNT, EE_CREDENTIALS
+from mtm_utils.clients import get_bucket, get_object_index, get_storage_client
 from mtm_utils.variables import GCLOUD_BUCKET, GCLOUD_CAMRA_CSV, GCLOUD_CAMRA_GJS, GCLOUD_CAMRA_ARM, TEMP_DIR
 
 """
@@ -21,10 +19,7 @@ If you encounter issues please contact christian@skytruth.org.
 """
 
 # The ID of your GCS bucket
-storage_client = storage.Client()
 bucket_name = GCLOUD_BUCKET
-storage_bucket = storage_client.bucket(bucket_name)
-credentials = ee.ServiceAccountCredentials(EE_SERVICE_ACCOUNT, EE_CREDENTIALS)
 
 YEARS = list(range(1984, 2020))
 BANDS = ['B', 'EVI', 'G', 'MSAVI', 'NBR2', 'NBR', 'NDMI', 'NDVI', 'NIR', 'R', 'SAVI', 'SWIR1', 'SWIR2']
@@ -40,6 +35,8 @@ def tmp_download(file_type: str):
     Download the data to a temp dir for processing, delete after final upload
     """
     os.makedirs(TEMP_DIR, exist_ok=True)
+    storage_client = get_storage_client()
+    storage_bucket = get_bucket(bucket_name)
 
     if file_type == "csv":
         for f in storage_client.list_blobs(bucket_name, prefix=GCLOUD_CAMRA_CSV):
@@ -238,10 +235,8 @@ def arm_processing():
         id_arm = arm_recovery_transposed.assign(sid=site_id)
         xdf = x[['sum', 'sum_rnd', 'km2_rnd', 'ID','US_L4CODE']]
 
-        ww = pd.merge(xdf, id_arm, left_on='ID', right_on='sid', how='left').drop('sid', axis=1)
         # x2 = x2.append(pd.DataFrame(id_arm))
         x2 = pd.concat([x2, pd.DataFrame(id_arm)], ignore_index=True)
-        df = pd.concat([xdf.reset_index(drop=True), arm_recovery_transposed.reset_index(drop=True)], axis=1) # (drop=Tru‌​e)], axis=1)
         fin = pd.merge(xdf, x2, left_on='ID', right_on='sid', how='left').drop('sid', axis=1)
 
     
@@ -258,7 +253,7 @@ def arm_upload(to_gcs: bool):
     infile_name = "2025-03-07_lastMined_srHarmonizedMed_rawARM.geojson"
     infile = TEMP_DIR + infile_name
     bucket_name = GCLOUD_BUCKET
-    storage_bucket = storage.Client("skytruth-tech").bucket(bucket_name)
+    storage_bucket = get_bucket(bucket_name, project="skytruth-tech")
     
     if to_gcs == False:
         print(
@@ -266,7 +261,7 @@ def arm_upload(to_gcs: bool):
         )
     else:
         out_blob = storage_bucket.blob(GCLOUD_CAMRA_ARM + infile_name)
-        if out_blob.exists():
+        if get_object_index(bucket_name, project="skytruth-tech").exists(GCLOUD_CAMRA_ARM + infile_name):
             print("  > OUTFILE ALREADY EXISTS. PASSING.")
             pass
         else:
@@ -1,9 +1,10 @@
 import ee
-import time
 from ee import batch
-from google.cloud import storage
+from functools import partial
 
 from config import EE_SERVICE_ACCOUNT, EE_CREDENTIALS
+from mtm_utils.clients import get_bucket, get_object_index, get_storage_client
+from mtm_utils.ee_tasks import ExportJob, exit_if_failed, run_exports
 from mtm_utils.variables import (
     GCLOUD_BUCKET,
     GCLOUD_EE_ANNUAL_MINES_TIFF,
@@ -18,21 +19,22 @@ ee.Initialize(credentials)
 INITIAL SET-UP
 """
 # The ID of your GCS bucket
-storage_client = storage.Client()
 bucket_name = GCLOUD_BUCKET
-storage_bucket = storage_client.bucket(bucket_name)
+storage_bucket = get_bucket(bucket_name)
+object_index = get_object_index(bucket_name)
 print(f"STORAGE BUCKET:{storage_bucket}\n\n")
 ########################################################################################################################
 ########################################################################################################################
 mine_image_names = []
 
 # Get all the images produced from greenestPixelComp.py
-for img in storage_client.list_blobs(bucket_name, prefix=GCLOUD_EE_ANNUAL_MINES_TIFF):
+for img in get_storage_client().list_blobs(bucket_name, prefix=GCLOUD_EE_ANNUAL_MINES_TIFF):
     img_name = img.name
     mine_image_names.append(img_name)
 
 mine_image_names.pop(0)
 final_img_index = len(mine_image_names)
+export_jobs = []
 
 for i in mine_image_names:
     year = (i.split("/")[-1]).split("_")[0]
@@ -40,7 +42,6 @@ for i in mine_image_names:
     annual_export_desc = export_desc
     outfile_vector_fin_name = GCLOUD_EE_ANNUAL_MINES_GEOJSON + annual_export_desc
     outfile_vector_test_name = outfile_vector_fin_name + ".geojson"
-    out_blob_vector_test = storage_bucket.blob(outfile_vector_test_name)
 
     image_url = f"gs://mountaintop_mining/{i}"
 
@@ -52,7 +53,7 @@ for i in mine_image_names:
         return feature.set("AREA", area)
 
     # Check if the Outfile has already been created (in an earlier year), and pass if it has
-    if out_blob_vector_test.exists():
+    if object_index.exists(outfile_vector_test_name):
         print(f"  > {outfile_vector_fin_name}.geojson ALREADY EXISTS. PASSING CONVERSION FOR {year}.")
         pass
     else:
@@ -65,7 +66,8 @@ for i in mine_image_names:
         vector = vector.map(getArea)
 
         # EXPORTS
-        vector_export = batch.Export.table.toCloudStorage(
+        vector_export = partial(
+            batch.Export.table.toCloudStorage,
             collection=vector,
             description=annual_export_desc,
             bucket=GCLOUD_BUCKET,
@@ -73,10 +75,10 @@ for i in mine_image_names:
             fileFormat="GeoJSON"
         )
 
-        print(f"      > {year} writing vector data: {i}  >>>>  {outfile_vector_test_name}\n")
-        vector_export.start()
-        while vector_export.active():
-            print(f"        > Logging task for {year} vector export (id: {vector_export.id}). Checks every 15 sec.")
-            time.sleep(15)
-        print(f"        > Outfile Status: {ee.data.getTaskStatus(vector_export.id)}")
-        print(f"          > {year} active mining geojson created.")
\ No newline at end of file
+        print(f"      > {year} queueing vector data: {i}  >>>>  {outfile_vector_test_name}\n")
+        export_jobs.append(ExportJob(annual_export_desc, vector_export))
+
+# Vector exports are quick, so status is checked every 15 sec.
+run_exports(export_jobs, poll_interval=15)
+object_index.invalidate(GCLOUD_EE_ANNUAL_MINES_GEOJSON)
+exit_if_failed(export_jobs)
@@ -0,0 +1,375 @@
+import click
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import rasterio
+import shapely
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.io import MemoryFile
+
+from MTM_Annual_Extent.code.local_cleaning import clean_stack, final_mine_processing
+from MTM_Annual_Extent.code.local_cumulative import stream_cumulative
+from MTM_Annual_Extent.code.local_threshold import county_interval_means, paint_thresholds, raw_mining
+from MTM_Annual_Extent.code.local_vectorize import filter_components, polygonize, row_pixel_areas
+from MTM_Annual_Extent.code.tiled_runner import year_raster_profile
+from mtm_utils.exclusion_mask import local_mining_exclusion, local_threshold_exclusion
+from mtm_utils.grid_dissolve import grid_dissolve
+from mtm_utils.mask_raster import interim_profile, mask_grid, rasterize_dilated_windows, rasterize_windows
+from mtm_utils.variables import (
+    FIRST_LANDSAT_YEAR,
+    FIPS_CODES,
+    MIN_MINE_AREA,
+    EXCLUSION_USCB_BIT,
+    EXCLUSION_PERMIT_BIT,
+    MASK_BUFFER,
+    BENCHMARK_HISTORY,
+)
+
+"""
+Benchmarks the local annual-extent stages on synthetic rasters.
+
+A synthetic study area is generated for a given grid size, number of years and number of counties:
+    - NDVI: vegetated background (~0.75) with mines (disks of low NDVI, ~0.1) that are active for a few years each,
+      and ~1% of the pixels masked (NaN) every year, which gives the cleaning nulls and single-year noise to fix
+    - counties: a grid of rectangular counties
+    - exclusion mask: rectangles with the USCB and mine permit bits of the combined exclusion mask
+and each stage is run on it in pipeline order:
+    - threshold: county interval means and the painted threshold raster (local_threshold.py, exact mode)
+    - raw_mining: NDVI <= threshold (local_threshold.py)
+    - cleaning: null and noise cleaning of the (years, rows, cols) stack (local_cleaning.py)
+    - component_filter: exclusion and connected pixel count filter (local_cleaning.py)
+    - vectorize: minimum area filter and polygonization (local_vectorize.py)
+    - cumulative: streaming running maximum over the annual GeoTIFFs (local_cumulative.py)
+With --suite mask, the routes of the USCB mask (mtm_utils/mask_raster.py) are compared instead, on synthetic roads
+(random-walk polylines, ~1 km of road per km2) over the same extent, rasterized at the mask's 15m on a planar grid:
+    - mask_vector: buffer, grid dissolve and rasterize the dissolved polygons (mask_creation.py --mode direct)
+    - mask_raster: buffer and rasterize the undissolved buffers (--mode raster)
+    - mask_dilate: rasterize the centerlines and dilate them with a distance transform (--mode dilate)
+The raster routes also record the number of pixels that differ from the vector route's mask.
+Per-year stages are timed over all years. Each stage records its wall time and the peak memory it allocated on top of
+what was allocated when it started (tracemalloc, which sees NumPy buffers), so generating the inputs isn't counted.
+
+Every run is appended to a JSON history file with the git commit, so regressions show up across commits: the run is
+compared with the last recorded run of the same configuration.
+"""
+
+# (rows, cols, counties): a single county (~1000 km2 at 30m), a block of counties, and the export bounding box of the
+# study area (EXPORT_AREA_BOUNDING_BOX) at 30m
+SIZES = {
+    "county": (1024, 1024, 1),
+    "region": (4096, 4096, 16),
+    "study_area": (12521, 18267, len(FIPS_CODES)),
+}
+STAGES = ["threshold", "raw_mining", "cleaning", "component_filter", "vectorize", "cumulative"]
+MASK_STAGES = ["mask_vector", "mask_raster", "mask_dilate"]
+PIXEL_SIZE = 30
+SYNTHETIC_CRS = CRS.from_epsg(5072)
+
+
+def synthetic_labels(shape, n_counties):
+    """
+    int16 label raster of n_counties rectangular counties (labels 1..n_counties) tiling the grid.
+    """
+    n_cols = int(np.ceil(np.sqrt(n_counties)))
+    n_rows = int(np.ceil(n_counties / n_cols))
+    rows = np.minimum(np.arange(shape[0]) * n_rows // shape[0], n_rows - 1)
+    cols = np.minimum(np.arange(shape[1]) * n_cols // shape[1], n_cols - 1)
+    labels = (rows[:, None] * n_cols + cols[None, :] + 1).astype(np.int16)
+    labels[labels > n_counties] = 0
+    return labels
+
+
+def synthetic_mines(shape, n_years, rng, density=2e-5):
+    """
+    Random mines as (row, col, radius, first year index, number of years), about density mines per pixel.
+    """
+    n_mines = max(1, int(shape[0] * shape[1] * density))
+    return list(
+        zip(
+            rng.integers(0, shape[0], n_mines),
+            rng.integers(0, shape[1], n_mines),
+            rng.integers(3, 40, n_mines),
+            rng.integers(0, n_years, n_mines),
+            rng.integers(1, 8, n_mines),
+        )
+    )
+
+
+def synthetic_ndvi(shape, year_index, mines, rng, cloud_fraction=0.01):
+    """
+    float32 NDVI of one year: background vegetation, low NDVI in the mines active that year, NaN for masked pixels.
+    """
+    ndvi = rng.normal(0.75, 0.05, size=shape).astype(np.float32)
+    for row, col, radius, first, n_years in mines:
+        if not first <= year_index < first + n_years:
+            continue
+        r0, r1 = max(row - radius, 0), min(row + radius + 1, shape[0])
+        c0, c1 = max(col - radius, 0), min(col + radius + 1, shape[1])
+        rr, cc = np.ogrid[r0:r1, c0:c1]
+        disk = (rr - row) ** 2 + (cc - col) ** 2 <= radius**2
+        ndvi[r0:r1, c0:c1][disk] = rng.normal(0.1, 0.05, size=int(disk.sum()))
+    ndvi[rng.random(shape) < cloud_fraction] = np.nan
+    return ndvi
+
+
+def synthetic_exclusion(shape, rng, n_rects=20):
+    """
+    uint8 combined exclusion mask with random USCB and mine permit rectangles.
+    """
+    exclusion = np.zeros(shape, dtype=np.uint8)
+    for bit in (EXCLUSION_USCB_BIT, EXCLUSION_PERMIT_BIT):
+        for _ in range(n_rects):
+            r0, c0 = rng.integers(0, shape[0]), rng.integers(0, shape[1])
+            h, w = rng.integers(1, max(shape[0] // 10, 2)), rng.integers(1, max(shape[1] // 10, 2))
+            exclusion[r0 : r0 + h, c0 : c0 + w] |= bit
+    return exclusion
+
+
+def synthetic_roads(extent, rng, km_per_km2=1.0, step=100.0, vertices=10):
+    """
+    Random-walk road polylines of (vertices - 1) * step meters in the (width, height) extent in meters, about
+    km_per_km2 of road per km2.
+    """
+    width, height = extent
+    length_km = (vertices - 1) * step / 1000
+    n_roads = max(1, int(width * height / 1e6 * km_per_km2 / length_km))
+    starts = rng.uniform((0, 0), (width, height), size=(n_roads, 1, 2))
+    headings = rng.uniform(0, 2 * np.pi, (n_roads, 1))
+    angles = headings + np.cumsum(rng.normal(0, 0.4, size=(n_roads, vertices - 1)), axis=1)
+    steps = np.stack([np.cos(angles), np.sin(angles)], axis=-1) * step
+    coords = np.concatenate([starts, starts + np.cumsum(steps, axis=1)], axis=1)
+    return shapely.linestrings(coords)
+
+
+class StageTimer:
+    """
+    Accumulates the wall time and the peak traced memory of each stage over all of its measured calls.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - base
+            result = self.results.setdefault(stage, {"seconds": 0.0, "peak_mb": 0.0, "calls": 0})
+            result["seconds"] += seconds
+            result["peak_mb"] = max(result["peak_mb"], peak / 2**20)
+            result["calls"] += 1
+
+
+def run_benchmark(rows, cols, n_years, n_counties, seed=0, first_year=FIRST_LANDSAT_YEAR):
+    """
+    Runs every stage on a synthetic study area and returns {stage: {"seconds", "peak_mb", "calls"}}.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (rows, cols)
+    years = list(range(first_year, first_year + n_years))
+    transform = Affine(PIXEL_SIZE, 0, 0, 0, -PIXEL_SIZE, rows * PIXEL_SIZE)
+    labels = synthetic_labels(shape, n_counties)
+    mines = synthetic_mines(shape, n_years, rng)
+    exclusion = synthetic_exclusion(shape, rng)
+    threshold_excluded = local_threshold_exclusion(exclusion)
+    mining_excluded = local_mining_exclusion(exclusion)
+    timer = StageTimer()
+
+    tracemalloc.start()
+    try:
+        raw = np.empty((n_years,) + shape, dtype=np.uint8)
+        for i in range(n_years):
+            ndvi = synthetic_ndvi(shape, i, mines, rng)
+            with timer.measure("threshold"):
+                means = county_interval_means(ndvi, labels, n_counties, excluded=threshold_excluded)
+                threshold = paint_thresholds(means, labels)
+            with timer.measure("raw_mining"):
+                raw[i] = raw_mining(ndvi, threshold)
+            del ndvi, threshold
+
+        with timer.measure("cleaning"):
+            cleaned = clean_stack(raw)
+        del raw
+
+        annual = np.empty(cleaned.shape, dtype=np.uint16)
+        for i, year in enumerate(years):
+            with timer.measure("component_filter"):
+                annual[i] = final_mine_processing(cleaned[i], mining_excluded, year)
+        del cleaned
+
+        row_areas = row_pixel_areas(transform, SYNTHETIC_CRS, rows)
+        n_features = 0
+        for i, year in enumerate(years):
+            with timer.measure("vectorize"):
+                component_labels, areas = filter_components(annual[i] > 0, row_areas, min_area=MIN_MINE_AREA)
+                n_features += len(polygonize(component_labels, areas, year, transform, SYNTHETIC_CRS))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            grid = {"driver": "GTiff", "height": rows, "width": cols, "crs": SYNTHETIC_CRS, "transform": transform}
+            # int32, like the annual rasters exported by annualMiningArea.py
+            profile = dict(year_raster_profile(grid), dtype="int32")
+            year_paths = {}
+            for i, year in enumerate(years):
+                year_paths[year] = os.path.join(tmp, f"activeMining_{year}.tif")
+                with rasterio.open(year_paths[year], "w", **profile) as dst:
+                    dst.write(annual[i].astype(np.int32), 1)
+            del annual
+            outputs = {years[-2]: os.path.join(tmp, "final.tif"), years[-1]: os.path.join(tmp, "provisional.tif")}
+            with timer.measure("cumulative"):
+                stream_cumulative(year_paths, outputs)
+    finally:
+        tracemalloc.stop()
+
+    print(f"  > {n_features} mine features vectorized over {n_years} years")
+    return timer.results
+
+
+def run_mask_benchmark(rows, cols, seed=0):
+    """
+    Builds the mask of synthetic roads over a rows x cols (30m px) extent with each route and returns
+    {stage: {"seconds", "peak_mb", "calls"}}, with "differing_pixels" for the raster routes.
+    """
+    rng = np.random.default_rng(seed)
+    roads = synthetic_roads((cols * PIXEL_SIZE, rows * PIXEL_SIZE), rng)
+    transform, width, height = mask_grid(shapely.buffer(roads, MASK_BUFFER))
+    profile = interim_profile(transform, width, height, crs=SYNTHETIC_CRS)
+    timer = StageTimer()
+    masks = {}
+
+    tracemalloc.start()
+    try:
+        for stage in MASK_STAGES:
+            with MemoryFile() as memfile:
+                with timer.measure(stage):
+                    with memfile.open(**profile) as dst:
+                        if stage == "mask_vector":
+                            dissolved = grid_dissolve(shapely.buffer(roads, MASK_BUFFER))
+                            rasterize_windows(dst, shapely.get_parts(dissolved))
+                        elif stage == "mask_raster":
+                            rasterize_windows(dst, shapely.buffer(roads, MASK_BUFFER))
+                        else:
+                            rasterize_dilated_windows(dst, roads)
+                with memfile.open() as src:
+                    masks[stage] = src.read(1)
+    finally:
+        tracemalloc.stop()
+
+    for stage in MASK_STAGES[1:]:
+        timer.results[stage]["differing_pixels"] = int(np.count_nonzero(masks[stage] != masks["mask_vector"]))
+    print(f"  > {len(roads)} roads on a {width} x {height} px mask, {masks['mask_vector'].mean():.1%} masked")
+    return timer.results
+
+
+def git_commit():
+    """
+    Short hash of the checked out commit (with +dirty if there are uncommitted changes), or None outside of git.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        status = subprocess.run(["git", "status", "--porcelain", "-uno"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.stdout.strip() + ("+dirty" if status.stdout.strip() else "")
+
+
+def read_history(path):
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(path, record):
+    history = read_history(path)
+    history.append(record)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2)
+    return history
+
+
+def print_comparison(record, previous):
+    """
+    Prints each stage's time and peak memory, with the change from the previous run of the same configuration.
+    """
+    print(f"\nBENCHMARK ({record['commit']}, {record['rows']} x {record['cols']} px, {record['years']} years)")
+    for stage, result in record["stages"].items():
+        line = f"  > {stage:<17}{result['seconds']:9.2f}s {result['peak_mb']:10.1f} MB"
+        if "differing_pixels" in result:
+            line += f" {result['differing_pixels']:>10} px differ"
+        if previous is not None and stage in previous["stages"]:
+            before = previous["stages"][stage]
+            line += f"   ({(result['seconds'] / before['seconds'] - 1) * 100:+.0f}% time"
+            line += f", {(result['peak_mb'] / max(before['peak_mb'], 1e-9) - 1) * 100:+.0f}% memory"
+            line += f" vs {previous['commit']})"
+        print(line)
+
+
+@click.command()
+@click.option("--size", default="county", type=click.Choice(list(SIZES)), help="Synthetic study area size.")
+@click.option("--rows", default=None, type=int, help="Override the number of rows of the size.")
+@click.option("--cols", default=None, type=int, help="Override the number of columns of the size.")
+@click.option("--years", default=10, help="Number of years in the synthetic stack (at least 3).")
+@click.option("--counties", default=None, type=int, help="Override the number of counties of the size.")
+@click.option("--seed", default=0, help="Random seed for the synthetic rasters.")
+@click.option("--history", default=BENCHMARK_HISTORY, help="JSON file the results are appended to.")
+@click.option(
+    "--suite",
+    default="annual",
+    type=click.Choice(["annual", "mask"]),
+    help="annual: the local annual-extent stages; mask: the vector and raster routes of the USCB mask.",
+)
+def main(size: str, rows: int, cols: int, years: int, counties: int, seed: int, history: str, suite: str):
+    size_rows, size_cols, size_counties = SIZES[size]
+    rows, cols, counties = rows or size_rows, cols or size_cols, counties or size_counties
+    if years < 3:
+        raise click.BadParameter("The temporal cleaning needs at least 3 years", param_hint="--years")
+
+    if suite == "mask":
+        print(f"Benchmarking the mask routes on {rows} x {cols} px (seed {seed})")
+        results = run_mask_benchmark(rows, cols, seed=seed)
+    else:
+        print(f"Benchmarking the local stages on {rows} x {cols} px, {years} years, {counties} counties (seed {seed})")
+        results = run_benchmark(rows, cols, years, counties, seed=seed)
+
+    record = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "suite": suite,
+        "size": size,
+        "rows": rows,
+        "cols": cols,
+        "years": years,
+        "counties": counties,
+        "seed": seed,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "stages": results,
+    }
+    config = ("rows", "cols", "years", "counties", "seed")
+    previous = [
+        run
+        for run in read_history(history)
+        if run.get("suite", "annual") == suite and all(run[key] == record[key] for key in config)
+    ]
+    append_history(history, record)
+    print_comparison(record, previous[-1] if previous else None)
+    print(f"FINISHED. Results appended to {history}")
+
+
+if __name__ == "__main__":
+    main()
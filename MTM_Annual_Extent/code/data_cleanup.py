@@ -1,9 +1,9 @@
 import fnmatch
 import geopandas as gpd
 import numpy as np
-from google.cloud import storage
 
 
+from mtm_utils.clients import get_bucket, get_object_index, get_storage_client
 from mtm_utils.variables import (
     GCLOUD_BUCKET,
     GCLOUD_EE_ANNUAL_MINES_TIFF,
@@ -16,13 +16,13 @@ from mtm_utils.variables import (
 
 
 # The ID of your GCS bucket
-storage_client = storage.Client()
 bucket_name = GCLOUD_BUCKET
-storage_bucket = storage_client.bucket(bucket_name)
-print(f"STORAGE BUCKET:{storage_bucket}\n\n")
 
 
 def file_copy():
+    storage_client = get_storage_client()
+    storage_bucket = get_bucket(bucket_name)
+    object_index = get_object_index(bucket_name)
     print("\nCOPYING DATA TO THE FINAL OUTPUT DIRECTORIES, REMOVING UNNEEDED COLUMNS\n")
 
     geojson_urls = []
@@ -101,9 +101,7 @@ def file_copy():
         infile_name = infile.split("ANNUAL_MINE_GEOJSON/")[1]  # .strip(".geojson")
 
         # Check if the file exists in the Final Directory, if it does: pass. If it doesn't: write it.
-        out_blob = storage_bucket.blob(GCLOUD_FINAL_DATA_GEOJSON + infile_name)
-
-        if out_blob.exists():
+        if object_index.exists(GCLOUD_FINAL_DATA_GEOJSON + infile_name):
             print("  > OUTFILE ALREADY EXISTS. PASSING.")
             pass
         else:
@@ -118,6 +116,7 @@ def file_copy():
             print(f"        > Copying + Column Processing:{source_file} to :{output_file}")
             blob = storage_bucket.blob(GCLOUD_FINAL_DATA_GEOJSON + infile_name)
             blob.upload_from_string(json, content_type="application/geojson")
+            object_index.add(GCLOUD_FINAL_DATA_GEOJSON + infile_name)
             print(f"    > Outfile: {infile_name} written.")
 
     # Move the files to the Final Directories
@@ -126,9 +125,7 @@ def file_copy():
         infile_name = infile.split("ANNUAL_MINE_GEOTIFF/")[1]  # .strip(".geojson")
 
         # Check if the file exists in the Final Directory, if it does: pass. If it doesn't: write it.
-        out_blob = storage_bucket.blob(GCLOUD_FINAL_DATA_GEOTIFF + infile_name)
-
-        if out_blob.exists():
+        if object_index.exists(GCLOUD_FINAL_DATA_GEOTIFF + infile_name):
             print("  > OUTFILE ALREADY EXISTS. PASSING.")
             pass
         else:
@@ -137,6 +134,7 @@ def file_copy():
             output_image = storage_bucket.blob(GCLOUD_FINAL_DATA_GEOTIFF + infile_name)
             print(f"        > Copying:{source_image} to :{output_image}")
             copy = storage_bucket.copy_blob(source_image, storage_bucket, GCLOUD_FINAL_DATA_GEOTIFF + infile_name)
+            object_index.add(GCLOUD_FINAL_DATA_GEOTIFF + infile_name)
             print(f"    > Outfile: {infile_name} written.")
 
     # Move the files to the Final Directories
@@ -145,9 +143,7 @@ def file_copy():
         infile_name = infile.split("CUMULATIVE_MINE_GEOTIFF/")[1]  # .strip(".geojson")
 
         # Check if the file exists in the Final Directory, if it does: pass. If it doesn't: write it.
-        out_blob = storage_bucket.blob(GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE + infile_name)
-
-        if out_blob.exists():
+        if object_index.exists(GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE + infile_name):
             print("  > OUTFILE ALREADY EXISTS. PASSING.")
             pass
         else:
@@ -156,12 +152,15 @@ def file_copy():
             output_image = storage_bucket.blob(GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE + infile_name)
             print(f"        > Copying:{source_image} to :{output_image}")
             copy = storage_bucket.copy_blob(source_image, storage_bucket, GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE + infile_name)
+            object_index.add(GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE + infile_name)
             print(f"    > Outfile: {infile_name} written.")
 
     print("\nFINISHED COPYING DATA TO THE FINAL OUTPUT DIRECTORIES\n")
 
 
 def final_cleanup():
+    storage_client = get_storage_client()
+    storage_bucket = get_bucket(bucket_name)
     print("\nBEGINNING FINAL DATA CLEANUP, REMOVING OUT-OF-DATE DATA FROM THE FINAL OUTPUT DIRECTORIES\n")
     geojson_urls = []
     geotiff_urls = []
@@ -264,8 +263,18 @@ def final_cleanup():
         delete_blob.delete()
         print("      > PROVISIONAL FILE DELETED")
 
+    # The deleted files may still be in the listings cached by earlier runs
+    object_index = get_object_index(bucket_name)
+    for prefix in (GCLOUD_FINAL_DATA_GEOJSON, GCLOUD_FINAL_DATA_GEOTIFF, GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE):
+        object_index.invalidate(prefix)
+
     print("\nFINAL DATA CLEANUP FINISHED, OUT-OF-DATE DATA REMOVED FROM THE FINAL OUTPUT DIRECTORIES\n")
 
 
+def main():
+    print(f"STORAGE BUCKET:{get_bucket(bucket_name)}\n\n")
+    file_copy()
+
+
 if __name__ == "__main__":
-    file_copy()
\ No newline at end of file
+    main()
@@ -0,0 +1,248 @@
+import click
+import json
+import os
+import time
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.windows import Window, from_bounds, intersect as windows_intersect
+
+from mtm_utils.composite_index import GPC_PATTERN
+from mtm_utils.variables import GPC_BANDS, GPC_CUBE_BLOCK_SIZE, GPC_CUBE_WRITE_WINDOW, LOCAL_GPC_DIR, LOCAL_GPC_CUBE
+
+"""
+Year-stacked cube of the greenest pixel composites.
+
+Earth Engine splits each year's composite export into GPC_SPLIT_TILES GeoTIFFs, which every consumer re-merges with
+ImageCollection([...]).median(). This module ingests the split tiles once into a (year, band, y, x) float32 cube on
+disk: one GeoTIFF of shape (band, y, x) per year, stored in GPC_CUBE_BLOCK_SIZE square blocks of each band that are
+compressed separately (DEFLATE with the floating point predictor), plus an index.json with the years, bands, grid
+(transform, CRS, shape) and the source tiles of every year. Masked pixels are NaN.
+
+Reading a window or the time series of a pixel then only decompresses the blocks of the bands it reads that overlap it
+in each year's file, without opening and merging ~80 GeoTIFFs. Each block is written once, a GPC_CUBE_WRITE_WINDOW
+square at a time, so the files don't grow with rewritten blocks. Zarr isn't a dependency of this repo; rasterio/GDAL
+already are.
+"""
+
+INDEX_NAME = "index.json"
+
+
+def local_gpc_tiles(gpc_dir=LOCAL_GPC_DIR):
+    """
+    Returns {year: [sorted tile paths]} for the composite tiles in gpc_dir (same naming as GCLOUD_EE_GPC_DIR).
+    """
+    tiles = {}
+    for name in os.listdir(gpc_dir):
+        match = GPC_PATTERN.search("/" + name)
+        if match:
+            tiles.setdefault(int(match.group(1)), []).append(os.path.join(gpc_dir, name))
+    return {year: sorted(paths) for year, paths in sorted(tiles.items())}
+
+
+def tiles_grid(tile_paths):
+    """
+    Returns (transform, crs, height, width) of the grid covering all tiles. The tiles of an export share one grid, so
+    the union of their bounds is exact.
+    """
+    bounds = []
+    for path in tile_paths:
+        with rasterio.open(path) as src:
+            bounds.append(src.bounds)
+            res, crs = src.res, src.crs
+    left = min(b.left for b in bounds)
+    top = max(b.top for b in bounds)
+    width = int(round((max(b.right for b in bounds) - left) / res[0]))
+    height = int(round((top - min(b.bottom for b in bounds)) / res[1]))
+    return Affine(res[0], 0, left, 0, -res[1], top), crs, height, width
+
+
+class GPCCube:
+    """
+    Read access to a cube written by build_cube. Each year's file is opened the first time it is read.
+    """
+
+    def __init__(self, root=LOCAL_GPC_CUBE):
+        self.root = root
+        with open(os.path.join(root, INDEX_NAME)) as f:
+            self.index = json.load(f)
+        self.years = sorted(int(year) for year in self.index["years"])
+        self.bands = self.index["bands"]
+        self.height = self.index["height"]
+        self.width = self.index["width"]
+        self.transform = Affine(*self.index["transform"])
+        self.crs = rasterio.crs.CRS.from_wkt(self.index["crs"])
+        self._datasets = {}
+
+    def year_dataset(self, year):
+        """
+        The open (band, y, x) dataset of one year.
+        """
+        if year not in self._datasets:
+            path = os.path.join(self.root, self.index["years"][str(year)]["file"])
+            self._datasets[year] = rasterio.open(path)
+        return self._datasets[year]
+
+    def close(self):
+        for dataset in self._datasets.values():
+            dataset.close()
+        self._datasets = {}
+
+    def _band_indices(self, bands):
+        if bands is None:
+            return list(range(len(self.bands)))
+        return [self.bands.index(band) for band in bands]
+
+    def read(self, years=None, bands=None, window=None):
+        """
+        Returns a (year, band, y, x) array for the given years (default: all), band names (default: all) and window (a
+        rasterio Window, default: the full grid).
+        """
+        years = self.years if years is None else list(years)
+        band_ids = self._band_indices(bands)
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        window = window.intersection(Window(0, 0, self.width, self.height))
+        indexes = [band_id + 1 for band_id in band_ids]
+
+        out = np.empty((len(years), len(band_ids), int(window.height), int(window.width)), dtype=np.float32)
+        for i, year in enumerate(years):
+            self.year_dataset(year).read(indexes, window=window, out=out[i])
+        return out
+
+    def read_bounds(self, left, bottom, right, top, years=None, bands=None):
+        """
+        Same as read, for a bounding box in the cube's CRS.
+        """
+        window = from_bounds(left, bottom, right, top, transform=self.transform).round_offsets().round_lengths()
+        return self.read(years=years, bands=bands, window=window)
+
+    def pixel_series(self, row, col, years=None, bands=None):
+        """
+        Returns the (year, band) time series of one pixel.
+        """
+        return self.read(years=years, bands=bands, window=Window(col, row, 1, 1))[:, :, 0, 0]
+
+    def xy_series(self, x, y, years=None, bands=None):
+        """
+        Same as pixel_series, for a coordinate in the cube's CRS.
+        """
+        col, row = ~self.transform * (x, y)
+        return self.pixel_series(int(row), int(col), years=years, bands=bands)
+
+
+def write_year(tile_paths, out_path, transform, crs, height, width, bands, block_size=GPC_CUBE_WRITE_WINDOW):
+    """
+    Mosaics the split tiles of one year into a (band, y, x) float32 GeoTIFF of compressed GPC_CUBE_BLOCK_SIZE blocks,
+    one block_size window of the grid at a time (block_size is a multiple of GPC_CUBE_BLOCK_SIZE, so every block is
+    compressed once). Masked pixels are written as NaN.
+    """
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": len(bands),
+        "height": height,
+        "width": width,
+        "crs": crs,
+        "transform": transform,
+        "nodata": np.nan,
+        "tiled": True,
+        "blockxsize": GPC_CUBE_BLOCK_SIZE,
+        "blockysize": GPC_CUBE_BLOCK_SIZE,
+        "compress": "deflate",
+        "predictor": 3,
+        "interleave": "band",
+        "BIGTIFF": "IF_SAFER",
+    }
+    sources = [rasterio.open(path) for path in tile_paths]
+    try:
+        offsets = []
+        for path, src in zip(tile_paths, sources):
+            if src.count != len(bands):
+                raise ValueError(f"{path} has {src.count} bands, expected {len(bands)} ({', '.join(bands)})")
+            col0, row0 = (int(round(v)) for v in ~transform * (src.bounds.left, src.bounds.top))
+            offsets.append(Window(col0, row0, src.width, src.height))
+
+        with rasterio.open(out_path, "w", **profile) as dst:
+            for r0 in range(0, height, block_size):
+                for c0 in range(0, width, block_size):
+                    window = Window(c0, r0, min(block_size, width - c0), min(block_size, height - r0))
+                    block = np.full((len(bands), int(window.height), int(window.width)), np.nan, dtype=np.float32)
+                    for src, offset in zip(sources, offsets):
+                        if not windows_intersect(window, offset):
+                            continue
+                        overlap = window.intersection(offset)
+                        src_window = Window(overlap.col_off - offset.col_off, overlap.row_off - offset.row_off,
+                                            overlap.width, overlap.height)
+                        rows = slice(int(overlap.row_off - r0), int(overlap.row_off - r0 + overlap.height))
+                        cols = slice(int(overlap.col_off - c0), int(overlap.col_off - c0 + overlap.width))
+                        data = src.read(window=src_window, masked=True).astype(np.float32).filled(np.nan)
+                        block[:, rows, cols] = data
+                    dst.write(block, window=window)
+    finally:
+        for src in sources:
+            src.close()
+
+
+def build_cube(year_tiles, root=LOCAL_GPC_CUBE, bands=GPC_BANDS, overwrite=False):
+    """
+    Ingests {year: [tile paths]} into the cube at root. Years already in the cube with the same source tiles are kept
+    unless overwrite is set, so adding a new year only converts that year. Returns the cube's index.
+    """
+    os.makedirs(root, exist_ok=True)
+    index_path = os.path.join(root, INDEX_NAME)
+    all_tiles = [path for paths in year_tiles.values() for path in paths]
+    transform, crs, height, width = tiles_grid(all_tiles)
+
+    index = {"years": {}}
+    if os.path.isfile(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index["height"] != height or index["width"] != width or Affine(*index["transform"]) != transform:
+            raise ValueError(f"The tiles don't match the grid of the existing cube at {root}; use a new directory")
+
+    index.update(
+        {
+            "bands": list(bands),
+            "dtype": "float32",
+            "height": height,
+            "width": width,
+            "transform": list(transform)[:6],
+            "crs": crs.to_wkt(),
+        }
+    )
+
+    for year, tile_paths in sorted(year_tiles.items()):
+        sources = [os.path.basename(path) for path in tile_paths]
+        existing = index["years"].get(str(year))
+        # Years of cubes written before the files were compressed (.npy) are converted
+        if existing and existing["sources"] == sources and existing["file"].endswith(".tif") and not overwrite:
+            print(f"  > {year} is already in the cube. PASSING.")
+            continue
+
+        start = time.time()
+        file_name = f"{year}.tif"
+        write_year(tile_paths, os.path.join(root, file_name), transform, crs, height, width, bands)
+        if existing and existing["file"] != file_name and os.path.isfile(os.path.join(root, existing["file"])):
+            os.remove(os.path.join(root, existing["file"]))
+        index["years"][str(year)] = {"file": file_name, "sources": sources}
+        with open(index_path, "w") as f:
+            json.dump(index, f, indent=2)
+        print(f"  > {year}: {len(tile_paths)} tiles ingested ({time.time() - start:.1f}s)")
+
+    return index
+
+
+@click.command()
+@click.option("--gpc_dir", default=LOCAL_GPC_DIR, help="Directory with the downloaded composite tiles.")
+@click.option("--cube_dir", default=LOCAL_GPC_CUBE, help="Output directory for the cube.")
+@click.option("--overwrite", is_flag=True, help="Re-ingest years that are already in the cube.")
+def main(gpc_dir: str, cube_dir: str, overwrite: bool):
+    year_tiles = local_gpc_tiles(gpc_dir)
+    print(f"Ingesting {len(year_tiles)} years of greenest pixel composites into {cube_dir}")
+    build_cube(year_tiles, root=cube_dir, overwrite=overwrite)
+    print("FINISHED")
+
+
+if __name__ == "__main__":
+    main()
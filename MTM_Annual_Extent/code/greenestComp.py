@@ -1,23 +1,24 @@
 import ee
 import datetime
-import time
 from ee import batch
-from google.cloud import storage
-
-from config import EE_SERVICE_ACCOUNT, EE_CREDENTIALS
-from mtm_utils.variables import PROCESSING_YEAR, GCLOUD_BUCKET, GCLOUD_EE_GPC_DIR
-
-
-processing_year = PROCESSING_YEAR
+from functools import partial
+
+from mtm_utils.clients import get_bucket, get_object_index, init_earth_engine
+from mtm_utils.ee_tasks import ExportJob, active_export_descriptions, exit_if_failed, run_exports, quota_aware_limit
+from mtm_utils.export_manifest import export_tiles, read_manifest, write_manifest, delete_tiles
+from mtm_utils.landsat_harmonization import LANDSAT_SENSORS, ee_harmonize
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    GCLOUD_BUCKET,
+    GCLOUD_EE_GPC_DIR,
+    GCLOUD_EE_GPC_AUX_DIR,
+    GCLOUD_EE_GPC_MANIFEST,
+    GPC_BANDS,
+    GPC_AUX_BANDS,
+    GPC_SPLIT_TILES,
+)
 
-# The ID of your GCS bucket
-storage_client = storage.Client()
-bucket_name = GCLOUD_BUCKET
-storage_bucket = storage_client.bucket(bucket_name)
-print(f"STORAGE BUCKET:{storage_bucket}\n\n")
 
-credentials = ee.ServiceAccountCredentials(EE_SERVICE_ACCOUNT, EE_CREDENTIALS)
-ee.Initialize(credentials)
 ########################################################################################################################
 ########################################################################################################################
 """DEFINE FUNCTIONS"""
@@ -40,219 +41,191 @@ def maskClouds(image):
     return cloudScored
 
 
-def addBands_l4(image):
-    fin = image.addBands(
-        image.expression(
-            "( NIR - R ) / ( NIR + R )",
-            {"R": image.select("B3"), "NIR": image.select("B4")},
-        ).rename("NDVI")
-    )
-
-    fin = fin.select(l4_input_list).rename(l4_output_list)
-    return fin
+def addProvenance(sensor):
+    """
+    Adds uint16 DOY (day of year of the scene) and SENSOR (Landsat mission number) bands. qualityMosaic carries them
+    over from the greenest scene, so the composite records where each pixel came from.
+    """
 
-
-def addBands_l5(image):
-    fin = image.addBands(
-        image.expression(
-            "( NIR - R ) / ( NIR + R )",
-            {"R": image.select("B3"), "NIR": image.select("B4")},
-        ).rename("NDVI")
+    def add_bands(image):
+        doy = ee.Date(image.get("system:time_start")).getRelative("day", "year").add(1)
+        provenance = (
+            ee.Image.constant([doy, sensor])
+            .toUint16()
+            .rename(["DOY", "SENSOR"])
+            .updateMask(image.select("NDVI").mask())
+        )
+        return image.addBands(provenance)
+
+    return add_bands
+
+
+def sensorCollection(sensor_id, studyArea):
+    """
+    sensorCollection f(x) > Cleaned, cloud-masked and harmonized (B, G, R, NIR, NDVI + provenance) scenes of one sensor
+    in LANDSAT_SENSORS
+    """
+    sensor = LANDSAT_SENSORS[sensor_id]
+    collection = (
+        ee.ImageCollection(sensor["collection"])
+        .select(sensor["raw_bands"])
+        .filterBounds(studyArea)
+        .filterDate(sensor["start"], sensor["end"] or datetime.datetime.now())
     )
-
-    fin = fin.select(l5_input_list).rename(l5_output_list)
-    return fin
-
-
-def addBands_l7(image):
-    fin = image.addBands(
-        image.expression(
-            "(NIR - R) / (NIR + R)",
-            {"R": image.select("B3"), "NIR": image.select("B4")},
-        ).rename("NDVI")
+    for start, end in sensor["exclude_dates"]:
+        collection = collection.filter(ee.Filter.date(start, end).Not())
+    return (
+        collection.map(cleaner(sensor["saturation"]))
+        .map(maskClouds)
+        .map(ee_harmonize(sensor_id))
+        .map(addProvenance(sensor_id))
     )
 
-    fin = fin.select(l7_input_list).rename(l7_output_list)
-    return fin
 
+def main(processing_year=PROCESSING_YEAR, bucket_name=GCLOUD_BUCKET):
+    # The ID of your GCS bucket
+    storage_bucket = get_bucket(bucket_name)
+    object_index = get_object_index(bucket_name)
+    print(f"STORAGE BUCKET:{storage_bucket}\n\n")
 
-def addBands_l8(image):
-    fin = image.addBands(
-        image.expression(
-            "(NIR - R) / (NIR + R)",
-            {"R": image.select("B4"), "NIR": image.select("B5")},
-        ).rename("NDVI")
-    )
+    init_earth_engine()
 
-    fin = fin.select(l8_input_list).rename(l8_output_list)
-    return fin
-
-
-def addBands_l9(image):
-    fin = image.addBands(
-        image.expression(
-            "(NIR - R) / (NIR + R)",
-            {"R": image.select("B4"), "NIR": image.select("B5")},
-        ).rename("NDVI")
+    ####################################################################################################################
+    ####################################################################################################################
+    studyArea = ee.FeatureCollection(
+        "users/skytruth-data/Plos_MTM_Fusion_Table_Backup/plosScriptFusionTableBackup/studyArea"
     )
 
-    fin = fin.select(l8_input_list).rename(l8_output_list)
-    return fin
-
-
-########################################################################################################################
-########################################################################################################################
-studyArea = ee.FeatureCollection(
-    "users/skytruth-data/Plos_MTM_Fusion_Table_Backup/plosScriptFusionTableBackup/studyArea"
-)
-studyAreaGeom = studyArea.geometry().getInfo()["coordinates"]
-exportBounds = ee.Geometry.Polygon(studyAreaGeom)
-
-exportAreaBoundingBox = ee.Geometry.Polygon(
-    [
+    exportAreaBoundingBox = ee.Geometry.Polygon(
         [
-            [-85.80934903683277, 35.64442402256219],
-            [-79.61790603657893, 35.64442402256219],
-            [-79.61790603657893, 39.02981799180214],
-            [-85.80934903683277, 39.02981799180214],
-            [-85.80934903683277, 35.64442402256219],
+            [
+                [-85.80934903683277, 35.64442402256219],
+                [-79.61790603657893, 35.64442402256219],
+                [-79.61790603657893, 39.02981799180214],
+                [-85.80934903683277, 39.02981799180214],
+                [-85.80934903683277, 35.64442402256219],
+            ]
         ]
-    ]
-)
-
-# Image Collections
-lt4_raw = ee.ImageCollection("LANDSAT/LT04/C02/T1").select(
-    "B1", "B2", "B3", "B4", "B5", "B6", "B7"
-)
-lt5_raw = ee.ImageCollection("LANDSAT/LT05/C02/T1").select(
-    "B1", "B2", "B3", "B4", "B5", "B6", "B7"
-)
-le7_raw = ee.ImageCollection("LANDSAT/LE07/C02/T1").select(
-    "B1", "B2", "B3", "B4", "B5", "B6_VCID_1", "B6_VCID_2", "B7", "B8"
-)
-lc8_raw = ee.ImageCollection("LANDSAT/LC08/C02/T1").select(
-    "B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "B10", "B11"
-)
-lc9_raw = ee.ImageCollection("LANDSAT/LC09/C02/T1").select(
-    "B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "B10", "B11"
-)
-
-# Create the empty mask images which will be used to create matching bands
-# between sensors.
-blank = ee.Image().mask()
-newMaskBand = (
-    ee.Image().updateMask(blank).toFloat()
-)  # Ran into an issue w/ toInt, trying to Float now
-
-l4_input_list = ["B1", "B2", "B3", "B4", "NDVI"]
-l4_output_list = ["B", "G", "R", "NIR", "NDVI"]
-
-l5_input_list = ["B1", "B2", "B3", "B4", "NDVI"]
-l5_output_list = ["B", "G", "R", "NIR", "NDVI"]
-
-l7_input_list = ["B1", "B2", "B3", "B4", "NDVI"]
-l7_output_list = ["B", "G", "R", "NIR", "NDVI"]
-
-l8_input_list = ["B2", "B3", "B4", "B5", "NDVI"]
-l8_output_list = ["B", "G", "R", "NIR", "NDVI"]
-
-l9_input_list = ["B2", "B3", "B4", "B5", "NDVI"]
-l9_output_list = ["B", "G", "R", "NIR", "NDVI"]
-
-
-# Create Image Collection
-lt4Collection = (
-    lt4_raw.filterBounds(studyArea)
-    .filterDate("1984-01-01", "1993-12-31")
-    .map(cleaner(250))
-    .map(maskClouds)
-    .map(addBands_l4)
-)
-lt5Collection = (
-    lt5_raw.filterBounds(studyArea)
-    .filterDate("1984-01-01", "2011-12-31")
-    .map(cleaner(250))
-    .map(maskClouds)
-    .map(addBands_l5)
-)
-le7Collection = (
-    le7_raw.filterBounds(studyArea)
-    .filterDate("1999-01-01", datetime.datetime.now())
-    .filter(ee.Filter.date("2012-08-03", "2012-08-04").Not())
-    .map(cleaner(250))
-    .map(maskClouds)
-    .map(addBands_l7)
-)
-lc8Collection = (
-    lc8_raw.filterBounds(studyArea)
-    .filterDate("2013-01-01", datetime.datetime.now())
-    .map(cleaner(64256))
-    .map(maskClouds)
-    .map(addBands_l8)
-)
-lc9Collection = (
-    lc9_raw.filterBounds(studyArea)
-    .filterDate("2021-10-31", datetime.datetime.now())
-    .map(cleaner(64256))
-    .map(maskClouds)
-    .map(addBands_l9)
-)
-
-lsCollection = ee.ImageCollection(
-    (lt4Collection)
-    .merge(lt5Collection)
-    .merge(le7Collection)
-    .merge(lc8Collection)
-    .merge(lc9Collection)
-)
-
-########################################################################################################################
-########################################################################################################################
-
-for i in range(1984, processing_year + 1):
-    year = i
-    print(f"Processing Imagery for {year}")
-    export_desc = "composite_" + str(year)
-    outfile_name = GCLOUD_EE_GPC_DIR + export_desc + ".tif"
-
-    # The export to cloud storage splits imagery into two pieces, the outfile_test_name checks if one of the two exists
-    outfile_test_name = GCLOUD_EE_GPC_DIR + export_desc + "0000000000-0000000000.tif"
-
-    out_blob = storage_bucket.blob(outfile_name)
-    out_blob_test = storage_bucket.blob(outfile_test_name)
+    )
 
-    if out_blob_test.exists():
-        print(f"  > {GCLOUD_EE_GPC_DIR + export_desc}.tif ALREADY EXISTS. PASSING.")
-        pass
-    else:
-        print(
-            f"  > Starting export for {i}, saving to cloud storage @ {GCLOUD_EE_GPC_DIR}"
-        )
-        composite = (
-            lsCollection.filter(ee.Filter.calendarRange(year, year, "year"))
-            .filter(ee.Filter.calendarRange(5, 9, "month"))
-            .qualityMosaic("NDVI")
-            .set("year", year)
+    # Create Image Collection
+    lsCollection = ee.ImageCollection([])
+    for sensor_id in LANDSAT_SENSORS:
+        lsCollection = lsCollection.merge(sensorCollection(sensor_id, studyArea))
+
+    ####################################################################################################################
+    ####################################################################################################################
+
+    export_jobs = []
+    export_prefixes = {}
+
+    # The export to cloud storage splits each composite into GPC_SPLIT_TILES tiles. A year is only complete if all of
+    # the tiles recorded in the manifest when its export finished are still there, unchanged.
+    manifest = read_manifest(storage_bucket, GCLOUD_EE_GPC_MANIFEST)
+    # Exports of an interrupted run may still be running; their tiles are left alone and they aren't queued again
+    active_exports = active_export_descriptions()
+
+    def record_export(job):
+        """
+        run_exports callback > Records the tiles written by a completed export in the manifest.
+        """
+        prefix = export_prefixes[job.description]
+        object_index.invalidate(prefix)
+        tiles = export_tiles(object_index, prefix, job.description)
+        manifest.record(job.description, prefix, tiles, task_id=job.task_id, destination_uris=job.destination_uris)
+        write_manifest(storage_bucket, GCLOUD_EE_GPC_MANIFEST, manifest)
+        print(f"    > Recorded {len(tiles)} tiles of {job.description} in {GCLOUD_EE_GPC_MANIFEST}")
+
+    for i in range(1984, processing_year + 1):
+        year = i
+        print(f"Processing Imagery for {year}")
+        export_desc = "composite_" + str(year)
+        aux_export_desc = "composite_aux_" + str(year)
+
+        gpc_status, gpc_tiles = manifest.status(
+            object_index, GCLOUD_EE_GPC_DIR, export_desc, expected_tiles=GPC_SPLIT_TILES
         )
-
-        export = batch.Export.image.toCloudStorage(
-            image=composite,
-            description=export_desc,
-            bucket=GCLOUD_BUCKET,
-            fileNamePrefix=GCLOUD_EE_GPC_DIR + export_desc,
-            region=exportAreaBoundingBox.getInfo()["coordinates"],
-            scale=30,
-            crs="EPSG:4326",
-            maxPixels=1e13,
-            fileFormat="GeoTIFF",
+        # The provenance export may or may not be split: unless recorded in the manifest, it's only complete if it is
+        # a single un-split file
+        aux_status, aux_tiles = manifest.status(object_index, GCLOUD_EE_GPC_AUX_DIR, aux_export_desc)
+        gpc_exists = gpc_status == "complete" or export_desc in active_exports
+        aux_exists = aux_status == "complete" or aux_export_desc in active_exports
+
+        for status, tiles, desc in [(gpc_status, gpc_tiles, export_desc), (aux_status, aux_tiles, aux_export_desc)]:
+            if desc in active_exports and status != "complete":
+                print(f"  > {desc} IS STILL RUNNING ON EARTH ENGINE. LEAVING IT.")
+            elif status == "partial":
+                print(f"  > {desc} IS INCOMPLETE ({len(tiles)} tiles). DELETING IT AND EXPORTING AGAIN.")
+                delete_tiles(storage_bucket, object_index, tiles)
+
+        if gpc_exists and aux_exists:
+            print(f"  > {GCLOUD_EE_GPC_DIR + export_desc}.tif ALREADY EXISTS. PASSING.")
+            continue
+
+        yearCollection = lsCollection.filter(ee.Filter.calendarRange(year, year, "year")).filter(
+            ee.Filter.calendarRange(5, 9, "month")
         )
+        composite = yearCollection.qualityMosaic("NDVI").set("year", year)
 
-        export.start()
-
-        while export.active():
+        if gpc_exists:
+            print(f"  > {GCLOUD_EE_GPC_DIR + export_desc}.tif ALREADY EXISTS. PASSING.")
+        else:
             print(
-                f"     > Logging task for {year}  (id: {export.id}). Checks every 5 min."
+                f"  > Queueing export for {i}, saving to cloud storage @ {GCLOUD_EE_GPC_DIR}"
+            )
+            export = partial(
+                batch.Export.image.toCloudStorage,
+                image=composite.select(GPC_BANDS),
+                description=export_desc,
+                bucket=GCLOUD_BUCKET,
+                fileNamePrefix=GCLOUD_EE_GPC_DIR + export_desc,
+                region=exportAreaBoundingBox.getInfo()["coordinates"],
+                scale=30,
+                crs="EPSG:4326",
+                maxPixels=1e13,
+                fileFormat="GeoTIFF",
+            )
+            export_jobs.append(ExportJob(export_desc, export))
+            export_prefixes[export_desc] = GCLOUD_EE_GPC_DIR
+
+        # Provenance bands are exported separately as uint16, since a single GeoTIFF export casts every band to one type
+        if aux_exists:
+            print(f"  > {GCLOUD_EE_GPC_AUX_DIR + aux_export_desc}.tif ALREADY EXISTS. PASSING.")
+        else:
+            print(f"  > Queueing provenance export for {i}, saving to cloud storage @ {GCLOUD_EE_GPC_AUX_DIR}")
+            count = yearCollection.select("NDVI").count().unmask().rename("COUNT")
+            provenance = composite.select(["DOY", "SENSOR"]).unmask().addBands(count).toUint16()
+            aux_export = partial(
+                batch.Export.image.toCloudStorage,
+                image=provenance.select(GPC_AUX_BANDS),
+                description=aux_export_desc,
+                bucket=GCLOUD_BUCKET,
+                fileNamePrefix=GCLOUD_EE_GPC_AUX_DIR + aux_export_desc,
+                region=exportAreaBoundingBox.getInfo()["coordinates"],
+                scale=30,
+                crs="EPSG:4326",
+                maxPixels=1e13,
+                fileFormat="GeoTIFF",
             )
-            time.sleep(300)
-        print(f"    > Outfile Status: {ee.data.getTaskStatus(export.id)}")
-        print(f"        > {outfile_name} written")
+            export_jobs.append(ExportJob(aux_export_desc, aux_export))
+            export_prefixes[aux_export_desc] = GCLOUD_EE_GPC_AUX_DIR
+
+    # Save the exports adopted from before the manifest existed
+    write_manifest(storage_bucket, GCLOUD_EE_GPC_MANIFEST, manifest)
+
+    # Run all pending exports concurrently, leaving room for tasks already running on the account; composites take a
+    # while, so status is checked every 5 min.
+    run_exports(
+        export_jobs,
+        max_concurrent=quota_aware_limit(),
+        poll_interval=300,
+        on_complete=record_export,
+    )
+    # Failed exports may have left tiles behind that the listings don't show yet
+    for prefix in (GCLOUD_EE_GPC_DIR, GCLOUD_EE_GPC_AUX_DIR):
+        object_index.invalidate(prefix)
+    exit_if_failed(export_jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import re
+
+from mtm_utils.variables import (
+    FIRST_LANDSAT_YEAR,
+    CLEANING_PASS_RADII,
+    GCLOUD_EE_ANNUAL_MINES_GEOJSON,
+    GCLOUD_FINAL_DATA_GEOJSON,
+    GCLOUD_FINAL_DATA_GEOTIFF,
+    GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE,
+)
+
+"""
+Dependency tracking for incremental reprocessing of the annual mining outputs.
+
+Each pass of the temporal cleaning in annualMiningArea.py looks one year back and one year forward, and the passes are
+chained (null cleaning -> noise cleaning 1 -> noise cleaning 2), so a change to the raw mining image of one year can
+reach every output within sum(CLEANING_PASS_RADII) years of it. Adding a new processing year P replaces the dummy
+image at P with real data (and moves the dummy to P + 1), which invalidates the annual outputs for P - 3 through P and
+every cumulative footprint that contains one of those years. All other years are unchanged and do not need to be
+regenerated.
+
+The regenerated rasters are exported under the names of the ones they replace. annualMiningArea_vectorCreation.py and
+data_cleanup.py skip files that already exist, so the files they derived from the old rasters are deleted once the new
+ones are exported (see derived_names()).
+"""
+
+PROVISIONAL_PATTERN = re.compile(r"(\d{4})_activeMining_PROVISIONAL\.tif$")
+
+
+def invalidated_years(changed_years, first_year, last_year, radii=CLEANING_PASS_RADII):
+    """
+    Returns the sorted list of output years (between first_year and last_year) that can change when the raw mining
+    input of changed_years changes, by expanding the changed set by each cleaning pass radius in turn.
+    """
+    affected = set(changed_years)
+    for radius in radii:
+        affected = {y + offset for y in affected for offset in range(-radius, radius + 1)}
+    return sorted(y for y in affected if first_year <= y <= last_year)
+
+
+def previous_processing_year(blob_names):
+    """
+    Finds the processing year of the last run from the PROVISIONAL annual mining raster that it exported. Returns None
+    if there is no PROVISIONAL raster (i.e. nothing has been processed yet).
+    """
+    years = [int(m.group(1)) for m in map(PROVISIONAL_PATTERN.search, blob_names) if m]
+    return max(years) if years else None
+
+
+def new_year_changes(processing_year, last_processing_year):
+    """
+    Years whose raw mining input differs from the last run: every year after the last processing year, which was
+    either the dummy year or not processed at all. Re-running the same processing year changes nothing.
+    """
+    if last_processing_year is None:
+        return list(range(FIRST_LANDSAT_YEAR, processing_year + 1))
+    return list(range(last_processing_year + 1, processing_year + 1))
+
+
+def plan_incremental_run(processing_year, export_years, blob_names, changed_years=()):
+    """
+    Works out which annual outputs have to be regenerated. export_years are the years exported by annualMiningArea.py,
+    blob_names the names of the annual mining rasters already on GCS, and changed_years any additional years whose
+    inputs were updated (e.g. a re-exported composite). Returns the sorted list of years to regenerate; years that are
+    not in the list can be read back from their existing exports.
+    """
+    last_processing_year = previous_processing_year(blob_names)
+    changed = set(new_year_changes(processing_year, last_processing_year)) | set(changed_years)
+    regenerate = invalidated_years(changed, min(export_years), max(export_years))
+
+    print(f"Incremental run: last processing year {last_processing_year}, processing year {processing_year}")
+    print(f"  > Years to regenerate: {regenerate}")
+    return regenerate
+
+
+def derived_names(export_name):
+    """
+    Names of the files that later steps derive from the annual or cumulative mining raster export_name (e.g.
+    "2021_activeMining" or "CumulativeMineArea_1985-2021"): the GeoJSON of annualMiningArea_vectorCreation.py and the
+    copies data_cleanup.py makes in the final data directories.
+    """
+    if export_name.startswith("CumulativeMineArea_"):
+        return [GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE + export_name + ".tif"]
+    return [
+        GCLOUD_EE_ANNUAL_MINES_GEOJSON + export_name + ".geojson",
+        GCLOUD_FINAL_DATA_GEOJSON + export_name + ".geojson",
+        GCLOUD_FINAL_DATA_GEOTIFF + export_name + ".tif",
+    ]
@@ -0,0 +1,198 @@
+import click
+import csv
+import hashlib
+import json
+import os
+import numpy as np
+import rasterio
+import geopandas as gpd
+
+from MTM_Annual_Extent.code.tiled_runner import active_mining_path
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    FIRST_LANDSAT_YEAR,
+    LOCAL_ANNUAL_DIR,
+    LOCAL_ACCURACY_POINTS,
+    LOCAL_ACCURACY_CACHE,
+)
+
+"""
+Local equivalent of the accuracy assessment in annualMiningArea.py (calculate_accuracy and create_accuracy_collection).
+
+The accuracy points are grouped by their YEAR property and each year's active mining raster is sampled at its points
+in one batched read: the points are bucketed by the raster's internal blocks and every block that holds a point is
+read once. A 2x2 error matrix (rows = CLASS, columns = mine/non-mine in the raster) is accumulated with np.bincount,
+and accuracy, kappa, and consumers' (user) and producers' accuracy are computed from it with the same definitions as
+ee.ConfusionMatrix.
+
+Matrices are cached in a JSON file keyed by the SHA-256 of the raster and of the points file, so years whose raster
+hasn't changed since the last run are not sampled again. The results are written with the same columns as the Earth
+Engine CSV export (system:index, accuracy, kappa, producer, user, year, .geo).
+"""
+
+CSV_COLUMNS = ["system:index", "accuracy", "kappa", "producer", "user", "year", ".geo"]
+BLANK_GEOMETRY = '{"type":"Point","coordinates":[0,0]}'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sample_raster(src, xs, ys):
+    """
+    Returns the band 1 values of src at the points (xs, ys) (in the raster's CRS) and a boolean array of the points that
+    fall inside the raster. Each internal block holding at least one point is read once.
+    """
+    rows, cols = rasterio.transform.rowcol(src.transform, xs, ys)
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    values = np.zeros(len(rows), dtype=src.dtypes[0])
+
+    block_h, block_w = src.block_shapes[0]
+    block_ids = (rows // block_h) * (-(-src.width // block_w)) + cols // block_w
+    for block_id in np.unique(block_ids[inside]):
+        in_block = inside & (block_ids == block_id)
+        r0 = rows[in_block][0] // block_h * block_h
+        c0 = cols[in_block][0] // block_w * block_w
+        window = rasterio.windows.Window(c0, r0, min(block_w, src.width - c0), min(block_h, src.height - r0))
+        block = src.read(1, window=window)
+        values[in_block] = block[rows[in_block] - r0, cols[in_block] - c0]
+    return values, inside
+
+
+def error_matrix(actual, predicted):
+    """
+    2x2 error matrix with rows = actual class and columns = predicted class (0 = non-mine, 1 = mine).
+    """
+    return np.bincount(actual * 2 + predicted, minlength=4).reshape(2, 2)
+
+
+def _divide(a, b):
+    return np.divide(a, b, out=np.zeros(np.shape(a), dtype=float), where=np.asarray(b) != 0)
+
+
+def matrix_statistics(matrix):
+    """
+    Returns {accuracy, kappa, producer, user} for an error matrix, matching ee.ConfusionMatrix accuracy(), kappa(),
+    producersAccuracy() and consumersAccuracy().
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    total = matrix.sum()
+    observed = float(_divide(np.trace(matrix), total))
+    expected = float(_divide(matrix.sum(axis=1) @ matrix.sum(axis=0), total**2))
+    return {
+        "accuracy": observed,
+        "kappa": float(_divide(observed - expected, 1 - expected)),
+        "producer": _divide(np.diag(matrix), matrix.sum(axis=1)).tolist(),
+        "user": _divide(np.diag(matrix), matrix.sum(axis=0)).tolist(),
+    }
+
+
+def load_points(points_path):
+    """
+    Reads the accuracy points and returns them grouped by year: {year: GeoDataFrame}.
+    """
+    points = gpd.read_file(points_path)[["YEAR", "CLASS", "geometry"]]
+    points["YEAR"] = points["YEAR"].astype(int)
+    points["CLASS"] = points["CLASS"].astype(int)
+    return {int(year): group for year, group in points.groupby("YEAR")}
+
+
+def year_matrix(raster_path, points):
+    """
+    Samples one year's raster at that year's points and returns the error matrix. Points outside of the raster are
+    dropped, as they are by sampleRegions.
+    """
+    with rasterio.open(raster_path) as src:
+        points = points.to_crs(src.crs)
+        values, inside = sample_raster(src, points.geometry.x.to_numpy(), points.geometry.y.to_numpy())
+    actual = points["CLASS"].to_numpy()[inside]
+    predicted = (values[inside] > 0).astype(int)
+    return error_matrix(actual, predicted)
+
+
+def read_cache(cache_path):
+    if not cache_path or not os.path.isfile(cache_path):
+        return {}
+    with open(cache_path) as f:
+        return json.load(f)
+
+
+def write_cache(cache, cache_path):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2)
+
+
+def assess_accuracy(raster_paths, points_path=LOCAL_ACCURACY_POINTS, cache_path=LOCAL_ACCURACY_CACHE):
+    """
+    Computes the accuracy statistics of every year in raster_paths ({year: path}). Returns {year: statistics}.
+    """
+    points_by_year = load_points(points_path)
+    points_sha = file_sha256(points_path)
+    cache = read_cache(cache_path)
+
+    results = {}
+    for year, raster_path in sorted(raster_paths.items()):
+        key = f"{file_sha256(raster_path)}:{points_sha}"
+        cached = cache.get(str(year))
+        if cached and cached["key"] == key:
+            matrix = cached["matrix"]
+            print(f"  > {year}: unchanged, using cached error matrix")
+        else:
+            if year in points_by_year:
+                matrix = year_matrix(raster_path, points_by_year[year]).tolist()
+            else:
+                matrix = [[0, 0], [0, 0]]
+            cache[str(year)] = {"key": key, "matrix": matrix}
+            print(f"  > {year}: sampled {int(np.sum(matrix))} points")
+        results[year] = matrix_statistics(matrix)
+
+    if cache_path:
+        write_cache(cache, cache_path)
+    return results
+
+
+def write_accuracy_csv(results, out_path):
+    """
+    Writes the results in the same format as the accuracyAssessmentResults_<year>.csv export from annualMiningArea.py.
+    """
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for index, (year, stats) in enumerate(sorted(results.items())):
+            writer.writerow(
+                {
+                    "system:index": str(index),
+                    "accuracy": stats["accuracy"],
+                    "kappa": stats["kappa"],
+                    "producer": json.dumps(stats["producer"], separators=(",", ":")),
+                    "user": json.dumps(stats["user"], separators=(",", ":")),
+                    "year": year,
+                    ".geo": BLANK_GEOMETRY,
+                }
+            )
+
+
+@click.command()
+@click.option("--first_year", default=FIRST_LANDSAT_YEAR, help="First year to assess.")
+@click.option("--last_year", default=PROCESSING_YEAR, help="Last year to assess (the PROVISIONAL year).")
+@click.option("--points", default=LOCAL_ACCURACY_POINTS, help="Accuracy assessment points with YEAR and CLASS properties.")
+@click.option("--cache", default=LOCAL_ACCURACY_CACHE, help="JSON cache of per-year error matrices.")
+def main(first_year: int, last_year: int, points: str, cache: str):
+    raster_paths = {year: active_mining_path(year, processing_year=last_year) for year in range(first_year, last_year + 1)}
+    print(f"Assessing accuracy for {first_year}-{last_year} against {points}")
+    results = assess_accuracy(raster_paths, points_path=points, cache_path=cache)
+
+    out_path = LOCAL_ANNUAL_DIR + f"accuracyAssessmentResults_{last_year}.csv"
+    write_accuracy_csv(results, out_path)
+    print(f"FINISHED. Accuracy results written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
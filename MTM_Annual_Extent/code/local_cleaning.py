@@ -0,0 +1,162 @@
+import click
+import os
+import numpy as np
+from skimage.measure import label
+
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    FIRST_LANDSAT_YEAR,
+    LOCAL_NODATA,
+    MIN_MINE_PIXELS,
+    LOCAL_ANNUAL_DIR,
+    LOCAL_RAW_STACK,
+    LOCAL_CLEANED_STACK,
+)
+
+"""
+Local NumPy equivalent of the null-value and noise cleaning chain in annualMiningArea.py (null_cleaning_fx1/2/3 and
+noise_cleaning_fx1/2).
+
+Input is a (years, rows, cols) uint8 stack of raw-mining rasters for FIRST_LANDSAT_YEAR through PROCESSING_YEAR, where
+1 = mine, 0 = non-mine and LOCAL_NODATA = null (the pixel was masked in the raw-mining image). Instead of looking up
+each year's neighbours through toList()/indexOf(), every pass compares the stack against itself shifted one year
+forward and back. The dummy years used in Earth Engine (initialCleaningYear and finalCleaningYear) are never
+materialized; their values are applied directly to the first and last year of the stack:
+    - Null cleaning: dummy value 0 (a null in the first or last year is never filled)
+    - Noise cleaning 1: dummy value 1 (a mine in the first or last year is never removed)
+    - Noise cleaning 2: dummy value 0 (a non-mine in the first or last year is never filled)
+
+The stack is processed in blocks of rows, so a memory-mapped cube covering the whole record is cleaned in a single pass
+with memory bounded by the block size.
+"""
+
+
+def null_cleaning(raw):
+    """
+    Null-value cleaning > Equivalent to null_cleaning_fx1, null_cleaning_fx2 and null_cleaning_fx3. A null pixel becomes
+    a mine if it was a mine in both the prior and future year, and a non-mine otherwise. Valid pixels keep their value.
+    """
+    null = raw == LOCAL_NODATA
+    mine = raw == 1
+
+    # Prior/future nulls are unmasked to 0 in Earth Engine, so only an actual mine value counts as a mine here.
+    fill = np.zeros_like(null)
+    fill[1:-1] = null[1:-1] & mine[:-2] & mine[2:]
+    return mine | fill
+
+
+def noise_cleaning_1(cleaned):
+    """
+    Noise cleaning 1 > Equivalent to noise_cleaning_fx1. Removes pixels that go from unmined->mine->unmined. Uses
+    dummy values of 1 for the boundary years.
+    """
+    noise = np.zeros_like(cleaned)
+    noise[1:-1] = cleaned[1:-1] & ~cleaned[:-2] & ~cleaned[2:]
+    return cleaned & ~noise
+
+
+def noise_cleaning_2(cleaned):
+    """
+    Noise cleaning 2 > Equivalent to noise_cleaning_fx2. Fills pixels that go from mined->unmined->mined. Uses dummy
+    values of 0 for the boundary years.
+    """
+    gap = np.zeros_like(cleaned)
+    gap[1:-1] = ~cleaned[1:-1] & cleaned[:-2] & cleaned[2:]
+    return cleaned | gap
+
+
+def clean_block(raw, study_area=None):
+    """
+    Runs the full null and noise cleaning chain on a (years, rows, cols) block of raw-mining data. Returns a uint8 block
+    where 1 = mine and 0 = non-mine. Pixels outside of the study area (when a boolean study_area block is given) are set
+    to LOCAL_NODATA, matching the clip(studyArea) in null_cleaning_fx1.
+    """
+    cleaned = noise_cleaning_2(noise_cleaning_1(null_cleaning(raw))).astype(np.uint8)
+    if study_area is not None:
+        cleaned[:, ~study_area] = LOCAL_NODATA
+    return cleaned
+
+
+def remove_small_components(mines, min_pixels=MIN_MINE_PIXELS):
+    """
+    Removes 8-connected groups of mine pixels smaller than min_pixels, equivalent to
+    connectedPixelCount().gte(min_pixels) in final_mine_processing_fx.
+    """
+    labels = label(mines, connectivity=2)
+    counts = np.bincount(labels.ravel())
+    keep = counts >= min_pixels
+    keep[0] = False
+    return keep[labels]
+
+
+def final_mine_processing(cleaned, exclusion, year, min_pixels=MIN_MINE_PIXELS):
+    """
+    Equivalent to final_mine_processing_fx for a single year. Keeps cleaned mine pixels that are not excluded by the
+    mask (exclusion = 1 where the USCB mask applies outside of mine permits), removes small detections, and labels the
+    remaining pixels with the year. Returns a uint16 array of year = mine, 0 = non-mine.
+    """
+    mines = (cleaned == 1) & (exclusion == 0)
+    mines = remove_small_components(mines, min_pixels=min_pixels)
+    return (mines * np.uint16(year)).astype(np.uint16)
+
+
+def clean_stack(raw, out=None, study_area=None, block_rows=256):
+    """
+    Cleans a (years, rows, cols) raw-mining stack in row blocks. raw and out can be in-memory arrays or memory-mapped
+    arrays (see open_stack and create_stack); if out is not given a new in-memory array is returned.
+    """
+    if raw.ndim != 3:
+        raise ValueError(f"Expected a (years, rows, cols) stack, got an array with shape {raw.shape}")
+    if out is None:
+        out = np.empty(raw.shape, dtype=np.uint8)
+
+    rows = raw.shape[1]
+    for r0 in range(0, rows, block_rows):
+        r1 = min(r0 + block_rows, rows)
+        sa_block = None if study_area is None else study_area[r0:r1]
+        out[:, r0:r1] = clean_block(np.asarray(raw[:, r0:r1]), study_area=sa_block)
+    return out
+
+
+def open_stack(path, mode="r"):
+    """
+    Opens a (years, rows, cols) uint8 .npy stack as a memory-mapped array.
+    """
+    return np.load(path, mmap_mode=mode)
+
+
+def create_stack(path, shape):
+    """
+    Creates an empty (years, rows, cols) uint8 .npy stack on disk and returns it as a writable memory-mapped array.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=tuple(shape))
+
+
+def stack_years(n_years, first_year=FIRST_LANDSAT_YEAR):
+    """
+    Returns the list of years covered by a stack with n_years layers.
+    """
+    return list(range(first_year, first_year + n_years))
+
+
+@click.command()
+@click.option("--raw_stack", default=LOCAL_RAW_STACK, help="Path to the (years, rows, cols) uint8 raw-mining .npy stack.")
+@click.option("--out_stack", default=LOCAL_CLEANED_STACK, help="Path for the cleaned .npy stack.")
+@click.option("--block_rows", default=256, help="Number of rows cleaned per block.")
+def main(raw_stack: str, out_stack: str, block_rows: int):
+    os.makedirs(LOCAL_ANNUAL_DIR, exist_ok=True)
+    raw = open_stack(raw_stack)
+    years = stack_years(raw.shape[0])
+    if years[-1] != PROCESSING_YEAR:
+        print(f"  > WARNING: stack ends at {years[-1]}, PROCESSING_YEAR is {PROCESSING_YEAR}")
+
+    print(f"Cleaning {raw.shape[0]} years ({years[0]}-{years[-1]}) of {raw.shape[1]} x {raw.shape[2]} pixels")
+    out = create_stack(out_stack, raw.shape)
+    clean_stack(raw, out=out, block_rows=block_rows)
+    out.flush()
+    print(f"  > Cleaned stack written to {out_stack}")
+
+
+if __name__ == "__main__":
+    main()
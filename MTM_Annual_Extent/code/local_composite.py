@@ -0,0 +1,223 @@
+import click
+import datetime
+import os
+import re
+import time
+import numpy as np
+import rasterio
+from multiprocessing import Pool
+
+from MTM_Annual_Extent.code.tiled_runner import tile_windows
+from mtm_utils.landsat_harmonization import local_indices
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    FIRST_LANDSAT_YEAR,
+    GPC_BANDS,
+    GPC_AUX_BANDS,
+    LOCAL_SCENE_DIR,
+    LOCAL_COMPOSITE_DIR,
+    LOCAL_TILE_SIZE,
+    COMPOSITE_MONTHS,
+)
+
+"""
+Local equivalent of the greenest pixel composite in greenestComp.py (qualityMosaic("NDVI") over the May-September
+scenes of a year).
+
+The scenes are co-registered GeoTIFFs on one grid with B, G, R, NIR bands, already cleaned and cloud-masked (masked
+pixels are nodata). The composite is built block by block: for each block, every scene is read in turn and a running
+state is kept per pixel:
+    - the best NDVI so far
+    - the B, G, R, NIR values of the scene that had it
+    - the number of scenes with a valid observation
+    - the day of year and sensor (Landsat mission number, from the LT05/LE07/LC08... file name prefix) of the greenest
+      scene
+A scene replaces the current values where its NDVI is strictly greater, so ties keep the earlier scene. Memory is
+O(bands x block) however many scenes there are, which makes it cheap to rebuild composites offline, e.g. to test a
+different saturation cut-off (max_value) on cached or synthetic scenes.
+
+The output has the same bands as the Earth Engine composite (B, G, R, NIR, NDVI; NaN where no scene was valid) and the
+same composite_<year>.tif name, so it can be ingested by gpc_cube.py. The provenance is written to a separate uint16
+composite_aux_<year>.tif with the DOY, SENSOR and COUNT bands of the GCLOUD_EE_GPC_AUX_DIR exports (0 = no valid
+observation).
+"""
+
+SCENE_DATE = re.compile(r"(?<!\d)((?:19|20)\d{2})(\d{2})(\d{2})(?!\d)")
+SCENE_BANDS = GPC_BANDS[:4]
+SCENE_SENSOR = re.compile(r"^L[A-Z]0?(\d)_")
+
+
+def scene_date(path):
+    """
+    Acquisition date from a scene file name (the first YYYYMMDD token, e.g. LT05_L1TP_018034_19880712_...).
+    """
+    match = SCENE_DATE.search(os.path.basename(path))
+    if not match:
+        raise ValueError(f"No YYYYMMDD acquisition date in {path}")
+    return datetime.date(*(int(g) for g in match.groups()))
+
+
+def scene_sensor(path):
+    """
+    Landsat mission number from a scene file name (LT05_... = 5), or 0 if the name has no sensor prefix.
+    """
+    match = SCENE_SENSOR.match(os.path.basename(path))
+    return int(match.group(1)) if match else 0
+
+
+def year_scenes(scene_dir, year, months=COMPOSITE_MONTHS):
+    """
+    Sorted (by date) scene paths acquired in the given months of year.
+    """
+    scenes = []
+    for name in os.listdir(scene_dir):
+        if not name.endswith(".tif"):
+            continue
+        path = os.path.join(scene_dir, name)
+        date = scene_date(path)
+        if date.year == year and months[0] <= date.month <= months[1]:
+            scenes.append((date, path))
+    return [path for _, path in sorted(scenes)]
+
+
+class CompositeAccumulator:
+    """
+    Running greenest pixel state for one block.
+    """
+
+    def __init__(self, shape):
+        self.best_ndvi = np.full(shape, -np.inf, dtype=np.float32)
+        self.bands = np.full((len(SCENE_BANDS),) + tuple(shape), np.nan, dtype=np.float32)
+        self.count = np.zeros(shape, dtype=np.uint16)
+        self.doy = np.zeros(shape, dtype=np.uint16)
+        self.sensor = np.zeros(shape, dtype=np.uint16)
+        # NDVI of the scene being added and the denominator scratch, reused by every scene of the block
+        self._ndvi = np.empty((1,) + tuple(shape), dtype=np.float32)
+        self._scratch = np.empty(shape, dtype=np.float32)
+
+    def add(self, bands, valid, doy=0, sensor=0):
+        """
+        Adds one scene: bands is a (4, rows, cols) float32 B/G/R/NIR block and valid a boolean block, doy and sensor
+        describe the scene. Returns the boolean block of pixels where this scene is now the greenest.
+        """
+        scene_ndvi = local_indices(bands, bands=SCENE_BANDS, out=self._ndvi, scratch=self._scratch)[0]
+        valid = valid & np.isfinite(scene_ndvi)
+        better = valid & (scene_ndvi > self.best_ndvi)
+
+        self.best_ndvi[better] = scene_ndvi[better]
+        self.bands[:, better] = bands[:, better]
+        self.doy[better] = doy
+        self.sensor[better] = sensor
+        self.count += valid
+        return better
+
+    def composite(self):
+        """
+        (5, rows, cols) B, G, R, NIR, NDVI block, NaN where no scene was valid.
+        """
+        best = np.where(self.count > 0, self.best_ndvi, np.nan).astype(np.float32)
+        return np.concatenate([self.bands, best[None]])
+
+    def provenance(self):
+        """
+        (3, rows, cols) uint16 DOY, SENSOR, COUNT block.
+        """
+        return np.stack([self.doy, self.sensor, self.count])
+
+
+def read_scene(src, window, max_value=None):
+    """
+    Reads a B/G/R/NIR block of a scene as float32 with its valid-pixel mask. Pixels where any band is at or above
+    max_value are treated as saturated and masked (the outlierValue of cleaner in greenestComp.py).
+    """
+    block = src.read(window=window, masked=True).astype(np.float32)
+    valid = ~np.ma.getmaskarray(block).any(axis=0)
+    bands = block.filled(np.nan)
+    if max_value is not None:
+        valid &= ~(bands >= max_value).any(axis=0)
+    return bands, valid
+
+
+def composite_year(args):
+    """
+    Pool worker > Builds one year's composite from its scenes block by block. Returns (year, number of scenes, seconds).
+    """
+    year, scene_paths, out_path, aux_path, block_size, max_value = args
+    start = time.time()
+    sources = [rasterio.open(path) for path in scene_paths]
+    try:
+        reference = sources[0]
+        for src in sources:
+            if src.count != len(SCENE_BANDS) or src.shape != reference.shape or src.transform != reference.transform:
+                raise ValueError(f"{src.name} is not a co-registered {'/'.join(SCENE_BANDS)} scene")
+
+        profile = reference.profile.copy()
+        profile.update(
+            driver="GTiff",
+            dtype="float32",
+            count=len(GPC_BANDS),
+            nodata=np.nan,
+            tiled=True,
+            blockxsize=256,
+            blockysize=256,
+            compress="deflate",
+            predictor=3,
+        )
+        aux_profile = profile.copy()
+        aux_profile.update(dtype="uint16", count=len(GPC_AUX_BANDS), nodata=None, predictor=2)
+        scene_info = [(scene_date(path).timetuple().tm_yday, scene_sensor(path)) for path in scene_paths]
+
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with rasterio.open(out_path, "w", **profile) as dst, rasterio.open(aux_path, "w", **aux_profile) as aux:
+            dst.descriptions = tuple(GPC_BANDS)
+            aux.descriptions = tuple(GPC_AUX_BANDS)
+            for window, _, _ in tile_windows(reference.height, reference.width, tile_size=block_size, halo=0):
+                state = CompositeAccumulator((int(window.height), int(window.width)))
+                for src, (doy, sensor) in zip(sources, scene_info):
+                    state.add(*read_scene(src, window, max_value=max_value), doy=doy, sensor=sensor)
+                dst.write(state.composite(), window=window)
+                aux.write(state.provenance(), window=window)
+    finally:
+        for src in sources:
+            src.close()
+    return year, len(scene_paths), time.time() - start
+
+
+def composite_path(year, out_dir=LOCAL_COMPOSITE_DIR):
+    return out_dir + f"composite_{year}.tif"
+
+
+def composite_aux_path(year, out_dir=LOCAL_COMPOSITE_DIR):
+    return out_dir + f"composite_aux_{year}.tif"
+
+
+def run_composites(years, scene_dir=LOCAL_SCENE_DIR, block_size=LOCAL_TILE_SIZE, max_value=None, processes=None):
+    tasks = []
+    for year in years:
+        scenes = year_scenes(scene_dir, year)
+        if not scenes:
+            print(f"  > {year}: no scenes in {scene_dir}. PASSING.")
+            continue
+        tasks.append((year, scenes, composite_path(year), composite_aux_path(year), block_size, max_value))
+
+    with Pool(processes) as pool:
+        for year, n_scenes, seconds in pool.imap_unordered(composite_year, tasks):
+            print(f"  > {year}: composite of {n_scenes} scenes written to {composite_path(year)} ({seconds:.1f}s)")
+
+
+@click.command()
+@click.option("--first_year", default=FIRST_LANDSAT_YEAR, help="First year to composite.")
+@click.option("--last_year", default=PROCESSING_YEAR, help="Last year to composite.")
+@click.option("--scene_dir", default=LOCAL_SCENE_DIR, help="Directory of co-registered B/G/R/NIR scene GeoTIFFs.")
+@click.option("--block_size", default=LOCAL_TILE_SIZE, help="Block size in pixels.")
+@click.option("--max_value", default=None, type=float, help="Mask pixels where any band is at or above this value.")
+@click.option("--processes", default=None, type=int, help="Number of worker processes (default: all cores).")
+def main(first_year: int, last_year: int, scene_dir: str, block_size: int, max_value: float, processes: int):
+    years = list(range(first_year, last_year + 1))
+    print(f"Compositing {first_year}-{last_year} from {scene_dir}")
+    run_composites(years, scene_dir=scene_dir, block_size=block_size, max_value=max_value, processes=processes)
+    print(f"FINISHED. Composites written to {LOCAL_COMPOSITE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import click
+import os
+import re
+import time
+import numpy as np
+import rasterio
+
+from MTM_Annual_Extent.code.incremental import invalidated_years
+from MTM_Annual_Extent.code.tiled_runner import active_mining_path, tile_windows, year_raster_profile
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    INITIAL_CLEANING_YEAR,
+    LOCAL_TILE_SIZE,
+    LOCAL_CUMULATIVE_MINING_DIR,
+)
+
+"""
+Local, streaming equivalent of the cumulative mining exports in annualMiningArea.py (qualityMosaic("year") over the
+annual images).
+
+Every annual active mining raster holds the year where a pixel was mined and 0 elsewhere, so the "last mined year"
+footprint is a running np.maximum over the years. The rasters are read block by block (one block per input is held in
+memory) and up to three cumulative rasters are written from the same pass:
+    - Final: every year before the processing year (CumulativeMineArea_<first>-<P - 1>.tif)
+    - Provisional: every year up to and including the processing year (CumulativeMineArea_<first>-<P>_PROVISIONAL.tif)
+    - Base: every year that can't be changed by the next processing year (CumulativeMineArea_<first>-<base>.tif). The
+      temporal cleaning lets a new year P + 1 change the annual outputs of P - 2 through P + 1 (see incremental.py),
+      so the base footprint stops at P - 3.
+
+The next run only needs the base raster plus the annual rasters after it (the years the new processing year
+invalidated, and the new year itself) to produce its final, provisional, and base rasters.
+"""
+
+CUMULATIVE_PATTERN = re.compile(r"CumulativeMineArea_(\d{4})-(\d{4})\.tif$")
+
+
+def cumulative_path(first_year, last_year, provisional=False, out_dir=LOCAL_CUMULATIVE_MINING_DIR):
+    """
+    Local equivalent of the GCLOUD_EE_ANNUAL_MINES_CUMULATIVE_TIFF naming.
+    """
+    suffix = "_PROVISIONAL" if provisional else ""
+    return out_dir + f"CumulativeMineArea_{first_year}-{last_year}{suffix}.tif"
+
+
+def cumulative_years(path):
+    """
+    Returns the (first_year, last_year) covered by a (non-provisional) cumulative raster, from its file name.
+    """
+    match = CUMULATIVE_PATTERN.search(path)
+    if not match:
+        raise ValueError(f"{path} is not a CumulativeMineArea_<first>-<last>.tif raster")
+    return int(match.group(1)), int(match.group(2))
+
+
+def base_year(processing_year):
+    """
+    The last year whose annual output can't be changed by processing_year + 1.
+    """
+    return min(invalidated_years([processing_year + 1], INITIAL_CLEANING_YEAR, processing_year + 1)) - 1
+
+
+def stream_cumulative(year_paths, outputs, base_path=None, block_size=LOCAL_TILE_SIZE):
+    """
+    Folds the annual rasters in year_paths ({year: path}) into a running maximum, block by block, starting from the
+    cumulative raster at base_path (or from 0). outputs maps {year: path}: the running maximum is written to path once
+    every year up to and including that year has been added. All rasters must share the same grid.
+    """
+    years = sorted(year_paths)
+    missing = [year for year in outputs if year > years[-1] or (base_path is None and year < years[0])]
+    if missing:
+        raise ValueError(f"No annual raster to complete the cumulative output(s) for {missing}")
+
+    sources = [rasterio.open(year_paths[year]) for year in years]
+    base = rasterio.open(base_path) if base_path is not None else None
+    reference = base or sources[0]
+    profile = year_raster_profile(reference.profile)
+    height, width = reference.height, reference.width
+
+    for path in outputs.values():
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    dsts = {year: rasterio.open(path, "w", **profile) for year, path in outputs.items()}
+
+    try:
+        for window, _, _ in tile_windows(height, width, tile_size=block_size, halo=0):
+            if base is not None:
+                running = base.read(1, window=window, out_dtype=np.uint16)
+            else:
+                running = np.zeros((int(window.height), int(window.width)), dtype=np.uint16)
+
+            # Outputs that end before the first annual raster only need the base footprint
+            for year, dst in dsts.items():
+                if year < years[0]:
+                    dst.write(running, 1, window=window)
+
+            for year, src in zip(years, sources):
+                # The annual rasters exported by Earth Engine are int32 (.toInt()), years fit in uint16
+                np.maximum(running, src.read(1, window=window, out_dtype=np.uint16), out=running)
+                if year in dsts:
+                    dsts[year].write(running, 1, window=window)
+    finally:
+        for src in sources:
+            src.close()
+        if base is not None:
+            base.close()
+        for dst in dsts.values():
+            dst.close()
+
+
+def build_cumulative(processing_year, first_year, base_path=None, block_size=LOCAL_TILE_SIZE):
+    """
+    Writes the final, provisional and base cumulative rasters for processing_year. With base_path (the base raster of
+    an earlier run) only the annual rasters after its last year are read; otherwise every year from first_year is read.
+    Returns the {year: path} of the written rasters.
+    """
+    stable_year = base_year(processing_year)
+    if base_path is not None:
+        first_year, base_last_year = cumulative_years(base_path)
+        if base_last_year > stable_year:
+            raise ValueError(
+                f"{base_path} includes years up to {base_last_year}, which can change when processing {processing_year}"
+            )
+        start_year = base_last_year + 1
+    else:
+        start_year = first_year
+
+    year_paths = {
+        year: active_mining_path(year, processing_year=processing_year)
+        for year in range(start_year, processing_year + 1)
+    }
+    outputs = {
+        processing_year - 1: cumulative_path(first_year, processing_year - 1),
+        processing_year: cumulative_path(first_year, processing_year, provisional=True),
+    }
+    if stable_year >= first_year:
+        outputs.setdefault(stable_year, cumulative_path(first_year, stable_year))
+
+    stream_cumulative(year_paths, outputs, base_path=base_path, block_size=block_size)
+    return outputs
+
+
+@click.command()
+@click.option("--processing_year", default=PROCESSING_YEAR, help="Processing (PROVISIONAL) year.")
+@click.option("--first_year", default=INITIAL_CLEANING_YEAR + 2, help="First year of the cumulative footprint.")
+@click.option("--base_cumulative", default=None, help="Base cumulative raster from an earlier run to update.")
+@click.option("--block_size", default=LOCAL_TILE_SIZE, help="Block size in pixels.")
+def main(processing_year: int, first_year: int, base_cumulative: str, block_size: int):
+    start = time.time()
+    if base_cumulative:
+        print(f"Updating {base_cumulative} to {processing_year}")
+    else:
+        print(f"Building the cumulative footprint for {first_year}-{processing_year}")
+
+    outputs = build_cumulative(processing_year, first_year, base_path=base_cumulative, block_size=block_size)
+    for path in outputs.values():
+        print(f"  > {path}")
+    print(f"FINISHED in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import click
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import rasterio
+import geopandas as gpd
+from multiprocessing import Pool
+from rasterio.features import rasterize
+
+from MTM_Annual_Extent.code.gpc_cube import GPCCube
+from MTM_Annual_Extent.code.local_composite import composite_aux_path
+from MTM_Annual_Extent.code.threshold_sketch import CountyHistogram
+from MTM_Annual_Extent.code.tiled_runner import raw_mining_path, tile_windows
+from mtm_utils.exclusion_mask import local_threshold_exclusion
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    FIRST_LANDSAT_YEAR,
+    FIPS_CODES,
+    GPC_AUX_BANDS,
+    LOCAL_NODATA,
+    LOCAL_TILE_SIZE,
+    LOCAL_GPC_CUBE,
+    LOCAL_COUNTIES,
+    LOCAL_COUNTY_LABELS,
+    LOCAL_THRESHOLD_DIR,
+    THRESHOLD_PERCENTILES,
+)
+
+"""
+Local equivalent of the per-county NDVI thresholds in annualThresholdImages.py (reduceRegion with
+ee.Reducer.intervalMean(0, 3) per county, mosaicked into one image per year), and of raw_mining_fx in
+annualMiningArea.py.
+
+The counties are rasterized once onto the GPC cube grid (pixel centers, like reduceRegion at 30m) into a label raster,
+where label i + 1 is FIPS_CODES[i] and 0 is outside of the counties. Its file name carries a hash of the counties file,
+the FIPS codes and the grid, so it is rasterized again when any of them changes. For each year, the valid NDVI pixels
+(not masked in the composite and not excluded by the mask) are sorted by (label, NDVI) with a single np.lexsort, which
+places every county's values in ascending order next to each other. The rank of each value within its county then
+follows from the county counts, and the interval mean is the mean of the values ranked in [floor(low% * n),
+ceil(high% * n)) of each county's n values (at least one value). Earth Engine computes percentiles from a histogram, so
+the two agree to within the spacing of the values around the 3rd percentile.
+
+With --aux_dir, the COUNT band of each year's provenance raster (composite_aux_<year>.tif) marks the pixels without a
+valid observation as null in the raw-mining rasters directly, instead of relying on the composite's mask alone.
+
+With --mode sketch the values are instead streamed block by block into a per-county histogram (threshold_sketch.py),
+which bounds memory to O(counties x bins) at the cost of an error of at most one bin width.
+
+Years are independent and run in a process pool; the county labels are shared by the workers through a memory map.
+"""
+
+
+def rasterize_counties(counties_path, transform, shape, fips_codes=FIPS_CODES):
+    """
+    Returns an int16 label raster of the counties in fips_codes on the given grid (label i + 1 = fips_codes[i]).
+    """
+    counties = gpd.read_file(counties_path)
+    counties["FIPS"] = counties["FIPS"].astype(int)
+    counties = counties[counties["FIPS"].isin(fips_codes)]
+    label_of = {fips: i + 1 for i, fips in enumerate(fips_codes)}
+    return rasterize(
+        ((geom, label_of[fips]) for geom, fips in zip(counties.geometry, counties["FIPS"])),
+        out_shape=shape,
+        transform=transform,
+        fill=0,
+        dtype="int16",
+    )
+
+
+def county_labels_path(cube, counties_path=LOCAL_COUNTIES, fips_codes=FIPS_CODES, labels_path=LOCAL_COUNTY_LABELS):
+    """
+    Path of the label raster for the counties file, FIPS codes and cube grid: labels_path with a short hash of them.
+    """
+    digest = hashlib.sha256()
+    with open(counties_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    inputs = {
+        "counties": digest.hexdigest(),
+        "fips_codes": [int(fips) for fips in fips_codes],
+        "transform": list(cube.transform)[:6],
+        "crs": cube.crs.to_wkt(),
+        "shape": [cube.height, cube.width],
+    }
+    inputs_hash = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{os.path.splitext(labels_path)[0]}_{inputs_hash}.npy"
+
+
+def county_labels(cube, counties_path=LOCAL_COUNTIES, fips_codes=FIPS_CODES, labels_path=LOCAL_COUNTY_LABELS):
+    """
+    Rasterizes the county label raster for the cube grid unless it is already there. Returns its path.
+    """
+    path = county_labels_path(cube, counties_path=counties_path, fips_codes=fips_codes, labels_path=labels_path)
+    if not os.path.isfile(path):
+        print(f"  > Rasterizing {counties_path} to {path}")
+        labels = rasterize_counties(counties_path, cube.transform, (cube.height, cube.width), fips_codes=fips_codes)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.save(path + ".tmp.npy", labels)
+        os.replace(path + ".tmp.npy", path)
+    return path
+
+
+def county_interval_means(ndvi, labels, n_labels, percentiles=THRESHOLD_PERCENTILES, excluded=None):
+    """
+    Returns a float array of length n_labels + 1 with the interval mean of each county's valid NDVI values between the
+    given percentiles (NaN for counties without valid pixels, and for label 0).
+    """
+    valid = (labels > 0) & ~np.isnan(ndvi)
+    if excluded is not None:
+        valid &= ~excluded
+    values = ndvi[valid]
+    value_labels = labels[valid].astype(np.intp)
+
+    order = np.lexsort((values, value_labels))
+    values = values[order]
+    value_labels = value_labels[order]
+
+    counts = np.bincount(value_labels, minlength=n_labels + 1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ranks = np.arange(len(values)) - starts[value_labels]
+
+    low, high = percentiles
+    lo = np.floor(counts * low / 100).astype(np.intp)
+    hi = np.maximum(np.ceil(counts * high / 100).astype(np.intp), lo + 1)
+    in_interval = (ranks >= lo[value_labels]) & (ranks < hi[value_labels])
+
+    sums = np.bincount(value_labels[in_interval], weights=values[in_interval], minlength=n_labels + 1)
+    n = np.bincount(value_labels[in_interval], minlength=n_labels + 1)
+    means = np.full(n_labels + 1, np.nan)
+    np.divide(sums, n, out=means, where=n > 0)
+    means[0] = np.nan
+    return means
+
+
+def paint_thresholds(means, labels):
+    """
+    Paints each county's threshold onto the label raster (NaN outside of the counties).
+    """
+    return means.astype(np.float32)[labels]
+
+
+def raw_mining(ndvi, threshold, observations=None):
+    """
+    Equivalent to raw_mining_fx > 1 where the NDVI is at or below the county threshold, 0 where it is above it, and
+    LOCAL_NODATA where either is null. Returns the uint8 raw-mining input of local_cleaning.py and tiled_runner.py.
+    If the COUNT provenance band of the composite is given as observations, pixels without a valid observation are
+    null as well.
+    """
+    out = (ndvi <= threshold).astype(np.uint8)
+    null = np.isnan(ndvi) | np.isnan(threshold)
+    if observations is not None:
+        null |= observations == 0
+    out[null] = LOCAL_NODATA
+    return out
+
+
+def threshold_path(year, out_dir=LOCAL_THRESHOLD_DIR):
+    """
+    Same naming as the GCLOUD_EE_THRESHOLD_DIR exports.
+    """
+    return out_dir + f"threshold_0-3_{year}.tif"
+
+
+def read_exclusion(exclusion_path, shape, window=None):
+    if exclusion_path is None:
+        return None
+    with rasterio.open(exclusion_path) as src:
+        if (src.height, src.width) != shape:
+            raise ValueError(f"{exclusion_path} doesn't match the cube grid")
+        return local_threshold_exclusion(src.read(1, window=window))
+
+
+def read_observations(aux_path, shape, window=None):
+    """
+    COUNT band (number of valid observations) of a composite_aux_<year>.tif on the cube grid, or None without one.
+    """
+    if aux_path is None:
+        return None
+    with rasterio.open(aux_path) as src:
+        if (src.height, src.width) != shape:
+            raise ValueError(f"{aux_path} doesn't match the cube grid")
+        return src.read(GPC_AUX_BANDS.index("COUNT") + 1, window=window)
+
+
+def exact_means(cube, labels, year, exclusion_path=None):
+    """
+    County interval means from all of the year's NDVI values at once.
+    """
+    ndvi = cube.read(years=[year], bands=["NDVI"])[0, 0]
+    excluded = read_exclusion(exclusion_path, ndvi.shape)
+    return county_interval_means(ndvi, labels, len(FIPS_CODES), excluded=excluded)
+
+
+def sketch_means(cube, labels, year, exclusion_path=None, block_size=LOCAL_TILE_SIZE):
+    """
+    County interval means estimated from a CountyHistogram built one block of the composite at a time.
+    """
+    sketch = CountyHistogram(len(FIPS_CODES))
+    for window, _, _ in tile_windows(cube.height, cube.width, tile_size=block_size, halo=0):
+        rows, cols = window.toslices()
+        ndvi = cube.read(years=[year], bands=["NDVI"], window=window)[0, 0]
+        excluded = read_exclusion(exclusion_path, (cube.height, cube.width), window=window)
+        sketch.update(ndvi, labels[rows, cols], excluded=excluded)
+    return sketch.interval_means()
+
+
+def threshold_year(args):
+    """
+    Pool worker > Computes one year's county thresholds from the cube, writes the threshold raster, and optionally the
+    raw-mining raster, with the pixels without observations null if aux_dir is given. Returns (year, seconds).
+    """
+    year, cube_root, labels_path, exclusion_path, write_raw_mining, aux_dir, mode, block_size = args
+    start = time.time()
+
+    cube = GPCCube(cube_root)
+    labels = np.load(labels_path, mmap_mode="r")
+    if mode == "sketch":
+        means = sketch_means(cube, labels, year, exclusion_path=exclusion_path, block_size=block_size)
+    else:
+        means = exact_means(cube, labels, year, exclusion_path=exclusion_path)
+
+    profile = {
+        "driver": "GTiff",
+        "height": cube.height,
+        "width": cube.width,
+        "count": 1,
+        "crs": cube.crs,
+        "transform": cube.transform,
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+        "compress": "deflate",
+    }
+    out_path = threshold_path(year)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    threshold_dst = rasterio.open(out_path, "w", dtype="float32", nodata=np.nan, **profile)
+    raw_dst = None
+    aux_path = composite_aux_path(year, out_dir=aux_dir) if aux_dir is not None else None
+    if write_raw_mining:
+        raw_path = raw_mining_path(year)
+        os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+        raw_dst = rasterio.open(raw_path, "w", dtype="uint8", nodata=LOCAL_NODATA, **profile)
+
+    # The outputs are painted block by block, so the streaming mode never holds a full-size array
+    try:
+        for window, _, _ in tile_windows(cube.height, cube.width, tile_size=block_size, halo=0):
+            rows, cols = window.toslices()
+            threshold = paint_thresholds(means, labels[rows, cols])
+            threshold_dst.write(threshold, 1, window=window)
+            if raw_dst is not None:
+                ndvi = cube.read(years=[year], bands=["NDVI"], window=window)[0, 0]
+                observations = read_observations(aux_path, (cube.height, cube.width), window=window)
+                raw_dst.write(raw_mining(ndvi, threshold, observations=observations), 1, window=window)
+    finally:
+        threshold_dst.close()
+        if raw_dst is not None:
+            raw_dst.close()
+
+    return year, time.time() - start
+
+
+def run_thresholds(
+    years,
+    cube_root=LOCAL_GPC_CUBE,
+    counties_path=LOCAL_COUNTIES,
+    exclusion_path=None,
+    write_raw_mining=False,
+    aux_dir=None,
+    mode="exact",
+    block_size=LOCAL_TILE_SIZE,
+    processes=None,
+):
+    cube = GPCCube(cube_root)
+    missing = sorted(set(years) - set(cube.years))
+    if missing:
+        raise ValueError(f"Years {missing} are not in the GPC cube at {cube_root}")
+    if aux_dir is not None:
+        missing = [year for year in years if not os.path.isfile(composite_aux_path(year, out_dir=aux_dir))]
+        if missing:
+            raise ValueError(f"Years {missing} have no provenance raster in {aux_dir}")
+
+    labels_path = county_labels(cube, counties_path=counties_path)
+    tasks = [
+        (year, cube_root, labels_path, exclusion_path, write_raw_mining, aux_dir, mode, block_size)
+        for year in years
+    ]
+    with Pool(processes) as pool:
+        for year, seconds in pool.imap_unordered(threshold_year, tasks):
+            print(f"  > {year}: thresholds written to {threshold_path(year)} ({seconds:.1f}s)")
+
+
+@click.command()
+@click.option("--first_year", default=FIRST_LANDSAT_YEAR, help="First year to compute thresholds for.")
+@click.option("--last_year", default=PROCESSING_YEAR, help="Last year to compute thresholds for.")
+@click.option("--cube_dir", default=LOCAL_GPC_CUBE, help="GPC cube built by gpc_cube.py.")
+@click.option("--counties", default=LOCAL_COUNTIES, help="County polygons with a FIPS property.")
+@click.option("--exclusion_mask", default=None, help="Exclusion mask downloaded from gee_data/EXCLUSION_MASK/.")
+@click.option("--raw_mining", "write_raw_mining", is_flag=True, help="Also write the raw-mining rasters.")
+@click.option(
+    "--aux_dir",
+    default=None,
+    help="Directory of the composite_aux_<year>.tif provenance rasters (from gee_data/GPC_AUX/ or local_composite.py); "
+    "pixels without a valid observation are null in the raw-mining rasters.",
+)
+@click.option(
+    "--mode",
+    default="exact",
+    type=click.Choice(["exact", "sketch"]),
+    help="exact: sort all of a year's NDVI values; sketch: stream blocks into per-county histograms (bounded memory).",
+)
+@click.option("--block_size", default=LOCAL_TILE_SIZE, help="Block size in pixels for streaming and writing.")
+@click.option("--processes", default=None, type=int, help="Number of worker processes (default: all cores).")
+def main(
+    first_year: int,
+    last_year: int,
+    cube_dir: str,
+    counties: str,
+    exclusion_mask: str,
+    write_raw_mining: bool,
+    aux_dir: str,
+    mode: str,
+    block_size: int,
+    processes: int,
+):
+    years = list(range(first_year, last_year + 1))
+    print(f"Computing county NDVI thresholds for {first_year}-{last_year}")
+    run_thresholds(
+        years,
+        cube_root=cube_dir,
+        counties_path=counties,
+        exclusion_path=exclusion_mask,
+        write_raw_mining=write_raw_mining,
+        aux_dir=aux_dir,
+        mode=mode,
+        block_size=block_size,
+        processes=processes,
+    )
+    print(f"FINISHED. Threshold rasters written to {LOCAL_THRESHOLD_DIR}")
+
+
+if __name__ == "__main__":
+    main()
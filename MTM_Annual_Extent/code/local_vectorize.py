@@ -0,0 +1,152 @@
+import click
+import os
+import time
+import numpy as np
+import rasterio
+import geopandas as gpd
+from multiprocessing import Pool
+from rasterio.features import shapes
+from shapely.geometry import shape
+from shapely.ops import unary_union
+from skimage.measure import label
+
+from MTM_Annual_Extent.code.tiled_runner import active_mining_path
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    FIRST_LANDSAT_YEAR,
+    MIN_MINE_AREA,
+    LOCAL_ACTIVE_MINING_DIR,
+    LOCAL_ACTIVE_MINING_VECTOR_DIR,
+)
+
+"""
+Local replacement for the two Earth Engine vectorization steps of the annual mining data: the reduceToVectors /
+ee.Filter.gte("sum", 9000) area filter in annualMiningArea.py and the reduceToVectors / area(proj=EPSG:5072)
+conversion in annualMiningArea_vectorCreation.py.
+
+Each year's active mining raster (year = mine, 0 = non-mine) is labelled into 8-connected components, and the area of
+every component is summed from per-pixel areas on an equal-area basis in one weighted bincount. For a projected grid
+every pixel has the same area; for a geographic grid (EPSG:4326) the pixel area only depends on the row, and is
+computed on the authalic sphere so it matches an equal-area projection such as EPSG:5072. Components under MIN_MINE_AREA
+are dropped and the survivors are polygonized with rasterio (one MultiPolygon per component) and written with "year"
+and "AREA" (m2) attributes, in EPSG:4326, to GeoJSON or GeoParquet depending on the file extension.
+
+Years are independent, so they are vectorized in parallel in a process pool.
+"""
+
+# Radius (m) of the sphere with the same surface area as the WGS84 ellipsoid
+AUTHALIC_RADIUS = 6371007.181
+
+
+def row_pixel_areas(transform, crs, height):
+    """
+    Returns the area (m2) of a pixel in each of the height rows of a north-up grid.
+    """
+    if crs is not None and crs.is_geographic:
+        lat_edges = np.radians(transform.f + transform.e * np.arange(height + 1))
+        dlon = np.radians(abs(transform.a))
+        return AUTHALIC_RADIUS**2 * dlon * np.abs(np.diff(np.sin(lat_edges)))
+    return np.full(height, abs(transform.a * transform.e))
+
+
+def component_areas(mines, row_areas):
+    """
+    Labels the 8-connected components of a boolean mine array. Returns (labels, areas), where areas[i] is the area (m2)
+    of component i (areas[0] is the background).
+    """
+    labels = label(mines, connectivity=2)
+    row_weights = np.broadcast_to(row_areas[:, None], labels.shape)
+    areas = np.bincount(labels.ravel(), weights=row_weights.ravel())
+    areas[0] = 0
+    return labels, areas
+
+
+def filter_components(mines, row_areas, min_area=MIN_MINE_AREA):
+    """
+    Drops components smaller than min_area (m2). Returns the labels of the kept components (0 elsewhere) and the area of
+    every label.
+    """
+    labels, areas = component_areas(mines, row_areas)
+    keep = areas >= min_area
+    keep[0] = False
+    labels[~keep[labels]] = 0
+    return labels, areas
+
+
+def polygonize(labels, areas, year, transform, crs):
+    """
+    Converts the labelled components into a GeoDataFrame with one (Multi)Polygon per component and "year" and "AREA"
+    attributes, reprojected to EPSG:4326.
+    """
+    parts = {}
+    for geom, value in shapes(labels.astype(np.int32), mask=labels > 0, connectivity=8, transform=transform):
+        parts.setdefault(int(value), []).append(shape(geom))
+
+    ids = sorted(parts)
+    geometries = [unary_union(parts[i]) if len(parts[i]) > 1 else parts[i][0] for i in ids]
+    gdf = gpd.GeoDataFrame(
+        {"year": [int(year)] * len(ids), "AREA": [float(areas[i]) for i in ids]}, geometry=geometries, crs=crs
+    )
+    return gdf.to_crs("EPSG:4326")
+
+
+def write_vectors(gdf, out_path):
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    if out_path.endswith(".parquet"):
+        gdf.to_parquet(out_path)
+    else:
+        gdf.to_file(out_path, driver="GeoJSON")
+
+
+def vectorize_year(args):
+    """
+    Pool worker > Reads one year's active mining raster, removes components smaller than min_area, and writes the
+    remaining components to out_path. Returns (year, number of features, seconds).
+    """
+    year, raster_path, out_path, min_area = args
+    start = time.time()
+
+    with rasterio.open(raster_path) as src:
+        mines = src.read(1) > 0
+        transform, crs = src.transform, src.crs
+
+    labels, areas = filter_components(mines, row_pixel_areas(transform, crs, mines.shape[0]), min_area=min_area)
+    del mines
+    gdf = polygonize(labels, areas, year, transform, crs)
+    write_vectors(gdf, out_path)
+    return year, len(gdf), time.time() - start
+
+
+def vector_path(raster_path, out_dir=LOCAL_ACTIVE_MINING_VECTOR_DIR, extension="geojson"):
+    """
+    Same naming as the GCLOUD_EE_ANNUAL_MINES_GEOJSON exports: the raster file name with a new extension.
+    """
+    name = os.path.basename(raster_path).rsplit(".tif", 1)[0]
+    return out_dir + f"{name}.{extension}"
+
+
+def run_vectorize(years, raster_paths, out_paths, min_area=MIN_MINE_AREA, processes=None):
+    tasks = [(year, r, o, min_area) for year, r, o in zip(years, raster_paths, out_paths)]
+    with Pool(processes) as pool:
+        for year, n_features, seconds in pool.imap_unordered(vectorize_year, tasks):
+            print(f"  > {year}: {n_features} features ({seconds:.1f}s)")
+
+
+@click.command()
+@click.option("--first_year", default=FIRST_LANDSAT_YEAR, help="First year to vectorize.")
+@click.option("--last_year", default=PROCESSING_YEAR, help="Last year to vectorize (the PROVISIONAL year).")
+@click.option("--min_area", default=MIN_MINE_AREA, help="Minimum area (m2) of a detection.")
+@click.option("--file_format", default="geojson", type=click.Choice(["geojson", "parquet"]), help="Output format.")
+@click.option("--processes", default=None, type=int, help="Number of worker processes (default: all cores).")
+def main(first_year: int, last_year: int, min_area: float, file_format: str, processes: int):
+    years = list(range(first_year, last_year + 1))
+    raster_paths = [active_mining_path(year, processing_year=last_year) for year in years]
+    out_paths = [vector_path(path, extension=file_format) for path in raster_paths]
+
+    print(f"Vectorizing {len(years)} years ({first_year}-{last_year}) from {LOCAL_ACTIVE_MINING_DIR}")
+    run_vectorize(years, raster_paths, out_paths, min_area=min_area, processes=processes)
+    print(f"FINISHED. Annual active mining vectors written to {LOCAL_ACTIVE_MINING_VECTOR_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,38 @@
+import click
+import contextlib
 import os
+import importlib.util
 import pandas as pd
 import geopandas as gpd
 import glob
-from google.cloud import storage
+import shapely
+import time
+from multiprocessing import Pool
+import rasterio
 import requests
-import wget
 from zipfile import ZipFile
 from osgeo import gdal, ogr, osr
-
-
+from rasterio.io import MemoryFile
+
+
+from mtm_utils.clients import get_bucket, get_object_index
+from mtm_utils.downloads import Downloader
+from mtm_utils.grid_dissolve import grid_dissolve
+from mtm_utils.mask_raster import (
+    interim_profile,
+    mask_grid,
+    mercator_scale,
+    rasterize_dilated_windows,
+    rasterize_windows,
+    warp_windows,
+)
 from mtm_utils.variables import (
     PROCESSING_YEAR,
     MASK_DIR,
     MASK_INTERIM,
     MASK_FINAL,
+    MASK_BUFFER,
+    MASK_PIXEL_SIZE,
     FIPS_CODES,
     STUDY_AREA_GJS,
     STUDY_AREA_SHP,
@@ -51,35 +70,25 @@ def data_download():
     print(
         f"Beginning the MTM Mask creation process; downloading data from the USCB for the year {PROCESSING_YEAR}."
     )
-    max_fips_codes = len(FIPS_CODES)
+    # Files are downloaded in parallel, resumed if interrupted, and served from DOWNLOAD_CACHE when unchanged
+    downloader = Downloader()
 
     """
     Download USCB data for Area water, linear water, and roads.
     """
-    print("     > Downloading Roads, Area Water, and Linear Water data...")
-    for i in range(max_fips_codes):
-        # Define file names using processing year and FIPS codes
-        roads_file = f"tl_{PROCESSING_YEAR}_{FIPS_CODES[i]}_roads.zip"
-        areaW_file = f"tl_{PROCESSING_YEAR}_{FIPS_CODES[i]}_areawater.zip"
-        lineW_file = f"tl_{PROCESSING_YEAR}_{FIPS_CODES[i]}_linearwater.zip"
-
-        # Define the URLs for the data stored by USCB for download
-        rd_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}/ROADS/{roads_file}"
-        aw_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}/AREAWATER/{areaW_file}"
-        lw_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}/LINEARWATER/{lineW_file}"
-
-        # Download the data from USCB
-        wget.download(rd_url, out=USCB_ZIP)
-        wget.download(aw_url, out=USCB_ZIP)
-        wget.download(lw_url, out=USCB_ZIP)
-    print("     > Done")
+    urls = []
+    for fips in FIPS_CODES:
+        # Define the URLs for the data stored by USCB for download, using processing year and FIPS codes
+        tiger_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}"
+        urls.append(f"{tiger_url}/ROADS/tl_{PROCESSING_YEAR}_{fips}_roads.zip")
+        urls.append(f"{tiger_url}/AREAWATER/tl_{PROCESSING_YEAR}_{fips}_areawater.zip")
+        urls.append(f"{tiger_url}/LINEARWATER/tl_{PROCESSING_YEAR}_{fips}_linearwater.zip")
 
     """
     Download USCB data for Urban Areas data. Check to see if data using the 2010 UAC is available for the current year,
     which included smaller areas called urban clusters, and if it is not available, download it from 2022 which is a
     year where it is known to be provided.
     """
-    print("     > Downloading Urban Areas data...")
     uac_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}/UAC20/tl_{PROCESSING_YEAR}_us_uac20.zip"
     # https://www2.census.gov/geo/tiger/TIGER2024/UAC20/tl_2024_us_uac20.zip
     uac_10_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}/UAC/tl_{PROCESSING_YEAR}_us_uac10.zip"
@@ -87,24 +96,24 @@ def data_download():
     # Check if the UAC is listed as UAC or UAC20
     if url_exists(uac_url):
         print(f"URL Exists: {uac_url}")
-        wget.download(uac_url, out=USCB_ZIP)
-        print("     > Done")
     else:
         uac_url = f"https://www2.census.gov/geo/tiger/TIGER{PROCESSING_YEAR}/UAC/tl_{PROCESSING_YEAR}_us_uac20.zip"
-        wget.download(uac_url, out=USCB_ZIP)
         print(f"     > UAC for {PROCESSING_YEAR} listed as UAC and not UAC20.")
+    urls.append(uac_url)
 
     # Check if the UAC10 exists
     if url_exists(uac_10_url):
         print(f"URL Exists: {uac_10_url}")
-        wget.download(uac_10_url, out=USCB_ZIP)
-        print("     > Done")
     else:
         uac_10_url = (
             "https://www2.census.gov/geo/tiger/TIGER2022/UAC/tl_2022_us_uac10.zip"
         )
-        wget.download(uac_10_url, out=USCB_ZIP)
-        print("     > 2010 UAC downloaded from 2022 Directory.")
+        print("     > 2010 UAC will be downloaded from 2022 Directory.")
+    urls.append(uac_10_url)
+
+    print(f"     > Downloading Roads, Area Water, Linear Water, and Urban Areas data ({len(urls)} files)...")
+    downloader.fetch_all(urls, USCB_ZIP)
+    print("     > Done")
 
     """
     Download the SkyTruth MTM Study Area bounds, if they have not been downloaded.
@@ -117,7 +126,7 @@ def data_download():
         print("     > Done")
     else:
         print("     > Downloading MTM Study Area boundary...")
-        wget.download(study_area_url, out=STUDY_AREA_ZIP)
+        downloader.fetch(study_area_url, STUDY_AREA_ZIP)
         print("     > Done")
 
 
@@ -190,7 +199,20 @@ def data_processing():
     print("\nFINISHED CONVERSION TO GEOJSON\n")
 
 
-def mask_creation():
+def buffer_dissolve(gdf, study_area=None, pool=None):
+    """
+    Buffers the exploded features of a USCB layer by MASK_BUFFER meters in EPSG:5072 and dissolves them into a single
+    feature on a grid of MASK_DISSOLVE_CELL cells (grid_dissolve, parallel over the cells if a Pool is given). Layers
+    that extend beyond the study area (the national urban areas) are clipped to it first.
+    """
+    if study_area is not None:
+        gdf = gdf.to_crs(4326).clip(study_area)
+    exploded_gdf = gdf.to_crs(5072).explode(index_parts=False)
+    buffered = exploded_gdf.geometry.buffer(MASK_BUFFER).to_numpy()
+    return gpd.GeoDataFrame(geometry=[grid_dissolve(buffered, pool=pool)], crs=exploded_gdf.crs)
+
+
+def mask_creation(processes=None):
     print("\n\nBEGINNING MASK CREATION PROCESS - GEOJSON MERGE\n\n")
     geojson_list = sorted(
         list(filter(lambda geojson: ".geojson" in geojson, os.listdir(USCB_GJS)))
@@ -206,24 +228,14 @@ def mask_creation():
 
     else:
         processed_geojson = []
-        for i in geojson_list:
-            if "uac" in i:
-                print("Processing Urban Areas data, clipping to study area bounds")
-                gdf = gpd.read_file(USCB_GJS + i)
-                reproj_gdf = gdf.to_crs(4326)
-                gdf_clipped = reproj_gdf.clip(mtm_study_area)  # , keep_geom_type=True)
-                reproj = gdf_clipped.to_crs(5072)
-                exploded_gdf = reproj.explode(index_parts=False)
-                exploded_gdf["geometry"] = exploded_gdf.geometry.buffer(60)
-                dissolved = exploded_gdf.dissolve()
-                processed_geojson.append(dissolved)
-            else:
-                gdf = gpd.read_file(USCB_GJS + i)
-                reproj = gdf.to_crs(5072)
-                exploded_gdf = reproj.explode(index_parts=False)
-                exploded_gdf["geometry"] = exploded_gdf.geometry.buffer(60)
-                dissolved = exploded_gdf.dissolve()
-                processed_geojson.append(dissolved)
+        with Pool(processes) as pool:
+            for i in geojson_list:
+                if "uac" in i:
+                    print("Processing Urban Areas data, clipping to study area bounds")
+                    gdf = buffer_dissolve(gpd.read_file(USCB_GJS + i), mtm_study_area, pool=pool)
+                else:
+                    gdf = buffer_dissolve(gpd.read_file(USCB_GJS + i), pool=pool)
+                processed_geojson.append(gdf)
         merged = pd.concat(processed_geojson)
         final_merge = gpd.GeoDataFrame(merged)
         final_merge_reproj = final_merge.to_crs(3857)
@@ -245,7 +257,7 @@ def mask_rasterization_pt1():
             geojson = ogr.Open(MASK_INTERIM + infile)
             print("Opened")
             # print(geojson)
-        except RuntimeError as e:
+        except RuntimeError:
             print("Error: Could not open shapefile. Please try again.")
 
         geojson_layer = geojson.GetLayer()
@@ -254,7 +266,7 @@ def mask_rasterization_pt1():
         print(f"X-Min: {xmin}\nX-Max: {xmax}")
         print(f"Y-Min: {ymin}\nY-Max: {ymax}")
 
-        pixel_size = 15
+        pixel_size = MASK_PIXEL_SIZE
         no_data_value = -9999
         # rdtype = gdal.GDT_Float32
         rdtype = gdal.GDT_Byte
@@ -302,56 +314,167 @@ def mask_rasterization_pt1():
 
 
 def mask_rasterization_pt2():
+    """
+    Reprojects the interim EPSG:3857 mask to EPSG:4326 and writes it as a Cloud Optimized GeoTIFF with internal
+    overviews, with the same multithreaded warp as the direct mode (warp_windows in mtm_utils/mask_raster.py). Returns
+    the seconds spent in each step.
+    """
     infile = f"{PROCESSING_YEAR}_Input-Mask_interim_3857.tiff"
     outfile = f"{PROCESSING_YEAR}_Input-Mask_4326.tiff"
-    input_raster = gdal.Open(MASK_INTERIM + infile)
 
     if os.path.isfile(MASK_FINAL + outfile):
         print(f"Outfile, {outfile}, already exists")
-        pass
+        return {}
+
+    print("\n\nFINALIZING MASK RASTERIZATION\n\n")
+    print("Beginning raster mask reprojection.\n")
+    with rasterio.open(MASK_INTERIM + infile) as interim:
+        timings = warp_windows(interim, MASK_FINAL + outfile)
+    print(f"  > Reprojected {infile} to EPSG:4326 ({timings['warp']:.1f}s)")
+    print(f"  > Wrote the COG {MASK_FINAL + outfile} ({timings['cog']:.1f}s)")
+
+    print("FINISHED RASTER MASK REPROJECTION.")
+    return timings
+
+
+def zipped_shapefile(zip_path):
+    """
+    GDAL path of the shapefile in a downloaded zip, which is read in place through /vsizip/ instead of extracted.
+    """
+    with ZipFile(zip_path) as archive:
+        shp = next(name for name in archive.namelist() if name.endswith(".shp"))
+    return f"/vsizip/{zip_path}/{shp}"
+
+
+def read_zipped_layer(zip_path):
+    """
+    Reads a zipped shapefile with pyogrio, through Arrow when pyarrow is installed.
+    """
+    use_arrow = importlib.util.find_spec("pyarrow") is not None
+    return gpd.read_file(zipped_shapefile(zip_path), engine="pyogrio", use_arrow=use_arrow)
+
+
+def direct_mask_geometries(
+    zip_dir=USCB_ZIP, study_area_zip=STUDY_AREA_ZIP + "Study-Area.zip", route="vector", processes=None
+):
+    """
+    Reads every USCB layer straight from its zip (the urban areas clipped to the study area, like mask_creation()) and
+    returns the mask features as an array of EPSG:3857 geometries, depending on the route:
+        - vector: the buffered layers, dissolved
+        - raster: the buffered features, undissolved
+        - dilate: the exploded, unbuffered features
+    """
+    study_area = read_zipped_layer(study_area_zip).to_crs(4326)
+    processed = []
+    # Only the vector route dissolves, in the pool
+    with Pool(processes) if route == "vector" else contextlib.nullcontext() as pool:
+        for zip_name in sorted(f for f in os.listdir(zip_dir) if f.endswith(".zip")):
+            print(f" > Reading {zip_name}")
+            gdf = read_zipped_layer(zip_dir + zip_name)
+            if "uac" in zip_name:
+                gdf = gdf.to_crs(4326).clip(study_area)
+            if route == "vector":
+                processed.append(buffer_dissolve(gdf, pool=pool))
+                continue
+            exploded_gdf = gdf.to_crs(5072).explode(index_parts=False)[["geometry"]]
+            if route == "raster":
+                exploded_gdf["geometry"] = exploded_gdf.geometry.buffer(MASK_BUFFER)
+            processed.append(exploded_gdf)
+    merged = gpd.GeoDataFrame(pd.concat(processed), crs=processed[0].crs).to_crs(3857)
+    return merged.geometry.explode(index_parts=False).to_numpy()
+
+
+def direct_mask(route="vector", processes=None):
+    """
+    Direct modes > build the final mask from the downloaded zips without writing any intermediate file: the layers are
+    read through /vsizip/, rasterized window by window (see mtm_utils/mask_raster.py for the routes) into a bit-packed
+    in-memory EPSG:3857 GeoTIFF, and reprojected from there into the final EPSG:4326 raster. Returns the seconds spent
+    in each step.
+    """
+    outfile = f"{PROCESSING_YEAR}_Input-Mask_4326.tiff"
+    if os.path.isfile(MASK_FINAL + outfile):
+        print(f"Outfile, {outfile}, already exists")
+        return {}
+
+    print(f"\n\nBEGINNING DIRECT MASK CREATION ({route.upper()} ROUTE)\n\n")
+    timings = {}
+    start = time.time()
+    geometries = direct_mask_geometries(route=route, processes=processes)
+    if route == "dilate":
+        # Leave room for the dilation around the features, at the largest scale factor of the extent
+        pad = MASK_BUFFER * mercator_scale(max(abs(y) for y in shapely.total_bounds(geometries)[1::2]))
+        transform, width, height = mask_grid(geometries, pad=pad)
     else:
-        print("\n\nFINALIZING MASK RASTERIZATION\n\n")
-        print("Beginning raster mask reprojection.\n")
-        input_raster = gdal.Open(MASK_INTERIM + infile)
-        gdal.Warp(
-            destNameOrDestDS=MASK_FINAL + outfile,
-            srcDSOrSrcDSTab=input_raster,
-            options="-co TILED=YES -co COMPRESS=DEFLATE -co INTERLEAVE=BAND -co PREDICTOR=2 -t_srs EPSG:4326 -wo CUTLINE_ALL_TOUCHED=TRUE",
-        )
+        transform, width, height = mask_grid(geometries)
+    timings["vector"] = time.time() - start
+    print(f"  > {len(geometries)} features prepared ({timings['vector']:.1f}s)")
+
+    with MemoryFile() as memfile:
+        start = time.time()
+        with memfile.open(**interim_profile(transform, width, height)) as interim:
+            if route == "dilate":
+                rasterize_dilated_windows(interim, geometries)
+            else:
+                rasterize_windows(interim, geometries)
+        timings["rasterize"] = time.time() - start
+        print(f"  > Rasterized to a {width} x {height} px grid in memory ({timings['rasterize']:.1f}s)")
 
-        print("FINISHED RASTER MASK REPROJECTION.")
+        with memfile.open() as interim:
+            timings.update(warp_windows(interim, MASK_FINAL + outfile))
+        print(f"  > Reprojected to EPSG:4326 ({timings['warp']:.1f}s)")
+        print(f"  > Wrote the COG {MASK_FINAL + outfile} ({timings['cog']:.1f}s)")
+    return timings
 
 
 def mask_upload():
-    print(f"\n\nBEGINNING MASK UPLOAD TO GCS...")
+    print("\n\nBEGINNING MASK UPLOAD TO GCS...")
 
     infile = f"{PROCESSING_YEAR}_Input-Mask_4326.tiff"
     outfile_name = infile
     infile_path = MASK_FINAL + infile
 
     bucket_name = GCLOUD_BUCKET
-    storage_bucket = storage.Client("skytruth-tech").bucket(bucket_name)
+    storage_bucket = get_bucket(bucket_name, project="skytruth-tech")
+    object_index = get_object_index(bucket_name, project="skytruth-tech")
 
     out_blob = storage_bucket.blob(GCLOUD_MASK_DIR + outfile_name)
 
     # Check if the outfile already exists. If it does: pass. If it doesn't: write it.
-    if out_blob.exists():
+    if object_index.exists(GCLOUD_MASK_DIR + outfile_name):
         print("  > OUTFILE ALREADY EXISTS. PASSING.")
         pass
     else:
         print("  > OUTFILE DOESN'T EXIST. UPLOADING.")
         blob = out_blob
         blob.upload_from_filename(infile_path, content_type="image/tiff")
+        object_index.add(GCLOUD_MASK_DIR + outfile_name, size=os.path.getsize(infile_path))
         print(
             f"  > Outfile {outfile_name} uploaded to gs://{GCLOUD_BUCKET}/{GCLOUD_MASK_DIR}{outfile_name}"
         )
 
 
-if __name__ == "__main__":
+@click.command()
+@click.option(
+    "--mode",
+    default="files",
+    type=click.Choice(["files", "direct", "raster", "dilate"]),
+    help="files: unzip, convert to GeoJSON and write each intermediate to disk; direct: read the zips and build the "
+    "mask in memory from the dissolved layers; raster: from the undissolved buffered features; dilate: from the "
+    "unbuffered features, dilated in raster space.",
+)
+@click.option("--processes", default=None, type=int, help="Number of worker processes (default: all cores).")
+def main(mode: str, processes: int):
     data_dir_creation()
     data_download()
-    data_processing()
-    mask_creation()
-    mask_rasterization_pt1()
-    mask_rasterization_pt2()
+    if mode in ("direct", "raster", "dilate"):
+        direct_mask(route="vector" if mode == "direct" else mode, processes=processes)
+    else:
+        data_processing()
+        mask_creation(processes=processes)
+        mask_rasterization_pt1()
+        mask_rasterization_pt2()
     mask_upload()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import ast
+import click
+import datetime
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from mtm_utils.clients import get_object_index
+from mtm_utils.composite_index import TILE_SUFFIX
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    GCLOUD_BUCKET,
+    GCLOUD_MASK_DIR,
+    GCLOUD_EE_GPC_DIR,
+    GCLOUD_EE_GPC_AUX_DIR,
+    GCLOUD_EE_THRESHOLD_DIR,
+    GCLOUD_EE_EXCLUSION_DIR,
+    GCLOUD_EE_ANNUAL_MINES_TIFF,
+    GCLOUD_EE_ANNUAL_MINES_GEOJSON,
+    GCLOUD_EE_ANNUAL_MINES_CUMULATIVE_TIFF,
+    GCLOUD_FINAL_DATA_DIR,
+    GCLOUD_FINAL_DATA_GEOJSON,
+    GCLOUD_FINAL_DATA_GEOTIFF,
+    GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE,
+    PIPELINE_MANIFEST,
+    PIPELINE_LOG_DIR,
+    PIPELINE_MAX_PARALLEL,
+)
+
+"""
+Runs the annual workflow (mask_creation.py -> greenestComp.py -> annualThresholdImages.py -> annualMiningArea.py ->
+annualMiningArea_vectorCreation.py -> data_cleanup.py) as a DAG of stages. database/append_tables.py isn't a stage: it
+appends to the tables without checking what they already hold, so it is still run by hand.
+
+Each stage declares the bucket prefixes it reads and writes; a stage depends on every stage that writes a prefix it
+reads. Before a stage runs, its inputs are hashed: the listing (name, size, generation) of its input prefixes, the
+source of its script and of the mtm_utils / MTM_Annual_Extent modules the script imports, and the processing year. If
+the hash matches the one recorded for the stage's last successful run and its outputs for the processing year exist
+(expected: (prefix, pattern) pairs, {year} standing for the processing year), the stage is skipped. An
+upstream stage that runs but leaves its outputs unchanged (e.g. every export already existed) therefore doesn't cause
+the downstream stages to run again.
+
+Stages whose dependencies are done run in parallel in separate processes (`python -m <module>` from the repo root),
+each with its output in its own log file. The scripts exit non-zero if any of their exports failed, so a failed export
+isn't recorded as a success and is retried on the next run. A failed stage blocks its downstream stages only. Every
+run is appended to the manifest with the status, hash and duration of each stage.
+"""
+
+# The processing year's rasters are PROVISIONAL until the next year is processed
+ANNUAL_PROVISIONAL = r"{year}_activeMining_PROVISIONAL" + TILE_SUFFIX + r"\.tif"
+CUMULATIVE_PROVISIONAL = r"CumulativeMineArea_\d{4}-{year}_PROVISIONAL" + TILE_SUFFIX + r"\.tif"
+
+# Stages in workflow order. inputs/outputs are bucket prefixes; a stage without inputs depends only on its sources.
+# expected are the (prefix, pattern of the rest of the name) of the outputs that must exist for the processing year.
+PIPELINE_STAGES = {
+    "mask_creation": {
+        "module": "MTM_Annual_Extent.code.mask_creation",
+        "inputs": [],
+        "outputs": [GCLOUD_MASK_DIR],
+        "expected": [(GCLOUD_MASK_DIR, r"{year}_Input-Mask_4326\.tiff")],
+    },
+    "greenestComp": {
+        "module": "MTM_Annual_Extent.code.greenestComp",
+        "inputs": [],
+        "outputs": [GCLOUD_EE_GPC_DIR, GCLOUD_EE_GPC_AUX_DIR],
+        "expected": [
+            (GCLOUD_EE_GPC_DIR, r"composite_{year}" + TILE_SUFFIX + r"\.tif"),
+            (GCLOUD_EE_GPC_AUX_DIR, r"composite_aux_{year}" + TILE_SUFFIX + r"\.tif"),
+        ],
+    },
+    "annualThresholdImages": {
+        "module": "MTM_Annual_Extent.code.annualThresholdImages",
+        "inputs": [GCLOUD_EE_GPC_DIR, GCLOUD_MASK_DIR],
+        "outputs": [GCLOUD_EE_THRESHOLD_DIR, GCLOUD_EE_EXCLUSION_DIR],
+        "expected": [
+            (GCLOUD_EE_THRESHOLD_DIR, r"threshold_0-3_{year}" + TILE_SUFFIX + r"\.tif"),
+            (GCLOUD_EE_EXCLUSION_DIR, r"{year}_exclusionMask_\w+\.tif"),
+        ],
+    },
+    "annualMiningArea": {
+        "module": "MTM_Annual_Extent.code.annualMiningArea",
+        "inputs": [GCLOUD_EE_GPC_DIR, GCLOUD_EE_THRESHOLD_DIR, GCLOUD_EE_EXCLUSION_DIR],
+        "outputs": [
+            GCLOUD_EE_ANNUAL_MINES_TIFF,
+            GCLOUD_EE_ANNUAL_MINES_CUMULATIVE_TIFF,
+            GCLOUD_FINAL_DATA_DIR + "accuracyAssessmentResults_",
+        ],
+        "expected": [
+            (GCLOUD_EE_ANNUAL_MINES_TIFF, ANNUAL_PROVISIONAL),
+            (GCLOUD_EE_ANNUAL_MINES_CUMULATIVE_TIFF, CUMULATIVE_PROVISIONAL),
+            (GCLOUD_FINAL_DATA_DIR + "accuracyAssessmentResults_", r"{year}\.csv"),
+        ],
+    },
+    "annualMiningArea_vectorCreation": {
+        "module": "MTM_Annual_Extent.code.annualMiningArea_vectorCreation",
+        "inputs": [GCLOUD_EE_ANNUAL_MINES_TIFF],
+        "outputs": [GCLOUD_EE_ANNUAL_MINES_GEOJSON],
+        "expected": [(GCLOUD_EE_ANNUAL_MINES_GEOJSON, r"{year}_activeMining_PROVISIONAL\.geojson")],
+    },
+    "data_cleanup": {
+        "module": "MTM_Annual_Extent.code.data_cleanup",
+        "inputs": [GCLOUD_EE_ANNUAL_MINES_GEOJSON, GCLOUD_EE_ANNUAL_MINES_TIFF, GCLOUD_EE_ANNUAL_MINES_CUMULATIVE_TIFF],
+        "outputs": [GCLOUD_FINAL_DATA_GEOJSON, GCLOUD_FINAL_DATA_GEOTIFF, GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE],
+        "expected": [
+            (GCLOUD_FINAL_DATA_GEOJSON, r"{year}_activeMining_PROVISIONAL\.geojson"),
+            (GCLOUD_FINAL_DATA_GEOTIFF, ANNUAL_PROVISIONAL),
+            (GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE, CUMULATIVE_PROVISIONAL),
+        ],
+    },
+}
+
+LOCAL_PACKAGES = ("mtm_utils", "MTM_Annual_Extent")
+
+
+def stage_dependencies(stages):
+    """
+    Returns {stage: set of upstream stages}, where a stage is upstream if one of its outputs overlaps one of the
+    stage's inputs (either prefix contains the other).
+    """
+    dependencies = {}
+    for name, stage in stages.items():
+        dependencies[name] = {
+            other
+            for other, upstream in stages.items()
+            if other != name
+            and any(i.startswith(o) or o.startswith(i) for i in stage["inputs"] for o in upstream["outputs"])
+        }
+    return dependencies
+
+
+def module_path(module):
+    return module.replace(".", "/") + ".py"
+
+
+def module_sources(module, seen=None):
+    """
+    Sorted paths of the module's source file and of every mtm_utils / MTM_Annual_Extent module it imports, directly or
+    through another local module.
+    """
+    seen = set() if seen is None else seen
+    path = module_path(module)
+    if path in seen or not os.path.isfile(path):
+        return sorted(seen)
+    seen.add(path)
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name.split(".")[0] in LOCAL_PACKAGES:
+                module_sources(name, seen)
+    return sorted(seen)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_hash(stage, object_index, processing_year=PROCESSING_YEAR):
+    """
+    sha256 of the stage's input listings, sources and processing year. The input prefixes are listed again, so objects
+    written by upstream stages earlier in the run are included.
+    """
+    listings = {}
+    for prefix in stage["inputs"]:
+        object_index.invalidate(prefix)
+        listings[prefix] = sorted(
+            (name, record["size"], record["generation"]) for name, record in object_index.listing(prefix).items()
+        )
+    state = {
+        "processing_year": processing_year,
+        "sources": {path: file_digest(path) for path in module_sources(stage["module"])},
+        "inputs": listings,
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def outputs_exist(stage, object_index, processing_year=PROCESSING_YEAR):
+    """
+    Whether each of the stage's expected outputs for processing_year is in the bucket: an object under the prefix whose
+    rest of the name matches the pattern. A stage without expected outputs only needs its output prefixes non-empty.
+    """
+    expected = stage.get("expected", [(prefix, r".+") for prefix in stage["outputs"]])
+    for prefix, pattern in expected:
+        object_index.invalidate(prefix)
+        regex = re.compile(pattern.replace("{year}", str(processing_year)))
+        if not any(regex.fullmatch(name[len(prefix) :]) for name in object_index.listing(prefix)):
+            return False
+    return True
+
+
+def read_manifest(path):
+    if not os.path.isfile(path):
+        return {"stages": {}, "runs": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def run_stage(name, stage, log_dir, run_id, processing_year=PROCESSING_YEAR):
+    """
+    Runs the stage's module for processing_year (through MTM_PROCESSING_YEAR, see mtm_utils/variables.py) in a child
+    process with its output written to <log_dir><run_id>_<name>.log. Returns (return code, seconds, log path).
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = f"{log_dir}{run_id}_{name}.log"
+    env = dict(os.environ, MTM_PROCESSING_YEAR=str(processing_year))
+    start = time.time()
+    with open(log_path, "w") as log:
+        process = subprocess.run([sys.executable, "-m", stage["module"]], stdout=log, stderr=subprocess.STDOUT, env=env)
+    return process.returncode, time.time() - start, log_path
+
+
+def run_pipeline(
+    stages=PIPELINE_STAGES,
+    object_index=None,
+    manifest_path=PIPELINE_MANIFEST,
+    log_dir=PIPELINE_LOG_DIR,
+    processing_year=PROCESSING_YEAR,
+    force=(),
+    max_parallel=PIPELINE_MAX_PARALLEL,
+    dry_run=False,
+    runner=run_stage,
+):
+    """
+    Runs the stages in dependency order, up to max_parallel at a time, and returns the run record appended to the
+    manifest. Stages in force run even if their inputs are unchanged. With dry_run nothing is run; stages downstream
+    of a stage that would run are reported as "pending", since their inputs can't be hashed yet.
+    """
+    object_index = object_index or get_object_index(GCLOUD_BUCKET)
+    dependencies = stage_dependencies(stages)
+    manifest = read_manifest(manifest_path)
+    run_start = time.time()
+    run_id = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    run = {
+        "run_id": run_id,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "processing_year": processing_year,
+        "dry_run": dry_run,
+        "stages": {},
+    }
+    status = {}  # stage -> skipped | succeeded | failed | blocked | would_run | pending
+    running = {}  # future -> (stage, hash)
+
+    def finish(name, state, **record):
+        status[name] = state
+        run["stages"][name] = {"status": state, **record}
+        print(f"  > {name}: {state}" + (f" ({record['seconds']:.1f}s)" if "seconds" in record else ""))
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while len(status) < len(stages):
+            started = {name for name, _ in running.values()}
+            progress = len(status)
+            for name, stage in stages.items():
+                if name in status or name in started:
+                    continue
+                upstream = [status.get(dep) for dep in dependencies[name]]
+                if any(state is None for state in upstream):
+                    continue
+                if any(state in ("failed", "blocked") for state in upstream):
+                    finish(name, "blocked")
+                    continue
+                if any(state in ("would_run", "pending") for state in upstream):
+                    finish(name, "pending")
+                    continue
+
+                digest = input_hash(stage, object_index, processing_year)
+                last = manifest["stages"].get(name, {})
+                unchanged = last.get("hash") == digest and outputs_exist(stage, object_index, processing_year)
+                if name not in force and unchanged:
+                    finish(name, "skipped", hash=digest)
+                elif dry_run:
+                    finish(name, "would_run", hash=digest)
+                else:
+                    print(f"  > {name}: running")
+                    running[executor.submit(runner, name, stage, log_dir, run_id, processing_year)] = (name, digest)
+
+            if not running:
+                if len(status) == progress:
+                    raise ValueError(f"Stages {sorted(set(stages) - set(status))} depend on each other")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, digest = running.pop(future)
+                returncode, seconds, log_path = future.result()
+                state = "succeeded" if returncode == 0 else "failed"
+                finish(name, state, hash=digest, seconds=seconds, returncode=returncode, log=log_path)
+                if state == "succeeded":
+                    manifest["stages"][name] = {"hash": digest, "seconds": seconds, "run_id": run_id}
+                write_manifest(manifest_path, manifest)
+
+    run["seconds"] = time.time() - run_start
+    if not dry_run:
+        manifest["runs"].append(run)
+        write_manifest(manifest_path, manifest)
+    return run
+
+
+@click.command()
+@click.option("--force", multiple=True, type=click.Choice(list(PIPELINE_STAGES)), help="Run this stage regardless.")
+@click.option("--max_parallel", default=PIPELINE_MAX_PARALLEL, help="Maximum number of stages running at once.")
+@click.option("--manifest", default=PIPELINE_MANIFEST, help="Run manifest with the last hash of each stage.")
+@click.option("--dry_run", is_flag=True, help="Only report which stages would run.")
+@click.option("--processing_year", default=PROCESSING_YEAR, help="Processing year passed to every stage.")
+def main(force: tuple, max_parallel: int, manifest: str, dry_run: bool, processing_year: int):
+    print(f"Running the {processing_year} annual pipeline" + (" (dry run)" if dry_run else ""))
+    run = run_pipeline(
+        manifest_path=manifest,
+        processing_year=processing_year,
+        force=force,
+        max_parallel=max_parallel,
+        dry_run=dry_run,
+    )
+
+    failed = [name for name, record in run["stages"].items() if record["status"] in ("failed", "blocked")]
+    print(f"FINISHED in {run['seconds']:.1f}s. Manifest written to {manifest}")
+    if failed:
+        print(f"  > Failed or blocked stages: {failed}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import numpy as np
+
+from mtm_utils.variables import THRESHOLD_PERCENTILES, THRESHOLD_SKETCH_BINS, THRESHOLD_SKETCH_RANGE
+
+"""
+Mergeable per-county NDVI histogram sketch for the streaming threshold mode of local_threshold.py.
+
+The exact interval mean needs every valid NDVI value of a county in memory at once. The sketch instead keeps, for each
+county label, the count and the sum of the values in each of a fixed set of equal-width NDVI bins. Blocks of the
+composite are added one at a time, so memory is O(counties x bins) no matter how large the raster is, and sketches
+built on different tiles or by different workers are combined by adding their arrays.
+
+The interval mean is taken from the bins in rank order: bins that lie entirely inside the [low, high) percentile rank
+interval contribute their exact sum, and a bin that straddles an end of the interval contributes the share of its
+values that falls inside, at the bin's mean. Only the values of those straddling bins can be misplaced, and every
+value of a bin is within one bin width of the bin mean, so the estimate is within one bin width of the exact interval
+mean (values outside of the bin range are counted in the edge bins, where the bound doesn't hold).
+"""
+
+
+class CountyHistogram:
+    """
+    Per-label fixed-bin histogram of counts and sums. Label 0 (outside of the counties) is ignored.
+    """
+
+    def __init__(self, n_labels, bins=THRESHOLD_SKETCH_BINS, value_range=THRESHOLD_SKETCH_RANGE):
+        self.n_labels = n_labels
+        self.bins = bins
+        self.value_range = tuple(value_range)
+        self.bin_width = (value_range[1] - value_range[0]) / bins
+        self.counts = np.zeros((n_labels + 1, bins), dtype=np.int64)
+        self.sums = np.zeros((n_labels + 1, bins), dtype=np.float64)
+
+    def update(self, values, labels, excluded=None):
+        """
+        Adds a block of NDVI values with their county labels. NaN values, label 0 and excluded pixels are skipped.
+        """
+        valid = (labels > 0) & ~np.isnan(values)
+        if excluded is not None:
+            valid &= ~excluded
+        values = values[valid].astype(np.float64)
+        bin_ids = np.clip(((values - self.value_range[0]) / self.bin_width).astype(np.intp), 0, self.bins - 1)
+        flat = labels[valid].astype(np.intp) * self.bins + bin_ids
+
+        size = self.counts.size
+        self.counts += np.bincount(flat, minlength=size).reshape(self.counts.shape)
+        self.sums += np.bincount(flat, weights=values, minlength=size).reshape(self.sums.shape)
+        return self
+
+    def merge(self, other):
+        """
+        Adds another sketch with the same labels and bins into this one.
+        """
+        if (other.n_labels, other.bins, other.value_range) != (self.n_labels, self.bins, self.value_range):
+            raise ValueError("Can only merge sketches with the same labels and bins")
+        self.counts += other.counts
+        self.sums += other.sums
+        return self
+
+    def interval_means(self, percentiles=THRESHOLD_PERCENTILES):
+        """
+        Returns a float array of length n_labels + 1 with the estimated interval mean of each label, using the same
+        rank interval as county_interval_means in local_threshold.py (NaN for labels without values, and label 0).
+        """
+        n = self.counts.sum(axis=1)
+        low, high = percentiles
+        lo = np.floor(n * low / 100)
+        hi = np.maximum(np.ceil(n * high / 100), lo + 1)
+
+        # Number of values of each bin whose rank is in [lo, hi)
+        upper = np.cumsum(self.counts, axis=1)
+        lower = upper - self.counts
+        taken = np.clip(np.minimum(upper, hi[:, None]) - np.maximum(lower, lo[:, None]), 0, None)
+
+        bin_means = np.divide(self.sums, self.counts, out=np.zeros_like(self.sums), where=self.counts > 0)
+        sums = (taken * bin_means).sum(axis=1)
+        counts = taken.sum(axis=1)
+
+        means = np.full(self.n_labels + 1, np.nan)
+        np.divide(sums, counts, out=means, where=counts > 0)
+        means[0] = np.nan
+        return means
+
+    def save(self, path):
+        np.savez(path, counts=self.counts, sums=self.sums, value_range=np.asarray(self.value_range))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        sketch = cls(data["counts"].shape[0] - 1, bins=data["counts"].shape[1], value_range=tuple(data["value_range"]))
+        sketch.counts += data["counts"]
+        sketch.sums += data["sums"]
+        return sketch
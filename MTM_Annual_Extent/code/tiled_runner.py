@@ -0,0 +1,180 @@
+import click
+import os
+import time
+import numpy as np
+import rasterio
+from multiprocessing import Pool
+from rasterio.windows import Window
+
+from MTM_Annual_Extent.code.local_cleaning import clean_block, final_mine_processing
+from mtm_utils.exclusion_mask import local_mining_exclusion
+from mtm_utils.variables import (
+    PROCESSING_YEAR,
+    FIRST_LANDSAT_YEAR,
+    LOCAL_RAW_MINING_DIR,
+    LOCAL_ACTIVE_MINING_DIR,
+    LOCAL_EXCLUSION_MASK,
+    LOCAL_TILE_SIZE,
+    LOCAL_TILE_HALO,
+    MIN_MINE_PIXELS,
+)
+
+"""
+Windowed, tile-parallel runner for the local annual mining pipeline (local_cleaning.py).
+
+The study area is split into square tiles, each read with a halo of LOCAL_TILE_HALO pixels on every side. The halo only
+matters for the connected-component filter: any component that reaches the core of a tile and extends past the halo
+has at least halo + 1 pixels inside the read window, so with halo >= MIN_MINE_PIXELS - 1 the keep/drop decision for
+every core pixel is the same as on the full raster. The temporal cleaning is per-pixel and needs no halo.
+
+Each tile is processed by a worker in a process pool (all years of the tile are read, cleaned, and final-processed),
+and the parent process writes the core of each tile into per-year GeoTIFFs. Peak memory is bounded by
+processes x years x (tile + 2 * halo)^2 rather than by the size of the study area.
+"""
+
+
+def raw_mining_path(year):
+    return LOCAL_RAW_MINING_DIR + f"{year}_rawMining.tif"
+
+
+def active_mining_path(year, processing_year=PROCESSING_YEAR, out_dir=LOCAL_ACTIVE_MINING_DIR):
+    """
+    Local equivalent of the GCLOUD_EE_ANNUAL_MINES_TIFF naming; the processing year is PROVISIONAL.
+    """
+    if year == processing_year:
+        return out_dir + f"{year}_activeMining_PROVISIONAL.tif"
+    return out_dir + f"{year}_activeMining.tif"
+
+
+def tile_windows(height, width, tile_size=LOCAL_TILE_SIZE, halo=LOCAL_TILE_HALO):
+    """
+    Yields (core, read, crop) for every tile of a height x width raster. core is the window written to the output,
+    read is the core window expanded by the halo (clipped to the raster), and crop is the (row, col) slice pair that
+    extracts the core from an array read with the read window.
+    """
+    for r0 in range(0, height, tile_size):
+        for c0 in range(0, width, tile_size):
+            r1 = min(r0 + tile_size, height)
+            c1 = min(c0 + tile_size, width)
+            rr0 = max(r0 - halo, 0)
+            cc0 = max(c0 - halo, 0)
+            rr1 = min(r1 + halo, height)
+            cc1 = min(c1 + halo, width)
+            core = Window(c0, r0, c1 - c0, r1 - r0)
+            read = Window(cc0, rr0, cc1 - cc0, rr1 - rr0)
+            crop = (slice(r0 - rr0, r1 - rr0), slice(c0 - cc0, c1 - cc0))
+            yield core, read, crop
+
+
+def year_raster_profile(src_profile):
+    """
+    Output profile for single-band uint16 year rasters (year = mine, 0 = non-mine) on the grid of src_profile: tiled in
+    256px blocks and deflate-compressed.
+    """
+    profile = src_profile.copy()
+    profile.update(
+        driver="GTiff",
+        dtype="uint16",
+        nodata=None,
+        count=1,
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        compress="deflate",
+        predictor=2,
+    )
+    return profile
+
+
+def process_tile(args):
+    """
+    Pool worker > Reads every year of the raw-mining data and the exclusion mask for one tile (with halo), cleans the
+    stack, applies the final mine processing per year, and returns the core of the tile as a (years, rows, cols)
+    uint16 array.
+    """
+    core, read, crop, raw_paths, exclusion_path, years, min_pixels = args
+
+    raw = np.empty((len(raw_paths), int(read.height), int(read.width)), dtype=np.uint8)
+    for i, path in enumerate(raw_paths):
+        with rasterio.open(path) as src:
+            raw[i] = src.read(1, window=read)
+
+    if exclusion_path is None:
+        exclusion = np.zeros(raw.shape[1:], dtype=np.uint8)
+    else:
+        with rasterio.open(exclusion_path) as src:
+            exclusion = local_mining_exclusion(src.read(1, window=read))
+
+    cleaned = clean_block(raw)
+    del raw
+
+    out = np.empty((len(years), int(core.height), int(core.width)), dtype=np.uint16)
+    for i, year in enumerate(years):
+        out[i] = final_mine_processing(cleaned[i], exclusion, year, min_pixels=min_pixels)[crop]
+    return core, out
+
+
+def run_tiled(
+    years,
+    raw_paths,
+    out_paths,
+    exclusion_path=None,
+    tile_size=LOCAL_TILE_SIZE,
+    halo=LOCAL_TILE_HALO,
+    processes=None,
+    min_pixels=MIN_MINE_PIXELS,
+):
+    """
+    Runs the cleaning and final mine processing for all years over the tiles of the raw-mining rasters, writing the
+    results to out_paths (one GeoTIFF per year, year = mine, 0 = non-mine). All rasters must share the same grid.
+    """
+    if halo < min_pixels - 1:
+        raise ValueError(f"A halo of {halo}px is too small for a {min_pixels}px connected-component filter")
+
+    with rasterio.open(raw_paths[0]) as src:
+        profile = year_raster_profile(src.profile)
+        height, width = src.height, src.width
+
+    for path in out_paths:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    outputs = [rasterio.open(path, "w", **profile) for path in out_paths]
+
+    tasks = (
+        (core, read, crop, raw_paths, exclusion_path, years, min_pixels)
+        for core, read, crop in tile_windows(height, width, tile_size=tile_size, halo=halo)
+    )
+    n_tiles = -(-height // tile_size) * -(-width // tile_size)
+
+    start = time.time()
+    try:
+        with Pool(processes) as pool:
+            for n, (core, out) in enumerate(pool.imap_unordered(process_tile, tasks), start=1):
+                for dst, arr in zip(outputs, out):
+                    dst.write(arr, 1, window=core)
+                print(f"  > Tile {n}/{n_tiles} written ({time.time() - start:.1f}s)")
+    finally:
+        for dst in outputs:
+            dst.close()
+
+
+@click.command()
+@click.option("--first_year", default=FIRST_LANDSAT_YEAR, help="First year of raw-mining rasters.")
+@click.option("--last_year", default=PROCESSING_YEAR, help="Last year of raw-mining rasters (the PROVISIONAL year).")
+@click.option("--exclusion_mask", default=LOCAL_EXCLUSION_MASK, help="Exclusion mask downloaded from gee_data/EXCLUSION_MASK/.")
+@click.option("--tile_size", default=LOCAL_TILE_SIZE, help="Tile size in pixels; a multiple of 256 keeps writes block-aligned.")
+@click.option("--processes", default=None, type=int, help="Number of worker processes (default: all cores).")
+def main(first_year: int, last_year: int, exclusion_mask: str, tile_size: int, processes: int):
+    years = list(range(first_year, last_year + 1))
+    raw_paths = [raw_mining_path(year) for year in years]
+    out_paths = [active_mining_path(year, processing_year=last_year) for year in years]
+    if not os.path.isfile(exclusion_mask):
+        print(f"  > No exclusion mask found at {exclusion_mask}, running without one.")
+        exclusion_mask = None
+
+    print(f"Processing {len(years)} years ({first_year}-{last_year}) in {tile_size}px tiles")
+    run_tiled(years, raw_paths, out_paths, exclusion_path=exclusion_mask, tile_size=tile_size, processes=processes)
+    print(f"FINISHED. Annual active mining rasters written to {LOCAL_ACTIVE_MINING_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from functools import lru_cache
+
+from mtm_utils.variables import GCLOUD_BUCKET, OBJECT_INDEX_CACHE
+
+"""
+Lazily created, per-process cached clients for Earth Engine and Cloud Storage.
+
+The scripts used to authenticate and build their clients at import time. These factories do it on the first call
+instead, and each client is created once per process, so importing a script (e.g. to reuse its functions, or in a
+long-running worker that runs several scripts) costs nothing until work actually starts. The config module, with the
+service account credentials, is only imported when Earth Engine is initialized.
+"""
+
+
+@lru_cache(maxsize=None)
+def init_earth_engine():
+    """
+    Authenticates with the service account in config.py and initializes Earth Engine. Returns the ee module.
+    """
+    import ee
+    from config import EE_SERVICE_ACCOUNT, EE_CREDENTIALS
+
+    credentials = ee.ServiceAccountCredentials(EE_SERVICE_ACCOUNT, EE_CREDENTIALS)
+    ee.Initialize(credentials)
+    return ee
+
+
+@lru_cache(maxsize=None)
+def get_storage_client(project=None):
+    """
+    google.cloud.storage Client for project (default: the project of the environment's credentials).
+    """
+    from google.cloud import storage
+
+    return storage.Client(project) if project else storage.Client()
+
+
+@lru_cache(maxsize=None)
+def get_bucket(bucket_name=GCLOUD_BUCKET, project=None):
+    return get_storage_client(project).bucket(bucket_name)
+
+
+def get_object_index(bucket_name=GCLOUD_BUCKET, project=None):
+    """
+    New ObjectIndex of the bucket, on the cached storage client. Each script's main() gets its own, so a long-running
+    worker doesn't answer from the in-memory listings of an earlier run. Listings are kept in OBJECT_INDEX_CACHE for
+    OBJECT_INDEX_CACHE_TTL, so the scripts run one after another reuse them until one of them writes to the prefix.
+    """
+    from mtm_utils.object_index import gcs_object_index
+
+    return gcs_object_index(bucket_name, client=get_storage_client(project), cache_path=OBJECT_INDEX_CACHE)
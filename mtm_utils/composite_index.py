@@ -0,0 +1,67 @@
+import re
+
+from mtm_utils.variables import (
+    GCLOUD_BUCKET,
+    GCLOUD_EE_GPC_DIR,
+    GCLOUD_EE_THRESHOLD_DIR,
+    GPC_SPLIT_TILES,
+    THRESHOLD_SPLIT_TILES,
+)
+
+"""
+Builds {year: [tile URLs]} indexes of the greenest pixel composites (GCLOUD_EE_GPC_DIR) and annual threshold images
+(GCLOUD_EE_THRESHOLD_DIR) from a single listing of each folder.
+
+Large Earth Engine GeoTIFF exports are split into tiles named <prefix><row offset>-<col offset>.tif (e.g.
+composite_19840000000000-0000000000.tif), smaller ones are written as <prefix>.tif. The year is parsed from the file
+name with an anchored pattern, so the index is built in one pass over the listing, and each year is checked for the
+expected number of tiles before any Earth Engine images are built from it.
+"""
+
+TILE_SUFFIX = r"(?:\d{10}-\d{10})?"
+GPC_PATTERN = re.compile(r"/composite_(\d{4})" + TILE_SUFFIX + r"\.tif$")
+THRESHOLD_PATTERN = re.compile(r"/threshold_0-3_(\d{4})" + TILE_SUFFIX + r"\.tif$")
+
+
+def year_index(names, pattern, bucket_name=GCLOUD_BUCKET):
+    """
+    Returns {year: [sorted gs:// URLs]} for every object name matching pattern. Names that don't match (e.g. the folder
+    placeholder) are ignored.
+    """
+    index = {}
+    for name in names:
+        match = pattern.search(name)
+        if match:
+            index.setdefault(int(match.group(1)), []).append("gs://" + bucket_name + "/" + name)
+    return {year: sorted(urls) for year, urls in sorted(index.items())}
+
+
+def validate_year_index(index, years, expected_tiles, label):
+    """
+    Raises a ValueError listing every year that is missing or doesn't have expected_tiles tiles.
+    """
+    problems = []
+    for year in years:
+        n_tiles = len(index.get(year, []))
+        if n_tiles != expected_tiles:
+            problems.append(f"{year}: {n_tiles} of {expected_tiles} tiles")
+    if problems:
+        raise ValueError(f"Incomplete {label} exports: " + "; ".join(problems))
+
+
+def gpc_url_index(object_index, years, bucket_name=GCLOUD_BUCKET, expected_tiles=GPC_SPLIT_TILES):
+    """
+    {year: [split tile URLs]} for the greenest pixel composites of the given years.
+    """
+    index = year_index(object_index.names(GCLOUD_EE_GPC_DIR), GPC_PATTERN, bucket_name)
+    validate_year_index(index, years, expected_tiles, "greenest pixel composite")
+    return index
+
+
+def threshold_url_index(object_index, years, bucket_name=GCLOUD_BUCKET, expected_tiles=THRESHOLD_SPLIT_TILES):
+    """
+    {year: [tile URLs]} for the annual threshold images of the given years.
+    """
+    index = year_index(object_index.names(GCLOUD_EE_THRESHOLD_DIR), THRESHOLD_PATTERN, bucket_name)
+    validate_year_index(index, years, expected_tiles, "annual threshold")
+    return index
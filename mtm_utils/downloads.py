@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from mtm_utils.variables import (
+    DOWNLOAD_CACHE,
+    DOWNLOAD_THREADS,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_RETRY_BACKOFF,
+    DOWNLOAD_TIMEOUT,
+)
+
+"""
+Parallel, resumable downloads with a content-addressed cache, for the USCB TIGER/Line files of mask_creation.py.
+
+Files are downloaded by a pool of threads, each with its own requests.Session, so the connections to the server are kept
+alive from one file to the next. A download is first written to <cache>/partial/; if it is interrupted, the next attempt
+asks for the rest of the file with a Range request (guarded by If-Range with the ETag the partial file was downloaded
+under, so a file that changed in the meantime is downloaded again from the start). A finished download is checked
+against the size and ETag the server announced and stored once under the sha256 of its content:
+
+    <cache>/objects/<sha256[:2]>/<sha256>
+    <cache>/index.json    {"urls": {url: {"sha256", "size", "etag", "last_modified"}}}
+
+A file is then linked (or copied) from the cache to where it is wanted. Before downloading, the server's size and ETag
+(HEAD request) are compared with the index: a URL that is unchanged (e.g. the 2022 urban clusters file that every
+processing year falls back to), or a new URL with the file name, size and ETag of a file already in the cache (e.g. the
+same tl_<year>_us_uac20.zip under UAC/ and UAC20/), is served from the cache. ETags are only compared between URLs of
+the same file name, since servers can give different files published together the same ETag. Clearing the download
+directory therefore doesn't download anything again.
+
+Nothing here is specific to census.gov, so the downloader can be tried out against a local HTTP server. Without an
+ETag (e.g. python -m http.server) downloads still work but aren't resumed or served from the cache.
+"""
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Downloader:
+    def __init__(
+        self,
+        cache_dir=DOWNLOAD_CACHE,
+        threads=DOWNLOAD_THREADS,
+        retries=DOWNLOAD_RETRIES,
+        retry_backoff=DOWNLOAD_RETRY_BACKOFF,
+        timeout=DOWNLOAD_TIMEOUT,
+        session_factory=requests.Session,
+        sleep=time.sleep,
+    ):
+        self.cache_dir = cache_dir
+        self.threads = threads
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.session_factory = session_factory
+        self.sleep = sleep
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.index = self._read_index()
+
+    def _read_index(self):
+        if not os.path.isfile(self.index_path):
+            return {"urls": {}}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _write_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    @property
+    def session(self):
+        """
+        Session of the calling thread, so each worker keeps its own connections alive.
+        """
+        if not hasattr(self._local, "session"):
+            self._local.session = self.session_factory()
+        return self._local.session
+
+    def object_path(self, sha256):
+        return os.path.join(self.cache_dir, "objects", sha256[:2], sha256)
+
+    def partial_path(self, url):
+        return os.path.join(self.cache_dir, "partial", hashlib.sha256(url.encode()).hexdigest() + ".part")
+
+    def remote_info(self, url):
+        """
+        {"size", "etag", "last_modified"} from a HEAD request (None where the server doesn't send them).
+        """
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        size = response.headers.get("Content-Length")
+        return {
+            "size": int(size) if size is not None else None,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    def cached(self, url, remote):
+        """
+        sha256 of a cached file with the remote size and ETag: the url's own entry, or else the entry of another url
+        with the same file name, ETag and size. ETags only identify a file at one url (e.g. Apache's mtime-size ETags
+        can be the same for files published together), so other file names are never reused. Returns None if there is
+        none, or if the server sends no ETag to compare.
+        """
+        file_name = url.rsplit("/", 1)[-1]
+        with self._lock:
+            entries = self.index["urls"]
+            candidates = [entries[url]] if url in entries else []
+            if remote["etag"] is not None:
+                candidates += [
+                    entry
+                    for other, entry in entries.items()
+                    if other != url and other.rsplit("/", 1)[-1] == file_name
+                ]
+            for entry in candidates:
+                same = entry["size"] == remote["size"] and entry["etag"] == remote["etag"]
+                if same and remote["etag"] is not None and os.path.isfile(self.object_path(entry["sha256"])):
+                    return entry["sha256"]
+        return None
+
+    def _download(self, url, remote):
+        """
+        Downloads url to its partial file, resuming it if part of it is there. Returns the partial file's path. The ETag
+        a partial file was downloaded under is kept next to it (<part>.etag), and the partial file is only resumed (or
+        stored without a request if it is complete) while that is still the remote ETag. Any other partial file (of a
+        file that changed since, larger than the remote file, or whose range the server rejects) is downloaded again
+        from the start; one that ends up with the wrong size is deleted, so the retry starts over.
+        """
+        part = self.partial_path(url)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        part_etag = None
+        if os.path.isfile(part + ".etag"):
+            with open(part + ".etag") as f:
+                part_etag = f.read()
+        too_large = remote["size"] is not None and offset > remote["size"]
+        if offset and (remote["etag"] is None or part_etag != remote["etag"] or too_large):
+            remove_partial(part)
+            offset = 0
+        if offset and offset == remote["size"]:
+            return part  # Interrupted after the download finished
+        headers = {}
+        if offset:
+            headers = {"Range": f"bytes={offset}-", "If-Range": part_etag}
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and headers:
+                # Range Not Satisfiable: the partial file doesn't fit the remote file, start over
+                remove_partial(part)
+                return self._download(url, remote)
+            response.raise_for_status()
+            etag = response.headers.get("ETag")
+            if remote["etag"] is not None and etag is not None and etag != remote["etag"]:
+                raise DownloadError(f"{url} changed during the download (ETag {etag} != {remote['etag']})")
+            # A full response (no partial file, or the file changed since If-Range's ETag) starts over
+            mode = "ab" if response.status_code == 206 else "wb"
+            if mode == "wb":
+                remove_partial(part)
+                if etag or remote["etag"]:
+                    with open(part + ".etag", "w") as f:
+                        f.write(etag or remote["etag"])
+            with open(part, mode) as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+
+        size = os.path.getsize(part)
+        if remote["size"] is not None and size != remote["size"]:
+            remove_partial(part)
+            raise DownloadError(f"{url}: got {size} bytes, expected {remote['size']}")
+        return part
+
+    def _store(self, url, part, remote):
+        """
+        Moves a finished download into the cache under its sha256 and records it in the index.
+        """
+        digest = hashlib.sha256()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.isfile(path):
+            os.remove(part)  # Same content as a file that is already cached
+        else:
+            os.replace(part, path)
+        remove_partial(part)
+        with self._lock:
+            self.index["urls"][url] = {
+                "sha256": sha256,
+                "size": os.path.getsize(path),
+                "etag": remote["etag"],
+                "last_modified": remote["last_modified"],
+            }
+            self._write_index()
+        return sha256
+
+    def fetch(self, url, out_dir):
+        """
+        Makes url available as out_dir/<file name>, from the cache if possible, downloading it otherwise. A failed
+        download is retried up to retries times, unless the server answers with a client error, waiting
+        retry_backoff * 2^(attempt - 1) seconds before each retry. Returns the path.
+        """
+        out_path = os.path.join(out_dir, url.rsplit("/", 1)[-1])
+        for attempt in range(self.retries + 1):
+            try:
+                remote = self.remote_info(url)
+                sha256 = self.cached(url, remote)
+                if sha256 is None:
+                    sha256 = self._store(url, self._download(url, remote), remote)
+                    print(f"  > Downloaded {url}")
+                else:
+                    print(f"  > {url} is unchanged, using the cached copy")
+                break
+            except (requests.RequestException, DownloadError) as e:
+                if attempt == self.retries or not retryable(e):
+                    raise DownloadError(f"{url} failed after {attempt + 1} attempts: {e}") from e
+                wait = self.retry_backoff * 2**attempt
+                print(f"  > {url} failed ({e}), retrying in {wait}s")
+                self.sleep(wait)
+
+        link(self.object_path(sha256), out_path)
+        return out_path
+
+    def fetch_all(self, urls, out_dir):
+        """
+        Fetches every url into out_dir with the thread pool. Returns {url: path}; raises the first failure once every
+        download has finished, so the ones that succeeded are cached for the next run.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = {url: executor.submit(self.fetch, url, out_dir) for url in urls}
+        errors = [future.exception() for future in futures.values() if future.exception() is not None]
+        if errors:
+            raise DownloadError(f"{len(errors)} of {len(urls)} downloads failed") from errors[0]
+        return {url: future.result() for url, future in futures.items()}
+
+
+def retryable(error):
+    """
+    Whether a failed download is worth retrying: anything but a client error (e.g. 404), apart from timeouts and rate
+    limiting.
+    """
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return not 400 <= response.status_code < 500 or response.status_code in (408, 429)
+    return True
+
+
+def remove_partial(part):
+    """
+    Deletes a partial file and the ETag it was downloaded under, if they are there.
+    """
+    for path in (part, part + ".etag"):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def link(src, dst):
+    """
+    Hard-links dst to the cached file (copies it across file systems). Replaces an existing dst.
+    """
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
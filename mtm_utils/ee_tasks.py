@@ -0,0 +1,198 @@
+import sys
+import time
+
+from mtm_utils.variables import (
+    EE_MAX_CONCURRENT_EXPORTS,
+    EE_TASK_POLL_INTERVAL,
+    EE_TASK_MAX_RETRIES,
+    EE_TASK_RETRY_BACKOFF,
+    EE_ACCOUNT_TASK_QUOTA,
+)
+
+"""
+Concurrent Earth Engine export orchestration.
+
+Scripts build a list of ExportJobs (one per pending export) and hand them to run_exports, which keeps up to
+max_concurrent tasks running, polls all active tasks with a single batched status call, retries failed tasks with
+exponential backoff, and prints a summary once every job has finished. The task backend is swappable, so the
+orchestration can be exercised without Earth Engine by passing any object with start(job) and statuses(task_ids).
+"""
+
+ACTIVE_STATES = ("UNSUBMITTED", "READY", "RUNNING", "CANCEL_REQUESTED")
+FAILED_STATES = ("FAILED", "CANCELLED")
+
+
+class ExportJob:
+    """
+    A pending export. create is a callable returning an unstarted Earth Engine task, typically a
+    functools.partial of batch.Export.image.toCloudStorage / batch.Export.table.toCloudStorage, so that a retry
+    starts a fresh task.
+    """
+
+    def __init__(self, description, create):
+        self.description = description
+        self.create = create
+        self.task_id = None
+        self.state = "PENDING"
+        self.attempts = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.destination_uris = []
+
+    def __repr__(self):
+        return f"ExportJob({self.description!r}, state={self.state}, attempts={self.attempts})"
+
+
+class EarthEngineBackend:
+    """
+    Starts tasks and fetches task statuses from Earth Engine. ee must already be initialized.
+    """
+
+    def start(self, job):
+        task = job.create()
+        task.start()
+        return task.id
+
+    def statuses(self, task_ids):
+        import ee
+
+        return {s["id"]: s for s in ee.data.getTaskStatus(list(task_ids))}
+
+    def active_tasks(self):
+        import ee
+
+        return [task for task in ee.data.getTaskList() if task.get("state") in ACTIVE_STATES]
+
+    def active_task_count(self):
+        return len(self.active_tasks())
+
+
+def quota_aware_limit(backend=None, max_concurrent=EE_MAX_CONCURRENT_EXPORTS, quota=EE_ACCOUNT_TASK_QUOTA):
+    """
+    Number of exports to run at once: max_concurrent, reduced by the tasks already queued or running on the account
+    (e.g. by another script) so the account's concurrent task quota isn't exceeded. Always at least 1.
+    """
+    backend = backend or EarthEngineBackend()
+    active = backend.active_task_count()
+    limit = max(1, min(max_concurrent, quota - active))
+    print(f"  > {active} tasks already active on the account, running up to {limit} exports at a time")
+    return limit
+
+
+def active_export_descriptions(backend=None):
+    """
+    Descriptions of the tasks queued or running on the account, e.g. exports left running by an interrupted run, whose
+    outputs mustn't be deleted or exported again.
+    """
+    backend = backend or EarthEngineBackend()
+    return {task.get("description") for task in backend.active_tasks()}
+
+
+def run_exports(
+    jobs,
+    backend=None,
+    max_concurrent=EE_MAX_CONCURRENT_EXPORTS,
+    poll_interval=EE_TASK_POLL_INTERVAL,
+    max_retries=EE_TASK_MAX_RETRIES,
+    retry_backoff=EE_TASK_RETRY_BACKOFF,
+    sleep=time.sleep,
+    clock=time.monotonic,
+    on_complete=None,
+):
+    """
+    Runs all jobs, at most max_concurrent at a time, and returns them once every job has COMPLETED or exhausted its
+    retries. A failed job, or one whose task couldn't be started, is retried up to max_retries times, waiting
+    retry_backoff * 2^(attempt - 1) seconds before each retry. on_complete, if given, is called with each job as soon
+    as it has COMPLETED.
+    """
+    backend = backend or EarthEngineBackend()
+    jobs = list(jobs)
+    queue = [(0.0, job) for job in jobs]  # (not-before time, job)
+    running = {}
+
+    if not jobs:
+        print("  > No exports to run.")
+        return jobs
+
+    print(f"Running {len(jobs)} exports, up to {max_concurrent} at a time")
+    while queue or running:
+        now = clock()
+
+        # Fill the free slots with jobs whose backoff has elapsed
+        ready = [item for item in queue if item[0] <= now]
+        for item in ready[: max(max_concurrent - len(running), 0)]:
+            queue.remove(item)
+            job = item[1]
+            job.attempts += 1
+            job.started = now
+            job.state = "READY"
+            try:
+                job.task_id = backend.start(job)
+            except Exception as e:
+                # e.g. the account's task quota or a transient HTTP error: retried like a FAILED task
+                job.state = "FAILED"
+                job.error = f"could not start the task: {e}"
+                job.finished = clock()
+                retry(job, queue, max_retries, retry_backoff)
+                continue
+            running[job.task_id] = job
+            print(f"  > Started {job.description} (id: {job.task_id}, attempt {job.attempts})")
+
+        if running:
+            statuses = backend.statuses(running.keys())
+            for task_id, job in list(running.items()):
+                status = statuses.get(task_id, {})
+                job.state = status.get("state", job.state)
+                if job.state in ACTIVE_STATES:
+                    continue
+
+                del running[task_id]
+                job.finished = clock()
+                if job.state == "COMPLETED":
+                    job.destination_uris = status.get("destination_uris", [])
+                    print(f"    > {job.description} COMPLETED ({job.finished - job.started:.0f}s)")
+                    if on_complete is not None:
+                        on_complete(job)
+                    continue
+
+                job.error = status.get("error_message")
+                retry(job, queue, max_retries, retry_backoff)
+
+        if running or queue:
+            sleep(poll_interval)
+
+    print_summary(jobs)
+    return jobs
+
+
+def retry(job, queue, max_retries, retry_backoff):
+    """
+    Requeues a failed job after its backoff, unless it has used up its retries.
+    """
+    if job.attempts <= max_retries:
+        delay = retry_backoff * 2 ** (job.attempts - 1)
+        print(f"    > {job.description} {job.state}: {job.error}. Retrying in {delay:.0f}s.")
+        queue.append((job.finished + delay, job))
+    else:
+        print(f"    > {job.description} {job.state} after {job.attempts} attempts: {job.error}")
+
+
+def exit_if_failed(jobs):
+    """
+    Exits with status 1 if any job didn't complete, so whatever runs the script (e.g. pipeline.py) doesn't take the
+    run for a success.
+    """
+    failed = [job.description for job in jobs if job.state != "COMPLETED"]
+    if failed:
+        sys.exit(f"{len(failed)} of {len(jobs)} exports didn't complete: {', '.join(failed)}")
+
+
+def print_summary(jobs):
+    completed = [job for job in jobs if job.state == "COMPLETED"]
+    failed = [job for job in jobs if job.state != "COMPLETED"]
+    retried = [job for job in jobs if job.attempts > 1]
+
+    print(f"\nEXPORT SUMMARY: {len(completed)} completed, {len(failed)} failed, {len(retried)} retried")
+    for job in failed:
+        print(f"  > FAILED: {job.description} ({job.state}, {job.attempts} attempts): {job.error}")
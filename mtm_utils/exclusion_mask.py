@@ -0,0 +1,156 @@
+import hashlib
+import json
+from functools import partial
+
+import numpy as np
+
+from mtm_utils.ee_tasks import ExportJob, run_exports
+from mtm_utils.variables import (
+    GCLOUD_BUCKET,
+    GCLOUD_MASK_DIR,
+    GCLOUD_EE_EXCLUSION_DIR,
+    MINE_PERMITS_NO_BUFFER_ASSET,
+    EXCLUSION_USCB_BIT,
+    EXCLUSION_PERMIT_BIT,
+)
+
+"""
+Combined exclusion mask for a processing year, materialized once on the greenest pixel composite grid.
+
+annualThresholdImages.py and annualMiningArea.py both combine the USCB mask from mask_creation.py
+(<year>_Input-Mask_4326.tiff, 1 = masked) with the allMinePermits_noBuffer asset. Both inputs are packed into one
+uint8 band:
+    - bit 0 (EXCLUSION_USCB_BIT): the USCB mask applies
+    - bit 1 (EXCLUSION_PERMIT_BIT): the pixel is inside a mine permit
+and exported as GeoTIFF with the projection and crsTransform of the composite, so it lines up pixel-for-pixel with the
+GPC tiles. The two masks the scripts need are derived from it:
+    - threshold_exclusion: either bit is set (NDVI is ignored when computing the county thresholds)
+    - mining_exclusion: bit 0 set and bit 1 not set (mask_input_60m.where(miningPermits_noBuffer.eq(1), 0))
+
+The file name carries a hash of the inputs (generation and size of the USCB mask object, updateTime of the permit
+asset, and the grid), so when either input changes the name changes and the mask is exported again on the next run.
+Earth Engine is imported lazily and must already be initialized.
+"""
+
+
+def uscb_mask_name(processing_year):
+    return GCLOUD_MASK_DIR + str(processing_year) + "_Input-Mask_4326.tiff"
+
+
+def exclusion_mask_name(processing_year, inputs_hash):
+    return GCLOUD_EE_EXCLUSION_DIR + f"{processing_year}_exclusionMask_{inputs_hash}.tif"
+
+
+def composite_grid(gpc_url):
+    """
+    Returns the {"crs", "transform"} of a greenest pixel composite tile.
+    """
+    import ee
+
+    projection = ee.Image.loadGeoTIFF(gpc_url).projection().getInfo()
+    return {"crs": projection["crs"], "transform": projection["transform"]}
+
+
+def exclusion_inputs_hash(object_index, processing_year, grid):
+    """
+    Short hash of everything the exclusion mask is built from.
+    """
+    import ee
+
+    mask_record = object_index.get(uscb_mask_name(processing_year))
+    if mask_record is None:
+        raise FileNotFoundError(
+            f"{uscb_mask_name(processing_year)} doesn't exist; run mask_creation.py for {processing_year} first"
+        )
+    permits = ee.data.getAsset(MINE_PERMITS_NO_BUFFER_ASSET)
+
+    inputs = {
+        "uscb_mask": [uscb_mask_name(processing_year), mask_record["generation"], mask_record["size"]],
+        "permits": [MINE_PERMITS_NO_BUFFER_ASSET, permits.get("updateTime")],
+        "grid": grid,
+        "bits": [EXCLUSION_USCB_BIT, EXCLUSION_PERMIT_BIT],
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def build_exclusion_image(processing_year, bucket_name=GCLOUD_BUCKET):
+    """
+    Packs the USCB mask and the mine permits into one uint8 image.
+    """
+    import ee
+
+    uscb = ee.Image.loadGeoTIFF("gs://" + bucket_name + "/" + uscb_mask_name(processing_year)).unmask().neq(0)
+    permits = ee.Image(MINE_PERMITS_NO_BUFFER_ASSET).unmask().eq(1)
+    return (
+        uscb.multiply(EXCLUSION_USCB_BIT)
+        .add(permits.multiply(EXCLUSION_PERMIT_BIT))
+        .toUint8()
+        .rename("exclusion")
+    )
+
+
+def ensure_exclusion_mask(object_index, processing_year, gpc_url, region, bucket_name=GCLOUD_BUCKET):
+    """
+    Returns the gs:// URL of the exclusion mask for processing_year on the grid of gpc_url. If it doesn't exist for the
+    current inputs, it is exported (region = export polygon coordinates) and this waits until the export has finished.
+    """
+    grid = composite_grid(gpc_url)
+    export_desc = f"{processing_year}_exclusionMask_{exclusion_inputs_hash(object_index, processing_year, grid)}"
+    name = GCLOUD_EE_EXCLUSION_DIR + export_desc + ".tif"
+    url = "gs://" + bucket_name + "/" + name
+
+    if object_index.exists(name):
+        print(f"  > {name} IS UP TO DATE. USING IT AS THE EXCLUSION MASK.")
+        return url
+
+    print(f"  > {name} DNE (new year or changed inputs). EXPORTING THE EXCLUSION MASK.")
+    from ee import batch
+
+    export = partial(
+        batch.Export.image.toCloudStorage,
+        image=build_exclusion_image(processing_year, bucket_name=bucket_name),
+        description=export_desc,
+        bucket=bucket_name,
+        fileNamePrefix=GCLOUD_EE_EXCLUSION_DIR + export_desc,
+        region=region,
+        crs=grid["crs"],
+        crsTransform=grid["transform"],
+        maxPixels=1e13,
+        fileFormat="GeoTIFF",
+        formatOptions={"cloudOptimized": True},
+    )
+    job = ExportJob(export_desc, export)
+    run_exports([job], poll_interval=30)
+    if job.state != "COMPLETED":
+        raise RuntimeError(f"Exclusion mask export {export_desc} {job.state}: {job.error}")
+
+    object_index.invalidate(GCLOUD_EE_EXCLUSION_DIR)
+    return url
+
+
+def threshold_exclusion(exclusion):
+    """
+    ee.Image > 1 where the NDVI is left out of the county thresholds (USCB mask or mine permit).
+    """
+    return exclusion.neq(0)
+
+
+def mining_exclusion(exclusion):
+    """
+    ee.Image > 1 where mine detections are removed (USCB mask outside of mine permits).
+    """
+    return exclusion.bitwiseAnd(EXCLUSION_USCB_BIT).neq(0).And(exclusion.bitwiseAnd(EXCLUSION_PERMIT_BIT).eq(0))
+
+
+def local_threshold_exclusion(exclusion):
+    """
+    NumPy equivalent of threshold_exclusion for a downloaded exclusion mask.
+    """
+    return exclusion != 0
+
+
+def local_mining_exclusion(exclusion):
+    """
+    NumPy equivalent of mining_exclusion for a downloaded exclusion mask (uint8, 1 = excluded).
+    """
+    return (((exclusion & EXCLUSION_USCB_BIT) != 0) & ((exclusion & EXCLUSION_PERMIT_BIT) == 0)).astype(np.uint8)
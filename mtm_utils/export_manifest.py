@@ -0,0 +1,103 @@
+import datetime
+import json
+import re
+
+from mtm_utils.composite_index import TILE_SUFFIX
+
+"""
+Manifest of completed split-tile exports, stored as JSON next to the exports in the bucket.
+
+Earth Engine writes a large GeoTIFF export as several tiles (<prefix><row offset>-<col offset>.tif) one after the
+other, so a cancelled or failed export can leave some of its tiles behind. Checking a single tile can't tell such a
+half-finished export from a complete one (except an export that isn't split, whose single file is only written once
+the export has finished). When an export completes, the manifest records the tiles it produced with
+their size and generation, keyed by the export description:
+
+    {"exports": {"composite_1984": {"prefix": ..., "tiles": {name: {"size", "generation"}}, "task_id": ...,
+                                    "destination_uris": [...], "recorded_at": ...}}}
+
+An export is then complete only if every recorded tile still exists with the recorded generation, i.e. none of them
+was deleted or overwritten by a later, unfinished export. Exports made before the manifest existed are accepted (and
+recorded) if they have the expected number of tiles or are a single un-split file.
+"""
+
+
+def export_tiles(object_index, prefix, export_desc):
+    """
+    Returns {name: {"size", "generation"}} of the objects written under prefix by the export named export_desc.
+    """
+    pattern = re.compile(re.escape(prefix + export_desc) + TILE_SUFFIX + r"\.tif$")
+    return {name: record for name, record in object_index.listing(prefix).items() if pattern.match(name)}
+
+
+class ExportManifest:
+    """
+    In-memory manifest. Use read_manifest/write_manifest to load it from and save it to the bucket.
+    """
+
+    def __init__(self, exports=None):
+        self.exports = exports or {}
+
+    def record(self, export_desc, prefix, tiles, task_id=None, destination_uris=None):
+        self.exports[export_desc] = {
+            "prefix": prefix,
+            "tiles": tiles,
+            "task_id": task_id,
+            "destination_uris": list(destination_uris or []),
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
+    def status(self, object_index, prefix, export_desc, expected_tiles=None):
+        """
+        Returns ("complete" | "partial" | "missing", {name: record} of the export's tiles in the bucket). An export
+        that isn't in the manifest is complete, and is then recorded, if it has expected_tiles tiles or is a single
+        un-split file; otherwise it can't be verified and is reported as partial.
+        """
+        tiles = export_tiles(object_index, prefix, export_desc)
+        if not tiles:
+            return "missing", tiles
+
+        entry = self.exports.get(export_desc)
+        if entry is not None:
+            unchanged = all(
+                name in tiles and tiles[name]["generation"] == record["generation"]
+                for name, record in entry["tiles"].items()
+            )
+            return ("complete" if unchanged else "partial"), tiles
+
+        unsplit = list(tiles) == [prefix + export_desc + ".tif"]
+        if unsplit or (expected_tiles is not None and len(tiles) == expected_tiles):
+            self.record(export_desc, prefix, tiles)
+            return "complete", tiles
+        return "partial", tiles
+
+    def to_json(self):
+        return json.dumps({"exports": self.exports}, indent=2, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(json.loads(text)["exports"])
+
+
+def read_manifest(storage_bucket, name):
+    """
+    Loads the manifest object name from a google.cloud.storage bucket, or returns an empty manifest if it doesn't exist.
+    """
+    blob = storage_bucket.blob(name)
+    if not blob.exists():
+        return ExportManifest()
+    return ExportManifest.from_json(blob.download_as_text())
+
+
+def write_manifest(storage_bucket, name, manifest):
+    storage_bucket.blob(name).upload_from_string(manifest.to_json(), content_type="application/json")
+
+
+def delete_tiles(storage_bucket, object_index, names):
+    """
+    Deletes the leftover tiles of an unfinished export, so a re-export with a different split can't be mixed with them.
+    """
+    for name in names:
+        print(f"    > Deleting partial export tile {name}")
+        storage_bucket.blob(name).delete()
+        object_index.remove(name)
@@ -0,0 +1,90 @@
+import numpy as np
+import shapely
+
+from mtm_utils.variables import MASK_DISSOLVE_CELL
+
+"""
+Grid-partitioned dissolve (union of all geometries of a layer) for the buffered USCB layers of the mask.
+
+A global union_all of hundreds of thousands of buffered road segments is single threaded and holds the whole layer
+while it runs. Here the extent is split into square cells of cell_size and an STRtree of the cells assigns every
+geometry to the cells it intersects:
+
+- interior geometries intersect a single cell. Each cell's interior geometries are unioned on their own (in a process
+  pool, if one is given). Two interior geometries of different cells can't touch, since a geometry that touches a
+  cell boundary intersects both cells, so the cell unions are disjoint.
+- seam geometries cross a cell boundary. They are unioned together, and then only with the polygons of the cell
+  unions that they intersect. The polygons they don't touch are kept as they are.
+
+The result is the same area as the global union. Each worker holds one cell at a time, and the work left after the
+pool is proportional to the seam geometries only.
+"""
+
+
+def grid_cells(bounds, cell_size=MASK_DISSOLVE_CELL):
+    """
+    Array of square cell polygons of cell_size covering bounds (xmin, ymin, xmax, ymax).
+    """
+    xmin, ymin, xmax, ymax = bounds
+    xs = np.arange(xmin, xmax, cell_size) if xmax > xmin else np.array([xmin])
+    ys = np.arange(ymin, ymax, cell_size) if ymax > ymin else np.array([ymin])
+    x0, y0 = (a.ravel() for a in np.meshgrid(xs, ys))
+    return shapely.box(x0, y0, x0 + cell_size, y0 + cell_size)
+
+
+def partition(geometries, cell_size=MASK_DISSOLVE_CELL):
+    """
+    Returns ([array of the interior geometries of each non-empty cell], array of seam geometries).
+    """
+    cells = grid_cells(shapely.total_bounds(geometries), cell_size)
+    geom_idx, cell_idx = shapely.STRtree(cells).query(geometries, predicate="intersects")
+    n_cells = np.bincount(geom_idx, minlength=len(geometries))
+
+    interior = n_cells[geom_idx] == 1
+    order = np.argsort(cell_idx[interior], kind="stable")
+    interior_geoms = geom_idx[interior][order]
+    interior_cells = cell_idx[interior][order]
+    splits = np.flatnonzero(np.diff(interior_cells)) + 1
+    groups = [geometries[group] for group in np.split(interior_geoms, splits) if len(group)]
+    return groups, geometries[n_cells > 1]
+
+
+def union_cell(geometries):
+    """
+    Pool worker > union of one cell's geometries.
+    """
+    return shapely.union_all(geometries)
+
+
+def merge_seams(cell_unions, seams):
+    """
+    Unions the seam geometries with the polygons of the cell unions they intersect, and returns all polygons of the
+    dissolved layer as one (Multi)Polygon.
+    """
+    parts = shapely.get_parts(np.asarray(cell_unions, dtype=object))
+    if len(seams) == 0:
+        return shapely.multipolygons(parts) if len(parts) else shapely.MultiPolygon()
+
+    seam_parts = shapely.get_parts(shapely.union_all(seams))
+    touched = np.zeros(len(parts), dtype=bool)
+    if len(parts):
+        _, part_idx = shapely.STRtree(parts).query(seam_parts, predicate="intersects")
+        touched[part_idx] = True
+    merged = shapely.get_parts(shapely.union_all(np.concatenate([parts[touched], seam_parts])))
+    return shapely.multipolygons(np.concatenate([parts[~touched], merged]))
+
+
+def grid_dissolve(geometries, cell_size=MASK_DISSOLVE_CELL, pool=None):
+    """
+    Union of the (polygon) geometries, computed per grid cell with pool.imap_unordered when a multiprocessing Pool is
+    given, or in this process otherwise.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    geometries = geometries[~shapely.is_empty(geometries) & ~shapely.is_missing(geometries)]
+    if len(geometries) == 0:
+        return shapely.MultiPolygon()
+
+    groups, seams = partition(geometries, cell_size)
+    mapper = pool.imap_unordered if pool is not None else map
+    cell_unions = list(mapper(union_cell, groups))
+    return merge_seams(cell_unions, seams)
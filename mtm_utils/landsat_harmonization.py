@@ -0,0 +1,127 @@
+import numpy as np
+
+"""
+Landsat sensor table and band harmonization, shared by the Earth Engine composites (greenestComp.py) and the local
+NumPy path (local_composite.py).
+
+Each row of LANDSAT_SENSORS describes one mission: its Earth Engine collection and raw bands, the raw band behind each
+harmonized band name, the saturation threshold passed to cleaner(), and the acquisition date range. Spectral indices
+are normalized differences of two harmonized bands, listed in SPECTRAL_INDICES. Adding a sensor or an index is one new
+row; ee_harmonize and local_indices work from the tables only.
+"""
+
+HARMONIZED_BANDS = ["B", "G", "R", "NIR"]
+
+# end=None means up to now; exclude_dates are [start, end) ranges left out of the collection
+LANDSAT_SENSORS = {
+    4: {
+        "collection": "LANDSAT/LT04/C02/T1",
+        "raw_bands": ["B1", "B2", "B3", "B4", "B5", "B6", "B7"],
+        "bands": {"B": "B1", "G": "B2", "R": "B3", "NIR": "B4", "SWIR1": "B5", "SWIR2": "B7"},
+        "saturation": 250,
+        "start": "1984-01-01",
+        "end": "1993-12-31",
+        "exclude_dates": [],
+    },
+    5: {
+        "collection": "LANDSAT/LT05/C02/T1",
+        "raw_bands": ["B1", "B2", "B3", "B4", "B5", "B6", "B7"],
+        "bands": {"B": "B1", "G": "B2", "R": "B3", "NIR": "B4", "SWIR1": "B5", "SWIR2": "B7"},
+        "saturation": 250,
+        "start": "1984-01-01",
+        "end": "2011-12-31",
+        "exclude_dates": [],
+    },
+    7: {
+        "collection": "LANDSAT/LE07/C02/T1",
+        "raw_bands": ["B1", "B2", "B3", "B4", "B5", "B6_VCID_1", "B6_VCID_2", "B7", "B8"],
+        "bands": {"B": "B1", "G": "B2", "R": "B3", "NIR": "B4", "SWIR1": "B5", "SWIR2": "B7"},
+        "saturation": 250,
+        "start": "1999-01-01",
+        "end": None,
+        "exclude_dates": [("2012-08-03", "2012-08-04")],
+    },
+    8: {
+        "collection": "LANDSAT/LC08/C02/T1",
+        "raw_bands": ["B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "B10", "B11"],
+        "bands": {"B": "B2", "G": "B3", "R": "B4", "NIR": "B5", "SWIR1": "B6", "SWIR2": "B7"},
+        "saturation": 64256,
+        "start": "2013-01-01",
+        "end": None,
+        "exclude_dates": [],
+    },
+    9: {
+        "collection": "LANDSAT/LC09/C02/T1",
+        "raw_bands": ["B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "B10", "B11"],
+        "bands": {"B": "B2", "G": "B3", "R": "B4", "NIR": "B5", "SWIR1": "B6", "SWIR2": "B7"},
+        "saturation": 64256,
+        "start": "2021-10-31",
+        "end": None,
+        "exclude_dates": [],
+    },
+}
+
+# index name: (a, b) harmonized bands of (a - b) / (a + b)
+SPECTRAL_INDICES = {
+    "NDVI": ("NIR", "R"),
+    "NBR": ("NIR", "SWIR2"),
+    "NDMI": ("NIR", "SWIR1"),
+}
+
+
+def ee_harmonize(sensor_id, bands=HARMONIZED_BANDS, indices=("NDVI",)):
+    """
+    Returns an ImageCollection.map function that adds the indices to a scene of the sensor and renames its raw bands
+    to the harmonized names, keeping bands + indices in that order.
+    """
+    band_map = LANDSAT_SENSORS[sensor_id]["bands"]
+
+    def harmonize(image):
+        for name in indices:
+            a, b = SPECTRAL_INDICES[name]
+            image = image.addBands(
+                image.expression(
+                    "(A - B) / (A + B)",
+                    {"A": image.select(band_map[a]), "B": image.select(band_map[b])},
+                ).rename(name)
+            )
+        return image.select([band_map[band] for band in bands] + list(indices)).rename(list(bands) + list(indices))
+
+    return harmonize
+
+
+def normalized_difference(a, b, out=None, scratch=None):
+    """
+    (a - b) / (a + b) as float32, written into out. The only temporary is the denominator, which is written into
+    scratch when given, so repeated calls on blocks of the same shape don't allocate. Zero denominators give NaN/inf
+    like Earth Engine's masked division; callers treat non-finite values as invalid.
+    """
+    shape = np.broadcast_shapes(np.shape(a), np.shape(b))
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(shape, dtype=np.float32)
+    np.add(a, b, out=scratch, dtype=np.float32)
+    np.subtract(a, b, out=out, dtype=np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(out, scratch, out=out)
+    return out
+
+
+def local_indices(stack, bands=HARMONIZED_BANDS, indices=("NDVI",), out=None, scratch=None):
+    """
+    Computes the indices for a whole stack at once. stack has the harmonized bands (named by bands) on axis -3, e.g.
+    (scene, band, y, x) or (band, y, x); the result has the indices on that axis instead. Band slices are views of
+    stack and each index is written straight into its slice of out. scratch (the shape of one index) holds the
+    denominator, so blocks of the same shape can reuse out and scratch without allocating.
+    """
+    stack = np.asarray(stack)
+    shape = stack.shape[:-3] + (len(indices),) + stack.shape[-2:]
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    if scratch is None:
+        scratch = np.empty(stack.shape[:-3] + stack.shape[-2:], dtype=np.float32)
+    for i, name in enumerate(indices):
+        a, b = (bands.index(band) for band in SPECTRAL_INDICES[name])
+        normalized_difference(stack[..., a, :, :], stack[..., b, :, :], out=out[..., i, :, :], scratch=scratch)
+    return out
@@ -0,0 +1,231 @@
+import math
+import time
+import numpy as np
+import rasterio
+import rasterio.shutil
+import shapely
+from rasterio.enums import Resampling
+from rasterio.features import rasterize
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window, bounds as window_bounds
+from skimage.morphology import dilation
+
+from mtm_utils.variables import (
+    MASK_BUFFER,
+    MASK_PIXEL_SIZE,
+    MASK_WINDOW_SIZE,
+    MASK_WARP_THREADS,
+    MASK_WARP_MEMORY,
+    MASK_COG_BLOCKSIZE,
+)
+
+"""
+Windowed rasterization of the USCB mask (mask_creation.py --mode direct / raster / dilate, and benchmark.py).
+
+The mask is binary, so overlapping features burn the same pixels and don't have to be dissolved first: burning
+every buffered feature with all_touched gives the same pixels as burning their union. The mask can therefore be built
+three ways, from most to least vector work:
+
+    - vector: buffer, dissolve (grid_dissolve.py) and rasterize the dissolved polygons
+    - raster: buffer and rasterize the undissolved buffered features, OR-accumulated into each window
+    - dilate: rasterize the unbuffered features (road and water centerlines, water and urban area polygons) and dilate
+      them by the buffer distance in raster space, with a disk of that radius over each window (read with a halo of the
+      radius). In EPSG:3857 the radius in pixels is the buffer in ground meters times the Mercator
+      scale factor (cosh(y / R)) at the window center.
+
+vector and raster give identical rasters. dilate approximates the buffer of each feature with the pixels whose center
+is within the radius (+ DILATION_OFFSET px, for all_touched) of a burned pixel center, so it differs from them along
+the edges of the buffers only: ~3% of the masked pixels for 60m buffers of roads at 15m (benchmark.py --suite mask).
+
+Whichever route made it, the mask is reprojected to EPSG:4326 with a multithreaded warp that writes whole tiles of
+MASK_COG_BLOCKSIZE, and written as a Cloud Optimized GeoTIFF with internal overviews (cog_options), so Earth Engine's
+loadGeoTIFF and local readers only fetch the tiles they need.
+"""
+
+EARTH_RADIUS = 6378137.0
+# Added to the dilation radius in pixels; the offset with the fewest pixels differing from the all_touched buffers
+DILATION_OFFSET = 0.25
+
+
+def mask_grid(geometries, pixel_size=MASK_PIXEL_SIZE, pad=0.0):
+    """
+    (transform, width, height) of a grid that covers the extent of the geometries, plus pad on each side, from its top
+    left corner like mask_rasterization_pt1.
+    """
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+    xmin, ymin, xmax, ymax = xmin - pad, ymin - pad, xmax + pad, ymax + pad
+    width = int(round((xmax - xmin) / pixel_size))
+    height = int(round((ymax - ymin) / pixel_size))
+    return from_origin(xmin, ymax, pixel_size, pixel_size), width, height
+
+
+def interim_profile(transform, width, height, crs="EPSG:3857"):
+    """
+    Profile of the bit-packed (NBITS=1) in-memory interim raster the windows are burned into.
+    """
+    return {
+        "driver": "GTiff",
+        "height": height,
+        "width": width,
+        "count": 1,
+        "dtype": "uint8",
+        "nbits": 1,
+        "crs": crs,
+        "transform": transform,
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+        "compress": "deflate",
+    }
+
+
+def grid_windows(height, width, window_size=MASK_WINDOW_SIZE):
+    for row in range(0, height, window_size):
+        for col in range(0, width, window_size):
+            yield Window(col, row, min(window_size, width - col), min(window_size, height - row))
+
+
+def mercator_scale(y):
+    """
+    Scale factor of EPSG:3857 at northing y: projected meters per ground meter.
+    """
+    return math.cosh(y / EARTH_RADIUS)
+
+
+def disk_dilation(burned, radius):
+    """
+    Dilates a uint8 0/1 array with a disk: sets every pixel whose center is within radius (px) of a set pixel's center,
+    the same pixels as thresholding a Euclidean distance transform at radius. The disk is applied as the OR of row-wise
+    dilations (one-row footprints, which are separable max filters), one per row offset dy of half-width
+    floor(sqrt(radius^2 - dy^2)), shifted by dy.
+    """
+    reach = int(math.floor(radius))
+    height = burned.shape[0]
+    out = np.zeros_like(burned)
+    row_max = {}
+    for dy in range(-reach, reach + 1):
+        half = int(math.floor(math.sqrt(radius**2 - dy**2)))
+        if half not in row_max:
+            row_max[half] = dilation(burned, np.ones((1, 2 * half + 1), dtype=bool))
+        if dy >= 0:
+            out[dy:] |= row_max[half][: height - dy]
+        else:
+            out[:dy] |= row_max[half][-dy:]
+    return out
+
+
+def burn(tree, geometries, bounds, out_shape, transform, pad):
+    """
+    Burns (1, all touched) the geometries that intersect bounds, clipped to bounds plus pad so the rasterizer doesn't
+    walk the edges of large polygons outside of the window. Returns None if none intersect.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    hits = tree.query(shapely.box(xmin, ymin, xmax, ymax))
+    if len(hits) == 0:
+        return None
+    clipped = shapely.clip_by_rect(geometries[hits], xmin - pad, ymin - pad, xmax + pad, ymax + pad)
+    shapes = [(geom, 1) for geom in clipped if not geom.is_empty]
+    if not shapes:
+        return None
+    return rasterize(shapes, out_shape=out_shape, transform=transform, fill=0, all_touched=True, dtype="uint8")
+
+
+def rasterize_windows(dst, geometries, window_size=MASK_WINDOW_SIZE):
+    """
+    Burns the geometries (1, all touched) into dst one window at a time. Only the geometries that intersect a window,
+    found with an STRtree and clipped to it, are rasterized into it; windows without any are left at 0.
+    """
+    tree = shapely.STRtree(geometries)
+    pad = abs(dst.transform.a)
+    for window in grid_windows(dst.height, dst.width, window_size):
+        shape = (window.height, window.width)
+        burned = burn(tree, geometries, window_bounds(window, dst.transform), shape, dst.window_transform(window), pad)
+        if burned is not None:
+            dst.write(burned, 1, window=window)
+
+
+def rasterize_dilated_windows(dst, geometries, buffer=MASK_BUFFER, window_size=MASK_WINDOW_SIZE):
+    """
+    Burns the unbuffered geometries into each window of dst read with a halo, and sets every pixel within the buffer
+    distance of a burned pixel (disk_dilation). The buffer is in ground meters; on an EPSG:3857 grid it
+    is scaled by the Mercator scale factor at each window's center.
+    """
+    tree = shapely.STRtree(geometries)
+    pixel_size = abs(dst.transform.a)
+    mercator = dst.crs is not None and dst.crs.to_epsg() == 3857
+    for window in grid_windows(dst.height, dst.width, window_size):
+        xmin, ymin, xmax, ymax = window_bounds(window, dst.transform)
+        scale = mercator_scale((ymin + ymax) / 2) if mercator else 1.0
+        radius = buffer * scale / pixel_size + DILATION_OFFSET
+        halo = int(math.ceil(radius))
+        read = Window(window.col_off - halo, window.row_off - halo, window.width + 2 * halo, window.height + 2 * halo)
+        burned = burn(
+            tree,
+            geometries,
+            window_bounds(read, dst.transform),
+            (read.height, read.width),
+            dst.window_transform(read),
+            pixel_size,
+        )
+        if burned is None:
+            continue
+        dilated = disk_dilation(burned, radius)
+        dst.write(dilated[halo : halo + window.height, halo : halo + window.width], 1, window=window)
+
+
+def cog_options(threads=MASK_WARP_THREADS):
+    """
+    Creation options of the final mask COG: DEFLATE tiles of MASK_COG_BLOCKSIZE, with nearest neighbour overviews
+    built in the same pass, compressed with threads threads.
+    """
+    return {
+        "BLOCKSIZE": MASK_COG_BLOCKSIZE,
+        "COMPRESS": "DEFLATE",
+        "PREDICTOR": 2,
+        "OVERVIEWS": "IGNORE_EXISTING",
+        "OVERVIEW_RESAMPLING": "NEAREST",
+        "NUM_THREADS": threads,
+        "BIGTIFF": "IF_SAFER",
+    }
+
+
+def warp_windows(src, out_path, window_size=MASK_WINDOW_SIZE, threads=MASK_WARP_THREADS):
+    """
+    Reprojects src to EPSG:4326 (nearest neighbour) through a multithreaded WarpedVRT, one window aligned on the COG
+    tiles at a time, into an in-memory tiled GeoTIFF, and copies that to out_path as a COG. Returns the seconds spent
+    in each step.
+    """
+    timings = {}
+    start = time.time()
+    warp_extras = {"NUM_THREADS": threads}
+    with WarpedVRT(
+        src, crs="EPSG:4326", resampling=Resampling.nearest, warp_mem_limit=MASK_WARP_MEMORY, warp_extras=warp_extras
+    ) as vrt, MemoryFile() as memfile:
+        profile = {
+            "driver": "GTiff",
+            "height": vrt.height,
+            "width": vrt.width,
+            "count": 1,
+            "dtype": "uint8",
+            "crs": vrt.crs,
+            "transform": vrt.transform,
+            "tiled": True,
+            "blockxsize": MASK_COG_BLOCKSIZE,
+            "blockysize": MASK_COG_BLOCKSIZE,
+            "compress": "deflate",
+            "num_threads": threads,
+        }
+        # Windows that are a multiple of the tile size write whole tiles
+        window_size = max(MASK_COG_BLOCKSIZE, window_size // MASK_COG_BLOCKSIZE * MASK_COG_BLOCKSIZE)
+        with memfile.open(**profile) as warped:
+            for window in grid_windows(vrt.height, vrt.width, window_size):
+                warped.write(vrt.read(1, window=window), 1, window=window)
+        timings["warp"] = time.time() - start
+
+        start = time.time()
+        with memfile.open() as warped:
+            rasterio.shutil.copy(warped, out_path, driver="COG", **cog_options(threads))
+        timings["cog"] = time.time() - start
+    return timings
@@ -0,0 +1,220 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from mtm_utils.variables import GCLOUD_BUCKET, OBJECT_INDEX_CACHE_TTL
+
+"""
+In-memory index of object names under a storage prefix.
+
+Each prefix is listed once (one paged list request on GCS) and existence/lookup queries are then answered locally, so a
+script that checks an output per year makes one metadata request per prefix instead of one blob.exists() per object.
+Listings can optionally be persisted to a JSON cache on disk and reused until they are older than the TTL. The cache is
+keyed by "<bucket>/<prefix>" (the root directory for local indexes), so indexes of different buckets can share it.
+Several processes (e.g. the stages run by pipeline.py in parallel) can share the cache file: it is re-read before each
+lookup and updated under an exclusive lock, one prefix at a time. An invalidation is kept as a tombstone for the TTL, so
+a listing that was started before another process invalidated its prefix isn't written back.
+
+Two backends are provided: GCSBackend for a Cloud Storage bucket and LocalBackend for a directory on the local file
+system, which mirrors the bucket layout (object names are paths relative to the root directory).
+"""
+
+
+class GCSBackend:
+    """
+    Lists objects in a Cloud Storage bucket. Yields (name, size, generation) for every object under a prefix.
+    """
+
+    def __init__(self, bucket_name=GCLOUD_BUCKET, client=None):
+        if client is None:
+            from google.cloud import storage
+
+            client = storage.Client()
+        self.client = client
+        self.bucket_name = bucket_name
+        self.location = bucket_name
+
+    def list(self, prefix):
+        for blob in self.client.list_blobs(self.bucket_name, prefix=prefix):
+            yield blob.name, blob.size, blob.generation
+
+
+class LocalBackend:
+    """
+    Lists files under a local root directory as if it were a bucket. The generation is the modification time in ns.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.location = os.path.abspath(root)
+
+    def list(self, prefix):
+        base = os.path.join(self.root, os.path.dirname(prefix))
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    stat = os.stat(path)
+                    yield name, stat.st_size, stat.st_mtime_ns
+
+
+class ObjectIndex:
+    """
+    Caches the listing of each prefix that is queried. exists/get/names list a prefix the first time it is needed (the
+    directory of the object name, unless a listed prefix already covers it) and answer from memory afterwards.
+    """
+
+    def __init__(self, backend, cache_path=None, ttl=OBJECT_INDEX_CACHE_TTL):
+        self.backend = backend
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.listings = {}  # prefix -> {name: {"size": size, "generation": generation}}
+        self.list_requests = 0
+
+    def _key(self, prefix):
+        return f"{self.backend.location}/{prefix}"
+
+    def _read_disk_cache(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    @contextmanager
+    def _disk_cache_lock(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _update_disk_cache(self, prefix, entry=None):
+        """
+        Sets the cached listing of prefix in the cache file to entry, or if entry is None replaces the listings that
+        overlap prefix with a tombstone. An entry isn't written if an overlapping prefix was invalidated after its
+        listing started. The other prefixes are left as they currently are on disk; the file is replaced atomically.
+        """
+        if not self.cache_path:
+            return
+        key = self._key(prefix)
+        with self._disk_cache_lock():
+            now = time.time()
+            cache = {
+                listed: cached for listed, cached in self._read_disk_cache().items()
+                if now - cached.get("listed_at", cached.get("invalidated_at", 0)) < self.ttl
+            }
+            overlapping = [listed for listed in cache if overlaps(listed, key)]
+            if entry is not None:
+                invalidated = [cache[listed].get("invalidated_at", 0) for listed in overlapping]
+                if max(invalidated, default=0) >= entry["listed_at"]:
+                    return
+                cache[key] = entry
+            else:
+                for listed in overlapping:
+                    del cache[listed]
+                cache[key] = {"invalidated_at": now}
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
+
+    def _covering_prefix(self, name):
+        for prefix in self.listings:
+            if name.startswith(prefix):
+                return prefix
+        return None
+
+    def listing(self, prefix):
+        """
+        Returns {name: {"size", "generation"}} for every object under prefix, listing it if it isn't cached yet.
+        """
+        if prefix in self.listings:
+            return self.listings[prefix]
+
+        cached = self._read_disk_cache().get(self._key(prefix), {})
+        if "objects" in cached and time.time() - cached["listed_at"] < self.ttl:
+            self.listings[prefix] = cached["objects"]
+            return self.listings[prefix]
+
+        listed_at = time.time()
+        objects = {
+            name: {"size": size, "generation": generation} for name, size, generation in self.backend.list(prefix)
+        }
+        self.list_requests += 1
+        self.listings[prefix] = objects
+        self._update_disk_cache(prefix, {"listed_at": listed_at, "objects": objects})
+        return objects
+
+    def get(self, name, prefix=None):
+        """
+        Returns the {"size", "generation"} record for name, or None if it doesn't exist.
+        """
+        if prefix is None:
+            prefix = self._covering_prefix(name) or name.rsplit("/", 1)[0] + "/"
+        return self.listing(prefix).get(name)
+
+    def exists(self, name, prefix=None):
+        return self.get(name, prefix=prefix) is not None
+
+    def names(self, prefix):
+        """
+        Sorted names of all objects under prefix, excluding the folder placeholder object itself.
+        """
+        return sorted(name for name in self.listing(prefix) if name != prefix)
+
+    def add(self, name, size=None, generation=None):
+        """
+        Records an object written by this process, so later lookups see it without re-listing.
+        """
+        prefix = self._covering_prefix(name)
+        if prefix is not None:
+            self.listings[prefix][name] = {"size": size, "generation": generation}
+            self.invalidate_disk(prefix)
+
+    def remove(self, name):
+        """
+        Records an object deleted by this process.
+        """
+        prefix = self._covering_prefix(name)
+        if prefix is not None:
+            self.listings[prefix].pop(name, None)
+            self.invalidate_disk(prefix)
+
+    def invalidate(self, prefix):
+        """
+        Drops the cached listings of prefix, of the prefixes under it and of those covering it (e.g. after exports have
+        written to it), so the next query re-lists it.
+        """
+        for listed in [listed for listed in self.listings if overlaps(listed, prefix)]:
+            del self.listings[listed]
+        self.invalidate_disk(prefix)
+
+    def invalidate_disk(self, prefix):
+        self._update_disk_cache(prefix)
+
+
+def overlaps(a, b):
+    """
+    Whether the listings of prefixes a and b can share objects, i.e. one is a prefix of the other.
+    """
+    return a.startswith(b) or b.startswith(a)
+
+
+def gcs_object_index(bucket_name=GCLOUD_BUCKET, client=None, cache_path=None, ttl=OBJECT_INDEX_CACHE_TTL):
+    """
+    ObjectIndex for a GCS bucket. Pass cache_path (e.g. OBJECT_INDEX_CACHE) to reuse listings across runs within the
+    TTL.
+    """
+    return ObjectIndex(GCSBackend(bucket_name, client=client), cache_path=cache_path, ttl=ttl)
+
+
+def local_object_index(root, cache_path=None, ttl=OBJECT_INDEX_CACHE_TTL):
+    return ObjectIndex(LocalBackend(root), cache_path=cache_path, ttl=ttl)
@@ -1,9 +1,12 @@
 import datetime
+import os
 from geoalchemy2 import Geometry
 from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, INTEGER, TEXT, FLOAT, DATE
 
 
-PROCESSING_YEAR = datetime.date.today().year
+# The processing year is the current year, unless it is set with the MTM_PROCESSING_YEAR environment variable (which
+# pipeline.py does for the stages it runs). Every path below that contains the year follows it.
+PROCESSING_YEAR = int(os.environ.get("MTM_PROCESSING_YEAR", datetime.date.today().year))
 # Uncomment line below to set the processing year, otherwise processing_year = current year
 # PROCESSING_YEAR = 2022
 """
@@ -19,6 +22,13 @@ USCB_YEAR = MASK_DATA + str(PROCESSING_YEAR) + "/"
 USCB_ZIP = USCB_YEAR + "zipped/"
 USCB_SHP = USCB_YEAR + "shapefile/"
 USCB_GJS = USCB_YEAR + "geojson/"
+# Content-addressed cache of the downloads, shared by all processing years (see mtm_utils/downloads.py), the number of
+# download threads, and the retries, backoff (s, doubled on each retry) and timeout (s) of each download
+DOWNLOAD_CACHE = MASK_DATA + "cache/"
+DOWNLOAD_THREADS = 8
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_BACKOFF = 5
+DOWNLOAD_TIMEOUT = 60
 
 # Study Area Dirs
 STUDY_AREA_DIR = DATA_DIR + "studyArea/"
@@ -31,6 +41,19 @@ MASK_DIR = DATA_DIR + "maskData/"
 MASK_INTERIM = MASK_DIR + "interimMask/"
 MASK_FINAL = MASK_DIR + "finalMask/"
 
+# Mask rasterization: buffer around the USCB features (m, in EPSG:5072), pixel size (m) of the EPSG:3857 interim raster,
+# and the block-aligned window size (px) the direct mode rasterizes and reprojects at a time
+MASK_BUFFER = 60
+MASK_PIXEL_SIZE = 15
+MASK_WINDOW_SIZE = 2048
+# Cell size (m, in EPSG:5072) of the grid the buffered layers are dissolved on, see mtm_utils/grid_dissolve.py
+MASK_DISSOLVE_CELL = 20000
+# Reprojection of the mask to its final EPSG:4326 Cloud Optimized GeoTIFF: warper and compression threads (GDAL
+# NUM_THREADS value), warp memory (MB), and the tile size (px) of the COG, which the warp writes whole tiles of
+MASK_WARP_THREADS = "ALL_CPUS"
+MASK_WARP_MEMORY = 1024
+MASK_COG_BLOCKSIZE = 512
+
 # FIPS Codes for Counties in the Study Area
 FIPS_CODES = [
     21013,
@@ -126,8 +149,36 @@ GCLOUD_CAMRA_ARM = GCLOUD_CAMRA_DIR + "ARM_Data/"
 # Name for the folder in the Cloud Bucket for the annual mask data
 GCLOUD_EE_DIR = "gee_data/"
 GCLOUD_EE_GPC_DIR = GCLOUD_EE_DIR + "GPC/"
+# Per-pixel provenance of the composites (uint16): day of year and sensor (Landsat 4/5/7/8/9) of the greenest scene,
+# and the number of valid observations; 0 where there is no valid observation
+GCLOUD_EE_GPC_AUX_DIR = GCLOUD_EE_DIR + "GPC_AUX/"
+GPC_AUX_BANDS = ["DOY", "SENSOR", "COUNT"]
+# JSON manifest of the composite exports: the split tiles each completed export produced (see greenestComp.py)
+GCLOUD_EE_GPC_MANIFEST = GCLOUD_EE_DIR + "MANIFESTS/gpc_manifest.json"
 GCLOUD_EE_THRESHOLD_DIR = GCLOUD_EE_DIR + "ANNUAL_THRESHOLD_IMAGES/"
 
+# Combined exclusion mask (USCB mask + mine permit override) on the composite grid, see mtm_utils/exclusion_mask.py.
+# Bit 0 (value 1) is set where the USCB mask applies, bit 1 (value 2) inside a mine permit.
+GCLOUD_EE_EXCLUSION_DIR = GCLOUD_EE_DIR + "EXCLUSION_MASK/"
+MINE_PERMITS_NO_BUFFER_ASSET = "users/andrewpericak/allMinePermits_noBuffer"
+EXCLUSION_USCB_BIT = 1
+EXCLUSION_PERMIT_BIT = 2
+
+# Bounding box of the study area used as the export region of the annual Earth Engine exports
+EXPORT_AREA_BOUNDING_BOX = [
+    [
+        [-85.80934903683277, 35.64442402256219],
+        [-79.61790603657893, 35.64442402256219],
+        [-79.61790603657893, 39.02981799180214],
+        [-85.80934903683277, 39.02981799180214],
+        [-85.80934903683277, 35.64442402256219],
+    ]
+]
+
+# Number of tiles Earth Engine splits each year's GeoTIFF export into
+GPC_SPLIT_TILES = 2
+THRESHOLD_SPLIT_TILES = 1
+
 GCLOUD_EE_ANNUAL_MINES_TIFF = GCLOUD_EE_DIR + "ANNUAL_MINE_GEOTIFF/"
 GCLOUD_EE_ANNUAL_MINES_GEOJSON = GCLOUD_EE_DIR + "ANNUAL_MINE_GEOJSON/"
 GCLOUD_EE_ANNUAL_MINES_CUMULATIVE_TIFF = GCLOUD_EE_DIR + "CUMULATIVE_MINE_GEOTIFF/"
@@ -137,6 +188,105 @@ GCLOUD_FINAL_DATA_GEOJSON = GCLOUD_FINAL_DATA_DIR + "GEOJSON/"
 GCLOUD_FINAL_DATA_GEOTIFF = GCLOUD_FINAL_DATA_DIR + "GEOTIFF/"
 GCLOUD_FINAL_DATA_GEOTIFF_CUMULATIVE = GCLOUD_FINAL_DATA_DIR + "GEOTIFF_CUMULATIVE/"
 
+# Earth Engine export orchestration (mtm_utils/ee_tasks.py): the number of exports run at once, seconds between status
+# checks, and how often / how long to wait before a failed export is retried (doubling after each failure)
+EE_MAX_CONCURRENT_EXPORTS = 4
+EE_TASK_POLL_INTERVAL = 60
+EE_TASK_MAX_RETRIES = 2
+EE_TASK_RETRY_BACKOFF = 120
+# Number of batch tasks the Earth Engine account can run at once; exports started by one script are limited to what is
+# left after the account's other active tasks
+EE_ACCOUNT_TASK_QUOTA = 4
+
+# On-disk cache of GCS prefix listings shared by the scripts (mtm_utils/clients.py get_object_index), reused for up to
+# OBJECT_INDEX_CACHE_TTL sec
+OBJECT_INDEX_CACHE = TEMP_DIR + "gcs_object_index.json"
+OBJECT_INDEX_CACHE_TTL = 15 * 60
+
+
+"""
+Local Annual Mining Processing Variables
+"""
+# First year with Landsat (TM) scenes, and the dummy year immediately before it used by the temporal cleaning
+FIRST_LANDSAT_YEAR = 1984
+INITIAL_CLEANING_YEAR = FIRST_LANDSAT_YEAR - 1
+
+# Value used for masked (null) pixels in local uint8 raw-mining stacks, where 1 = mine and 0 = non-mine
+LOCAL_NODATA = 255
+
+# Years looked back/forward by each pass of the temporal cleaning (null cleaning, noise cleaning 1, noise cleaning 2)
+CLEANING_PASS_RADII = (1, 1, 1)
+
+# Default for annualMiningArea.main(incremental=...): only regenerate the annual mining outputs invalidated by the new
+# processing year (see MTM_Annual_Extent/code/incremental.py). Off by default, which exports every missing output.
+INCREMENTAL_PROCESSING = False
+
+# Local directories for annual mining stacks
+LOCAL_ANNUAL_DIR = DATA_DIR + "annualMining/"
+LOCAL_RAW_STACK = LOCAL_ANNUAL_DIR + "rawMining_stack.npy"
+LOCAL_CLEANED_STACK = LOCAL_ANNUAL_DIR + "cleanedMining_stack.npy"
+LOCAL_RAW_MINING_DIR = LOCAL_ANNUAL_DIR + "rawMining/"
+LOCAL_ACTIVE_MINING_DIR = LOCAL_ANNUAL_DIR + "activeMining/"
+LOCAL_EXCLUSION_MASK = LOCAL_ANNUAL_DIR + str(PROCESSING_YEAR) + "_exclusionMask.tif"
+
+# Minimum number of 8-connected pixels for a detection to be kept (10px = 9000m2 at 30m), matching
+# connectedPixelCount().gte(10) in annualMiningArea.py
+MIN_MINE_PIXELS = 10
+
+# Tiled local processing; tiles overlap by a halo so the connected-component filter sees whole components
+LOCAL_TILE_SIZE = 1024
+LOCAL_TILE_HALO = MIN_MINE_PIXELS
+
+# Minimum area (m2) of a vectorized detection, matching the ee.Filter.gte("sum", 9000) in annualMiningArea.py
+MIN_MINE_AREA = 9000
+LOCAL_ACTIVE_MINING_VECTOR_DIR = LOCAL_ANNUAL_DIR + "activeMiningVectors/"
+LOCAL_CUMULATIVE_MINING_DIR = LOCAL_ANNUAL_DIR + "cumulativeMining/"
+
+# Accuracy assessment points (the TM and MSS accuracyAssessmentPoints assets, exported with their YEAR and CLASS
+# properties) and the cache of per-year error matrices computed from them
+LOCAL_ACCURACY_POINTS = LOCAL_ANNUAL_DIR + "accuracyAssessmentPoints.geojson"
+LOCAL_ACCURACY_CACHE = LOCAL_ANNUAL_DIR + "accuracy_matrices.json"
+
+# Greenest pixel composite tiles downloaded from GCLOUD_EE_GPC_DIR, the (year, band, y, x) cube built from them, and
+# the size of its compressed blocks (pixels, a multiple of 16) and of the windows it is written in
+GPC_BANDS = ["B", "G", "R", "NIR", "NDVI"]
+LOCAL_GPC_DIR = DATA_DIR + "GPC/"
+LOCAL_GPC_CUBE = DATA_DIR + "gpc_cube/"
+GPC_CUBE_BLOCK_SIZE = 256
+GPC_CUBE_WRITE_WINDOW = 2048
+
+# Local greenest pixel compositing (MTM_Annual_Extent/code/local_composite.py): co-registered, cloud-masked scene
+# GeoTIFFs with B, G, R, NIR bands (file names contain the acquisition date as YYYYMMDD), the months composited, and
+# the output directory for composite_<year>.tif
+LOCAL_SCENE_DIR = DATA_DIR + "scenes/"
+LOCAL_COMPOSITE_DIR = DATA_DIR + "GPC_local/"
+COMPOSITE_MONTHS = (5, 9)
+
+# Local annual thresholds: the allCounties features (exported with their FIPS property), the county label raster
+# rasterized from them on the GPC cube grid (written with a hash of its inputs in the name), and the 0-3 percentile
+# interval mean used for each county's NDVI threshold
+LOCAL_COUNTIES = STUDY_AREA_DIR + "allCounties.geojson"
+LOCAL_COUNTY_LABELS = LOCAL_ANNUAL_DIR + "county_labels.npy"
+LOCAL_THRESHOLD_DIR = LOCAL_ANNUAL_DIR + "thresholds/"
+THRESHOLD_PERCENTILES = (0, 3)
+
+# Streaming threshold mode (MTM_Annual_Extent/code/threshold_sketch.py): fixed NDVI histogram bins per county. The
+# interval mean from the sketch is within one bin width ((max - min) / bins, ~0.0005) of the exact value.
+THRESHOLD_SKETCH_BINS = 4096
+THRESHOLD_SKETCH_RANGE = (-1.0, 1.0)
+
+# Benchmarks of the local stages on synthetic rasters (MTM_Annual_Extent/code/benchmark.py): one JSON record per run is
+# appended to the history file
+BENCHMARK_DIR = DATA_DIR + "benchmarks/"
+BENCHMARK_HISTORY = BENCHMARK_DIR + "history.json"
+
+# Pipeline runner (MTM_Annual_Extent/code/pipeline.py): last input hash of each stage and a record of every run, and the
+# per-stage logs
+PIPELINE_DIR = DATA_DIR + "pipeline/"
+PIPELINE_MANIFEST = PIPELINE_DIR + "manifest.json"
+PIPELINE_LOG_DIR = PIPELINE_DIR + "logs/"
+PIPELINE_MAX_PARALLEL = 2
+
 
 """
 Highwall Detection Variables
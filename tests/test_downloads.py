@@ -0,0 +1,224 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mtm_utils.downloads import DownloadError, Downloader
+
+"""
+Downloader against a local HTTP server that stands in for census.gov: HEAD, Range and If-Range requests and ETags are
+served from FILES, and each test can change a file or make the server fail to exercise resumes, restarts and retries.
+"""
+
+FILES = {}  # path -> {"data": bytes, "etag": str}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []  # (method, path, Range header)
+    failures = []  # status codes returned to the next GET requests, in order
+    truncate = []  # number of bytes sent for the next full GET responses, in order
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, length, extra=()):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        if self.path in FILES:
+            self.send_header("ETag", FILES[self.path]["etag"])
+        for key, value in extra:
+            self.send_header(key, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        Handler.requests.append(("HEAD", self.path, None))
+        if self.path not in FILES:
+            self._headers(404, 0)
+            return
+        self._headers(200, len(FILES[self.path]["data"]))
+
+    def do_GET(self):
+        requested = self.headers.get("Range")
+        Handler.requests.append(("GET", self.path, requested))
+        if Handler.failures:
+            self._headers(Handler.failures.pop(0), 0)
+            return
+        if self.path not in FILES:
+            self._headers(404, 0)
+            return
+        data = FILES[self.path]["data"]
+        if requested and self.headers.get("If-Range") == FILES[self.path]["etag"]:
+            start = int(requested.split("=")[1].rstrip("-"))
+            if start >= len(data):
+                self._headers(416, 0, [("Content-Range", f"bytes */{len(data)}")])
+                return
+            self._headers(206, len(data) - start, [("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")])
+            self.wfile.write(data[start:])
+            return
+        body = data[: Handler.truncate.pop(0)] if Handler.truncate else data
+        self._headers(200, len(body))
+        self.wfile.write(body)
+
+
+class DownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FILES.clear()
+        Handler.requests, Handler.failures, Handler.truncate = [], [], []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+        self.out_dir = os.path.join(self.tmp.name, "out")
+        os.makedirs(self.out_dir)
+        self.waits = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def publish(self, path, data, etag):
+        FILES[path] = {"data": data, "etag": etag}
+        return self.base_url + path
+
+    def downloader(self, retries=2):
+        return Downloader(
+            cache_dir=self.cache_dir, threads=2, retries=retries, retry_backoff=1, sleep=self.waits.append
+        )
+
+    def gets(self):
+        return [(path, requested) for method, path, requested in Handler.requests if method == "GET"]
+
+    def write_partial(self, downloader, url, data, etag):
+        """
+        Leaves a partial download of url behind, as an interrupted run under etag would.
+        """
+        part = downloader.partial_path(url)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        with open(part, "wb") as f:
+            f.write(data)
+        with open(part + ".etag", "w") as f:
+            f.write(etag)
+        return part
+
+    def assertFetched(self, path, data):
+        with open(path, "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), hashlib.sha256(data).hexdigest())
+
+    def test_download_then_cache(self):
+        data = os.urandom(50000)
+        url = self.publish("/TIGER2024/ROADS/tl_2024_54005_roads.zip", data, '"a"')
+        self.assertFetched(self.downloader().fetch(url, self.out_dir), data)
+        self.assertFetched(self.downloader().fetch(url, self.out_dir), data)
+        self.assertEqual(len(self.gets()), 1)
+
+    def test_resume(self):
+        data = os.urandom(50000)
+        url = self.publish("/f.zip", data, '"a"')
+        downloader = self.downloader()
+        part = self.write_partial(downloader, url, data[:12345], '"a"')
+        self.assertFetched(downloader.fetch(url, self.out_dir), data)
+        self.assertEqual(self.gets(), [("/f.zip", "bytes=12345-")])
+        self.assertFalse(os.path.exists(part))
+
+    def test_changed_file_restarts(self):
+        old, new = os.urandom(50000), os.urandom(60000)
+        url = self.publish("/f.zip", new, '"new"')
+        downloader = self.downloader()
+        self.write_partial(downloader, url, old[:30000], '"old"')
+        self.assertFetched(downloader.fetch(url, self.out_dir), new)
+        self.assertEqual(self.gets(), [("/f.zip", None)])
+
+    def test_file_changed_after_head_restarts(self):
+        # If-Range carries the partial file's ETag, so the server sends all of the new file
+        old, new = os.urandom(50000), os.urandom(50000)
+        url = self.publish("/f.zip", new, '"new"')
+        downloader = self.downloader()
+        self.write_partial(downloader, url, old[:30000], '"old"')
+        remote = {"size": 50000, "etag": '"old"', "last_modified": None}
+        with self.assertRaises(DownloadError):
+            downloader._download(url, remote)  # The ETag of the response isn't the one HEAD announced
+        # The next attempt sees the new ETag and starts over
+        self.assertFetched(downloader.fetch(url, self.out_dir), new)
+        self.assertEqual(self.gets(), [("/f.zip", "bytes=30000-"), ("/f.zip", None)])
+
+    def test_complete_partial_is_stored_without_a_request(self):
+        data = os.urandom(50000)
+        url = self.publish("/f.zip", data, '"a"')
+        downloader = self.downloader()
+        self.write_partial(downloader, url, data, '"a"')
+        self.assertFetched(downloader.fetch(url, self.out_dir), data)
+        self.assertEqual(self.gets(), [])
+
+    def test_oversized_partial_restarts(self):
+        data = os.urandom(50000)
+        url = self.publish("/f.zip", data, '"a"')
+        downloader = self.downloader()
+        self.write_partial(downloader, url, data + b"extra", '"a"')
+        self.assertFetched(downloader.fetch(url, self.out_dir), data)
+        self.assertEqual(self.gets(), [("/f.zip", None)])
+
+    def test_unsatisfiable_range_restarts(self):
+        data = os.urandom(50000)
+        url = self.publish("/f.zip", data, '"a"')
+        downloader = self.downloader()
+        self.write_partial(downloader, url, data[:100], '"a"')
+        Handler.failures = [416]
+        self.assertFetched(downloader.fetch(url, self.out_dir), data)
+        self.assertEqual(self.gets(), [("/f.zip", "bytes=100-"), ("/f.zip", None)])
+        self.assertEqual(self.waits, [])
+
+    def test_short_download_is_retried_from_the_start(self):
+        data = os.urandom(50000)
+        url = self.publish("/f.zip", data, '"a"')
+        Handler.truncate = [1000]
+        self.assertFetched(self.downloader().fetch(url, self.out_dir), data)
+        self.assertEqual(self.gets(), [("/f.zip", None), ("/f.zip", None)])
+        self.assertEqual(self.waits, [1])
+
+    def test_server_errors_are_retried_with_backoff(self):
+        data = os.urandom(50000)
+        url = self.publish("/f.zip", data, '"a"')
+        Handler.failures = [503, 500]
+        self.assertFetched(self.downloader().fetch(url, self.out_dir), data)
+        self.assertEqual(self.waits, [1, 2])
+
+    def test_retries_run_out(self):
+        url = self.publish("/f.zip", os.urandom(1000), '"a"')
+        Handler.failures = [503, 503, 503]
+        with self.assertRaises(DownloadError):
+            self.downloader(retries=2).fetch(url, self.out_dir)
+        self.assertEqual(len(self.gets()), 3)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(DownloadError):
+            self.downloader().fetch(self.base_url + "/missing.zip", self.out_dir)
+        self.assertEqual(self.waits, [])
+
+    def test_same_etag_is_only_reused_for_the_same_file_name(self):
+        # Files published together can share an mtime-size ETag
+        roads, water = os.urandom(50000), os.urandom(50000)
+        roads_url = self.publish("/TIGER2024/ROADS/tl_2024_54005_roads.zip", roads, '"5000-62a"')
+        water_url = self.publish("/TIGER2024/AREAWATER/tl_2024_54005_areawater.zip", water, '"5000-62a"')
+        moved_url = self.publish("/TIGER2024/ROADS2/tl_2024_54005_roads.zip", roads, '"5000-62a"')
+        paths = self.downloader().fetch_all([roads_url], self.out_dir)
+        self.assertFetched(paths[roads_url], roads)
+        self.assertFetched(self.downloader().fetch(water_url, self.out_dir), water)
+        moved = self.downloader().fetch_all([moved_url], os.path.join(self.out_dir, "moved"))
+        self.assertFetched(moved[moved_url], roads)
+        self.assertEqual([path for path, _ in self.gets()], ["/TIGER2024/ROADS/tl_2024_54005_roads.zip",
+                                                             "/TIGER2024/AREAWATER/tl_2024_54005_areawater.zip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import contextlib
+import io
+import unittest
+
+from mtm_utils.ee_tasks import (
+    ExportJob,
+    active_export_descriptions,
+    exit_if_failed,
+    quota_aware_limit,
+    run_exports,
+)
+
+"""
+run_exports against a fake task backend and clock: each job scripts the outcome of its attempts, and sleep() advances
+the clock, so retries, backoff and the concurrency limit are checked without Earth Engine or real waiting.
+"""
+
+START_ERROR = "start error"
+
+
+class FakeBackend:
+    """
+    Starts tasks from a script of attempt outcomes per job description: START_ERROR makes start() raise, and a
+    (state, polls) pair keeps the task RUNNING for polls status calls before it ends in state.
+    """
+
+    def __init__(self, clock, outcomes, active=()):
+        self.clock = clock
+        self.outcomes = {description: list(attempts) for description, attempts in outcomes.items()}
+        self.active = list(active)
+        self.tasks = {}  # task id -> [description, final state, remaining polls]
+        self.starts = []  # (time, description)
+        self.max_running = 0
+
+    def start(self, job):
+        self.starts.append((self.clock.now, job.description))
+        outcome = self.outcomes[job.description].pop(0)
+        if outcome == START_ERROR:
+            raise RuntimeError("Too many tasks already in the queue")
+        task_id = f"{job.description}-{job.attempts}"
+        self.tasks[task_id] = [job.description, *outcome]
+        running = sum(1 for task in self.tasks.values() if task[2] >= 0)
+        self.max_running = max(self.max_running, running)
+        return task_id
+
+    def statuses(self, task_ids):
+        statuses = {}
+        for task_id in task_ids:
+            task = self.tasks[task_id]
+            task[2] -= 1
+            if task[2] >= 0:
+                statuses[task_id] = {"id": task_id, "state": "RUNNING"}
+            elif task[1] == "COMPLETED":
+                statuses[task_id] = {"id": task_id, "state": "COMPLETED", "destination_uris": [f"gs://{task[0]}"]}
+            else:
+                statuses[task_id] = {"id": task_id, "state": task[1], "error_message": "Computation timed out."}
+        return statuses
+
+    def active_tasks(self):
+        return self.active
+
+    def active_task_count(self):
+        return len(self.active)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RunExportsTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def run_jobs(self, outcomes, **kwargs):
+        backend = FakeBackend(self.clock, outcomes)
+        jobs = [ExportJob(description, create=None) for description in outcomes]
+        kwargs = dict(dict(poll_interval=10, max_retries=2, retry_backoff=60), **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_exports(jobs, backend=backend, sleep=self.clock.sleep, clock=self.clock, **kwargs)
+        return backend, jobs
+
+    def test_all_jobs_complete(self):
+        completed = []
+        outcomes = {f"{year}_activeMining": [("COMPLETED", year % 4)] for year in range(2015, 2025)}
+        backend, jobs = self.run_jobs(outcomes, max_concurrent=3, on_complete=completed.append)
+        self.assertEqual([job.state for job in jobs], ["COMPLETED"] * 10)
+        self.assertEqual([job.attempts for job in jobs], [1] * 10)
+        self.assertEqual(sorted(job.description for job in completed), sorted(outcomes))
+        self.assertEqual(jobs[0].destination_uris, ["gs://2015_activeMining"])
+        self.assertEqual(backend.max_running, 3)
+        self.assertTrue(all(seconds == 10 for seconds in self.clock.sleeps))
+
+    def test_failed_task_is_retried_after_backoff(self):
+        backend, jobs = self.run_jobs({"2024": [("FAILED", 2), ("FAILED", 0), ("COMPLETED", 1)]}, max_retries=2)
+        self.assertEqual(jobs[0].state, "COMPLETED")
+        self.assertEqual(jobs[0].attempts, 3)
+        starts = [time for time, _ in backend.starts]
+        # The first attempt fails at its third status call (t=20) and waits 60s, the second fails at once and waits 120s
+        self.assertEqual(starts[0], 0)
+        self.assertGreaterEqual(starts[1], 20 + 60)
+        self.assertGreaterEqual(starts[2], starts[1] + 120)
+        self.assertLess(starts[2], starts[1] + 120 + 10)
+
+    def test_start_errors_are_retried(self):
+        backend, jobs = self.run_jobs({"2024": [START_ERROR, ("COMPLETED", 0)]})
+        self.assertEqual(jobs[0].state, "COMPLETED")
+        self.assertEqual(jobs[0].attempts, 2)
+        self.assertGreaterEqual(backend.starts[1][0], 60)
+
+    def test_retries_run_out(self):
+        outcomes = {"2023": [("COMPLETED", 1)], "2024": [START_ERROR, ("CANCELLED", 1), ("FAILED", 0)]}
+        backend, jobs = self.run_jobs(outcomes, max_retries=2)
+        self.assertEqual([job.state for job in jobs], ["COMPLETED", "FAILED"])
+        self.assertEqual(jobs[1].attempts, 3)
+        self.assertEqual(jobs[1].error, "Computation timed out.")
+        self.assertEqual(backend.outcomes["2024"], [])
+        with self.assertRaises(SystemExit) as raised:
+            exit_if_failed(jobs)
+        self.assertIn("1 of 2 exports didn't complete: 2024", str(raised.exception))
+
+    def test_no_retries(self):
+        _, jobs = self.run_jobs({"2024": [("FAILED", 0), ("COMPLETED", 0)]}, max_retries=0)
+        self.assertEqual((jobs[0].state, jobs[0].attempts), ("FAILED", 1))
+
+    def test_failures_do_not_hold_up_other_jobs(self):
+        outcomes = {"a": [("FAILED", 0), ("COMPLETED", 0)], "b": [("COMPLETED", 3)], "c": [("COMPLETED", 0)]}
+        backend, jobs = self.run_jobs(outcomes, max_concurrent=2)
+        self.assertEqual([job.state for job in jobs], ["COMPLETED"] * 3)
+        # c takes the slot a freed while a waits out its backoff
+        self.assertEqual([description for _, description in backend.starts], ["a", "b", "c", "a"])
+        self.assertLessEqual(backend.max_running, 2)
+        exit_if_failed(jobs)
+
+    def test_no_jobs(self):
+        backend, jobs = self.run_jobs({})
+        self.assertEqual((jobs, backend.starts, self.clock.sleeps), ([], [], []))
+
+
+class AccountTasksTest(unittest.TestCase):
+    def backend(self, active):
+        return FakeBackend(FakeClock(), {}, active=active)
+
+    def test_quota_aware_limit(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(quota_aware_limit(self.backend([{}] * 2), max_concurrent=10, quota=20), 10)
+            self.assertEqual(quota_aware_limit(self.backend([{}] * 15), max_concurrent=10, quota=20), 5)
+            self.assertEqual(quota_aware_limit(self.backend([{}] * 25), max_concurrent=10, quota=20), 1)
+
+    def test_active_export_descriptions(self):
+        active = [{"description": "2024_activeMining", "state": "RUNNING"}, {"description": "CumulativeMineArea_2024"}]
+        self.assertEqual(
+            active_export_descriptions(self.backend(active)), {"2024_activeMining", "CumulativeMineArea_2024"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
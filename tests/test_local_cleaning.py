@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from MTM_Annual_Extent.code.local_cleaning import clean_stack, create_stack, open_stack
+from mtm_utils.variables import LOCAL_NODATA
+
+"""
+clean_stack against a year-by-year transcription of the Earth Engine cleaning chain in annualMiningArea.py. The
+transcription keeps Earth Engine's arithmetic: nulls are unmasked to 0, the dummy years are real images before the first
+and after the last year, and noise is found with the same remap() sums.
+"""
+
+
+def remap(image, values):
+    return np.where(image == 1, values[1], values[0])
+
+
+def ee_cleaning(raw, study_area):
+    """
+    Runs null_cleaning_fx1/2/3 and noise_cleaning_fx1/2 on a raw-mining stack, one year at a time.
+    """
+    years = raw.shape[0]
+    valid = raw != LOCAL_NODATA
+    values = np.where(valid, raw, 0).astype(np.int32)  # unmask() fills masked pixels with 0
+    zeros, ones = np.zeros(raw.shape[1:], np.int32), np.ones(raw.shape[1:], np.int32)
+
+    # null_cleaning_fx1 > 1 = null in rawMining. clip(studyArea) is applied to the result below
+    null_cleaned_1 = [(~valid[y]).astype(np.int32) for y in range(years)]
+
+    # null_cleaning_fx2 > rawMining2 holds the 0-valued dummy images before the first and after the last year
+    raw_mining_2 = [zeros] + [values[y] for y in range(years)] + [zeros]
+    null_cleaned_2 = [
+        (null_cleaned_1[y] + raw_mining_2[y] + raw_mining_2[y + 2] == 3).astype(np.int32) for y in range(years)
+    ]
+
+    # null_cleaning_fx3
+    null_cleaned_3 = [values[y] + null_cleaned_2[y] for y in range(years)]
+
+    # noise_cleaning_fx1 > dummy images of 1
+    raw_mining_3 = [ones] + null_cleaned_3 + [ones]
+    noise_cleaned_1 = []
+    for y in range(years):
+        summation = null_cleaned_3[y] + remap(raw_mining_3[y], (100, -10)) + remap(raw_mining_3[y + 2], (10, -10))
+        noise_cleaned_1.append(np.where(summation == 111, 0, null_cleaned_3[y]))
+
+    # noise_cleaning_fx2 > dummy images of 0
+    raw_mining_4 = [zeros] + noise_cleaned_1 + [zeros]
+    noise_cleaned_2 = []
+    for y in range(years):
+        summation = noise_cleaned_1[y] + remap(raw_mining_4[y], (-10, 900)) + remap(raw_mining_4[y + 2], (-10, 90))
+        noise_cleaned_2.append(np.where(summation == 990, 1, noise_cleaned_1[y]))
+
+    cleaned = np.stack(noise_cleaned_2).astype(np.uint8)
+    cleaned[:, ~study_area] = LOCAL_NODATA
+    return cleaned
+
+
+def random_stack(rng, years, rows, cols, null_fraction=0.2):
+    raw = (rng.random((years, rows, cols)) < 0.5).astype(np.uint8)
+    raw[rng.random(raw.shape) < null_fraction] = LOCAL_NODATA
+    return raw
+
+
+class CleanStackTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(2024)
+
+    def test_matches_earth_engine_chain(self):
+        for years in (1, 2, 3, 8, 40):
+            raw = random_stack(self.rng, years, 37, 29)
+            study_area = self.rng.random(raw.shape[1:]) < 0.9
+            np.testing.assert_array_equal(clean_stack(raw, study_area=study_area), ee_cleaning(raw, study_area))
+
+    def test_all_null_and_all_mine_stacks(self):
+        study_area = np.ones((5, 5), dtype=bool)
+        for value in (0, 1, LOCAL_NODATA):
+            raw = np.full((6, 5, 5), value, dtype=np.uint8)
+            np.testing.assert_array_equal(clean_stack(raw, study_area=study_area), ee_cleaning(raw, study_area))
+
+    def test_patterns(self):
+        # mine, null, mine > mine; non-mine, mine, non-mine > non-mine; mine, non-mine, mine > mine
+        # A null in the last year is never filled
+        raw = np.array([1, LOCAL_NODATA, 1, 0, 1, 0, 0, 1, 1, 0, 1, 1, LOCAL_NODATA], dtype=np.uint8).reshape(-1, 1, 1)
+        cleaned = clean_stack(raw)[:, 0, 0].tolist()
+        self.assertEqual(cleaned, [1, 1, 1, 0, 0, 0, 0, 1, 1, 1, 1, 1, 0])
+
+    def test_block_rows_do_not_change_the_result(self):
+        raw = random_stack(self.rng, 12, 50, 20)
+        study_area = self.rng.random(raw.shape[1:]) < 0.8
+        expected = ee_cleaning(raw, study_area)
+        for block_rows in (1, 7, 50, 256):
+            result = clean_stack(raw, study_area=study_area, block_rows=block_rows)
+            np.testing.assert_array_equal(result, expected)
+
+    def test_memory_mapped_stacks(self):
+        raw = random_stack(self.rng, 10, 40, 30)
+        with tempfile.TemporaryDirectory() as tmp:
+            np.save(os.path.join(tmp, "raw.npy"), raw)
+            out = create_stack(os.path.join(tmp, "cleaned", "cleaned.npy"), raw.shape)
+            clean_stack(open_stack(os.path.join(tmp, "raw.npy")), out=out, block_rows=16)
+            out.flush()
+            cleaned = open_stack(os.path.join(tmp, "cleaned", "cleaned.npy"))
+            np.testing.assert_array_equal(cleaned, ee_cleaning(raw, np.ones(raw.shape[1:], dtype=bool)))
+            del out, cleaned
+
+    def test_rejects_2d_arrays(self):
+        with self.assertRaises(ValueError):
+            clean_stack(np.zeros((4, 4), dtype=np.uint8))
+
+
+if __name__ == "__main__":
+    unittest.main()